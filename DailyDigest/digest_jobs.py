@@ -0,0 +1,256 @@
+import os
+import time
+import queue
+import socket
+import logging
+import threading
+from datetime import date
+from typing import Optional, Tuple
+from psycopg2.extras import Json
+from db_pool import get_connection, ensure_schema
+from digest_runner import run_digest, today, Shard, ALL_SUBSCRIBERS, DIGEST_TIME_BUDGET_SECONDS, DIGEST_MAX_RECIPIENTS
+from metrics_utils import count
+
+# Background execution of digest runs.
+# POST /send-digest only records a job in the digest_jobs table and returns its id.
+# Worker threads in this process claim queued jobs with FOR UPDATE SKIP LOCKED and call
+# run_digest one time slice at a time until the shard is done, saving progress and a
+# heartbeat after each slice. A job whose worker stops heartbeating (e.g. the instance
+# was replaced) is claimed again and resumes from the digest checkpoints. Only one job
+# per digest date and shard can be queued or running, so repeated triggers share it.
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "1"))
+JOB_POLL_SECONDS = float(os.getenv("JOB_POLL_SECONDS", "5"))
+JOB_STALE_SECONDS = float(os.getenv("JOB_STALE_SECONDS", "900"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+# Shortest slice a job may ask for, and how many slices in a row may pass without a
+# single recipient being processed before the job is handed back to the queue.
+JOB_MIN_SLICE_SECONDS = float(os.getenv("JOB_MIN_SLICE_SECONDS", "10"))
+# Longest slice a job may ask for. The heartbeat is only refreshed between slices, so a
+# slice must end well before JOB_STALE_SECONDS or another worker takes the job over.
+JOB_MAX_SLICE_SECONDS = min(float(os.getenv("JOB_MAX_SLICE_SECONDS", "300")), JOB_STALE_SECONDS / 2)
+JOB_MAX_IDLE_SLICES = int(os.getenv("JOB_MAX_IDLE_SLICES", "3"))
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+
+JOB_FIELDS = (
+    "id", "status", "options", "attempts", "sent", "failed", "elapsed_seconds", "result", "error",
+    "created_at", "started_at", "heartbeat_at", "finished_at"
+)
+
+def _job_options(digest_date, shard: Shard, max_recipients: int, time_budget: float) -> dict:
+    return {
+        "digest_date": str(digest_date),
+        "shard_index": shard.index,
+        "shard_count": shard.count,
+        "id_from": shard.id_from,
+        "id_to": shard.id_to,
+        "max_recipients": max_recipients,
+        "time_budget_seconds": time_budget,
+    }
+
+# Queue a digest run and return (job_id, created). When a job for the same date and
+# shard is already queued or running, its id is returned with created=False.
+def enqueue_digest_job(digest_date=None, shard: Shard = ALL_SUBSCRIBERS, max_recipients: int = DIGEST_MAX_RECIPIENTS,
+                       time_budget: float = DIGEST_TIME_BUDGET_SECONDS) -> Tuple[int, bool]:
+    digest_date = digest_date or today()
+    dedupe_key = f"{digest_date}|{shard.key}"
+    options = _job_options(digest_date, shard, max_recipients, time_budget)
+    insert = """
+        INSERT INTO digest_jobs (dedupe_key, options) VALUES (%s, %s)
+        ON CONFLICT (dedupe_key) WHERE status IN ('queued', 'running') DO NOTHING
+        RETURNING id;
+    """
+    existing = "SELECT id FROM digest_jobs WHERE dedupe_key = %s AND status IN ('queued', 'running');"
+    ensure_schema()
+    # The active job can finish between the two statements; go round again if it did
+    for _ in range(3):
+        with get_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(insert, (dedupe_key, Json(options)))
+                created = row = cur.fetchone()
+                if created is None:
+                    cur.execute(existing, (dedupe_key,))
+                    row = cur.fetchone()
+        # Only wake a worker once the insert has committed, or it would find nothing to claim
+        if created is not None:
+            _wake.put(created[0])
+            return created[0], True
+        if row is not None:
+            return row[0], False
+    raise RuntimeError(f"Could not queue a digest job for {dedupe_key}.")
+
+# Claimed job: (id, options, attempts, sent, failed, elapsed_seconds)
+def claim_job(worker: str) -> Optional[tuple]:
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            # Abandoned jobs that have used up their attempts stop blocking their date and shard
+            cur.execute(
+                """
+                UPDATE digest_jobs
+                SET status = 'failed', finished_at = NOW(), error = COALESCE(error, 'Worker stopped responding.')
+                WHERE status = 'running' AND heartbeat_at < NOW() - make_interval(secs => %s) AND attempts >= %s;
+                """,
+                (JOB_STALE_SECONDS, JOB_MAX_ATTEMPTS)
+            )
+            cur.execute(
+                """
+                UPDATE digest_jobs j
+                SET status = 'running', attempts = j.attempts + 1, worker = %s,
+                    started_at = COALESCE(j.started_at, NOW()), heartbeat_at = NOW()
+                WHERE j.id = (
+                    SELECT id FROM digest_jobs
+                    WHERE status = 'queued'
+                       OR (status = 'running' AND heartbeat_at < NOW() - make_interval(secs => %s))
+                    ORDER BY id
+                    LIMIT 1
+                    FOR UPDATE SKIP LOCKED
+                )
+                RETURNING j.id, j.options, j.attempts, j.sent, j.failed, j.elapsed_seconds;
+                """,
+                (worker, JOB_STALE_SECONDS)
+            )
+            return cur.fetchone()
+
+# Record progress for a job this worker holds. Returns False, saving nothing, when the
+# job has since been claimed by another worker (e.g. after a missed heartbeat).
+def _save_progress(job_id: int, worker: str, status: str, sent: int, failed: int, elapsed: float, result=None,
+                   error=None) -> bool:
+    query = """
+        UPDATE digest_jobs
+        SET status = %s, sent = %s, failed = %s, elapsed_seconds = %s, result = %s, error = %s,
+            heartbeat_at = NOW(), finished_at = CASE WHEN %s THEN NOW() END
+        WHERE id = %s AND worker = %s AND status = 'running';
+    """
+    finished = status in (SUCCEEDED, FAILED)
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(query, (status, sent, failed, elapsed, Json(result) if result is not None else None, error,
+                                finished, job_id, worker))
+            saved = cur.rowcount > 0
+    if not saved:
+        logging.warning(f"Digest job {job_id} is no longer held by {worker}; its progress was not saved.")
+    elif finished:
+        count("digest_jobs_total", status=status)
+    return saved
+
+# Run a job `worker` claimed to completion, one run_digest slice at a time. A job that
+# makes no progress for JOB_MAX_IDLE_SLICES slices is queued again (or failed on its last
+# attempt) so a stuck shard cannot hold a worker forever. The worker stops as soon as the
+# job turns out to have been taken over by another.
+def run_job(worker: str, job_id: int, options: dict, attempts: int = 1, sent: int = 0, failed: int = 0,
+            elapsed: float = 0.0):
+    digest_date = date.fromisoformat(options["digest_date"])
+    shard = Shard(options.get("shard_index"), options.get("shard_count"), options.get("id_from"), options.get("id_to"))
+    max_recipients = options.get("max_recipients") or 0
+    time_budget = min(max(options.get("time_budget_seconds") or DIGEST_TIME_BUDGET_SECONDS, JOB_MIN_SLICE_SECONDS),
+                      JOB_MAX_SLICE_SECONDS)
+    logging.info(f"Digest job {job_id} started for {digest_date} ({shard.key}), attempt {attempts}.")
+    result = None
+    idle_slices = 0
+    try:
+        while True:
+            started = time.monotonic()
+            result = run_digest(
+                digest_date, shard=shard, time_budget=time_budget,
+                max_recipients=max_recipients - sent - failed if max_recipients else 0
+            )
+            elapsed += time.monotonic() - started
+            report = result.get("report") or {}
+            sent += report.get("sent", 0)
+            failed += report.get("failed", 0)
+            if result["status"] == "error":
+                _save_progress(job_id, worker, FAILED, sent, failed, elapsed, result, report.get("error"))
+                logging.error(f"Digest job {job_id} failed: {report.get('error')}")
+                return
+            if result["status"] == "complete" or (max_recipients and sent + failed >= max_recipients):
+                _save_progress(job_id, worker, SUCCEEDED, sent, failed, elapsed, result)
+                logging.info(f"Digest job {job_id} finished: {sent} sent, {failed} failed in {elapsed:.1f}s.")
+                return
+            idle_slices = 0 if report.get("sent") or report.get("failed") else idle_slices + 1
+            if idle_slices >= JOB_MAX_IDLE_SLICES:
+                status = QUEUED if attempts < JOB_MAX_ATTEMPTS else FAILED
+                error = f"No recipients processed in {idle_slices} consecutive slices."
+                _save_progress(job_id, worker, status, sent, failed, elapsed, result, error)
+                logging.warning(f"Digest job {job_id} stalled on attempt {attempts}; marked {status}.")
+                return
+            if not _save_progress(job_id, worker, RUNNING, sent, failed, elapsed, result):
+                return
+    except Exception as e:
+        # Unexpected errors (e.g. the database going away) put the job back for another attempt
+        status = QUEUED if attempts < JOB_MAX_ATTEMPTS else FAILED
+        logging.error(f"Digest job {job_id} raised on attempt {attempts}: {e}", exc_info=True)
+        try:
+            _save_progress(job_id, worker, status, sent, failed, elapsed, result, str(e))
+        except Exception as save_error:
+            logging.error(f"Could not record the failure of digest job {job_id}: {save_error}")
+
+def _iso(value):
+    return value.isoformat() if value is not None else None
+
+def _job_dict(row) -> dict:
+    job = dict(zip(JOB_FIELDS, row))
+    for field in ("created_at", "started_at", "heartbeat_at", "finished_at"):
+        job[field] = _iso(job[field])
+    elapsed = job["elapsed_seconds"] or 0.0
+    job["throughput_per_second"] = round(job["sent"] / elapsed, 2) if elapsed else None
+    return job
+
+# A job's status and progress, or None when there is no such job. While a job is active,
+# `remaining` counts the shard's subscribers still waiting for that day's digest.
+def get_job(job_id: int) -> Optional[dict]:
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(f"SELECT {', '.join(JOB_FIELDS)} FROM digest_jobs WHERE id = %s;", (job_id,))
+            row = cur.fetchone()
+    if row is None:
+        return None
+    job = _job_dict(row)
+    if job["status"] in (QUEUED, RUNNING):
+        options = job["options"]
+        shard = Shard(options.get("shard_index"), options.get("shard_count"), options.get("id_from"), options.get("id_to"))
+        job["remaining"] = sum(pending for _, pending in shard.groups(date.fromisoformat(options["digest_date"])))
+    return job
+
+# Most recent jobs first, optionally only those with `status`
+def list_jobs(limit: int = 20, status: str = None) -> list:
+    condition = "WHERE status = %s" if status else ""
+    params = (status, limit) if status else (limit,)
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(f"SELECT {', '.join(JOB_FIELDS)} FROM digest_jobs {condition} ORDER BY id DESC LIMIT %s;", params)
+            return [_job_dict(row) for row in cur.fetchall()]
+
+# Local wake-up queue: enqueue_digest_job pushes new job ids so an idle worker claims
+# them at once instead of at its next poll. The table stays the source of truth.
+_wake = queue.Queue()
+_workers = []
+_workers_lock = threading.Lock()
+
+def _run_worker(name: str):
+    while True:
+        try:
+            _wake.get(timeout=JOB_POLL_SECONDS)
+        except queue.Empty:
+            pass
+        try:
+            ensure_schema()
+            while True:
+                job = claim_job(name)
+                if job is None:
+                    break
+                run_job(name, *job)
+        except Exception as e:
+            logging.error(f"Digest job worker {name} failed: {e}")
+
+# Start JOB_WORKERS daemon threads once per process; safe to call more than once
+def start_job_workers(workers: int = JOB_WORKERS):
+    with _workers_lock:
+        _workers[:] = [worker for worker in _workers if worker.is_alive()]
+        for i in range(len(_workers), workers):
+            name = f"{socket.gethostname()}:{os.getpid()}:{i}"
+            worker = threading.Thread(target=_run_worker, args=(name,), name=f"digest-job-{i}", daemon=True)
+            worker.start()
+            _workers.append(worker)
@@ -0,0 +1,262 @@
+import os
+import time
+import hashlib
+import logging
+from datetime import datetime, timezone
+
+# The Dockerfile renames the headless files, so imports remain clean
+from db_pool import ensure_schema, pool_metrics
+from db_utils import (
+    iter_subscribers, record_deliveries, get_checkpoint, save_checkpoint,
+    list_checkpoints, subscriber_id_ranges, preference_groups
+)
+from email_utils import send_digest_to_all, DIGEST_TITLE
+from news_utils import fetch_top_headlines, fetch_keyword_news
+from artifact_utils import get_headlines_artifact, get_keywords_artifact, keywords_label, DIGEST_ARTICLES
+from metrics_utils import timed
+
+# Bound a single invocation so it finishes well inside the Cloud Run request timeout;
+# the next invocation resumes from the checkpoint.
+DIGEST_TIME_BUDGET_SECONDS = float(os.getenv("DIGEST_TIME_BUDGET_SECONDS", "240"))
+DIGEST_MAX_RECIPIENTS = int(os.getenv("DIGEST_MAX_RECIPIENTS", "0"))
+
+# Wraps the subscriber stream and stops handing out rows once the budget is spent,
+# remembering the last id given out so it can become the next checkpoint.
+class BoundedRecipients:
+    def __init__(self, source, max_recipients: int, deadline: float):
+        self.source = source
+        self.max_recipients = max_recipients
+        self.deadline = deadline
+        self.last_id = None
+        self.count = 0
+        self.exhausted = False
+
+    def __iter__(self):
+        for row in self.source:
+            if (self.max_recipients and self.count >= self.max_recipients) or time.monotonic() >= self.deadline:
+                return
+            self.last_id = row[0]
+            self.count += 1
+            yield row
+        self.exhausted = True
+
+# Which slice of the subscriber id space an invocation owns. A modulo shard
+# (index, count) is stable as subscribers join; an explicit id range comes from
+# the coordinator's plan. Shards never overlap, so instances can send in parallel.
+class Shard:
+    def __init__(self, index: int = None, count: int = None, id_from: int = None, id_to: int = None):
+        if count is not None and not 0 <= index < count:
+            raise ValueError("shard_index must be between 0 and shard_count - 1.")
+        self.index = index
+        self.count = count
+        self.id_from = id_from
+        self.id_to = id_to
+
+    @property
+    def key(self) -> str:
+        if self.count is not None:
+            return f"mod:{self.index}/{self.count}"
+        if self.id_from is not None or self.id_to is not None:
+            return f"range:{self.id_from or 1}-{self.id_to if self.id_to is not None else 'end'}"
+        return "all"
+
+    def _bounds(self, after_id: int):
+        start = max(after_id, (self.id_from or 1) - 1)
+        shard = (self.index, self.count) if self.count is not None else None
+        return start, shard
+
+    def subscribers(self, after_id: int, digest_date, keywords=None):
+        start, shard = self._bounds(after_id)
+        return iter_subscribers(after_id=start, digest_date=digest_date, until_id=self.id_to, shard=shard,
+                                keywords=keywords)
+
+    # Keyword preference groups with subscribers still waiting in this shard
+    def groups(self, digest_date):
+        start, shard = self._bounds(0)
+        return preference_groups(digest_date, after_id=start, until_id=self.id_to, shard=shard)
+
+ALL_SUBSCRIBERS = Shard()
+
+def today():
+    return datetime.now(timezone.utc).date()
+
+# Coordinator view: N contiguous id ranges, each to be posted to /send-digest as id_from/id_to
+def plan_shards(count: int) -> list:
+    ensure_schema()
+    return subscriber_id_ranges(count)
+
+# Rebuild the shared Top Headlines artifact; scheduled once per refresh interval
+def refresh_headlines_artifact() -> dict:
+    artifact = get_headlines_artifact(fetch_top_headlines, DIGEST_ARTICLES, refresh=True)
+    if artifact is None:
+        return {"status": "complete", "message": "No articles found."}
+    return {"status": "success", "articles": len(artifact.df), "built_at": artifact.built_at}
+
+# One entry per shard from its checkpoint rows. Sends are recorded on the shard's
+# per-group rows ("<shard>|headlines", "<shard>|kw:..."); the plain shard row only marks
+# the whole shard completed.
+def shard_totals(checkpoints: list) -> list:
+    shards = {}
+    for row in checkpoints:
+        shard_key = row["shard_key"].split("|", 1)[0]
+        shard = shards.setdefault(shard_key, {
+            "shard_key": shard_key, "groups": 0, "sent_count": 0, "failed_count": 0,
+            "elapsed_seconds": 0.0, "completed": False, "updated_at": None,
+        })
+        if row["shard_key"] == shard_key:
+            shard["completed"] = bool(row["completed"])
+        else:
+            shard["groups"] += 1
+        shard["sent_count"] += row["sent_count"]
+        shard["failed_count"] += row["failed_count"]
+        shard["elapsed_seconds"] += row["elapsed_seconds"] or 0.0
+        if row["updated_at"] and (shard["updated_at"] is None or row["updated_at"] > shard["updated_at"]):
+            shard["updated_at"] = row["updated_at"]
+    for shard in shards.values():
+        elapsed = shard["elapsed_seconds"]
+        shard["throughput_per_second"] = round(shard["sent_count"] / elapsed, 2) if elapsed else None
+        shard["updated_at"] = shard["updated_at"].isoformat() if shard["updated_at"] else None
+    return sorted(shards.values(), key=lambda shard: shard["shard_key"])
+
+def shard_status(digest_date=None) -> dict:
+    ensure_schema()
+    digest_date = digest_date or today()
+    shards = shard_totals(list_checkpoints(digest_date))
+    return {
+        "digest_date": str(digest_date),
+        "shards": shards,
+        "sent": sum(s["sent_count"] for s in shards),
+        "failed": sum(s["failed_count"] for s in shards),
+        "completed": bool(shards) and all(s["completed"] for s in shards),
+    }
+
+# Checkpoint key for one preference group within a shard; keyword sets are hashed
+# so the key fits the checkpoint table
+def group_key(shard_key: str, keywords: tuple) -> str:
+    if not keywords:
+        return f"{shard_key}|headlines"
+    return f"{shard_key}|kw:{hashlib.blake2b(chr(0).join(keywords).encode('utf-8'), digest_size=6).hexdigest()}"
+
+# One analysed digest per preference group: Top Headlines for subscribers without
+# keywords, otherwise recent articles matching any of the group's keywords
+def group_artifact(keywords: tuple):
+    if not keywords:
+        return get_headlines_artifact(fetch_top_headlines, DIGEST_ARTICLES)
+    return get_keywords_artifact(keywords, fetch_keyword_news, DIGEST_ARTICLES)
+
+def group_title(keywords: tuple) -> str:
+    return f"Top 10 Stories on {keywords_label(keywords)}" if keywords else DIGEST_TITLE
+
+# Run (or resume) the digest for `digest_date`. Subscribers are grouped by identical
+# keyword preferences; each group's digest is fetched, analysed and rendered once and
+# then fanned out to the group, with its own checkpoint. Each call sends to at most
+# one budget's worth of subscribers; call again while the result says "in_progress".
+@timed("digest_run")
+def run_digest(digest_date=None, shard: Shard = ALL_SUBSCRIBERS, time_budget: float = DIGEST_TIME_BUDGET_SECONDS,
+               max_recipients: int = DIGEST_MAX_RECIPIENTS) -> dict:
+    started = time.monotonic()
+    deadline = started + time_budget
+    digest_date = digest_date or today()
+    shard_key = shard.key
+    ensure_schema()
+
+    checkpoint = get_checkpoint(digest_date, shard_key)
+    if checkpoint["completed"]:
+        logging.info(f"Digest for {digest_date} ({shard_key}) already completed. Nothing to do.")
+        return {"status": "complete", "digest_date": str(digest_date), "shard": shard_key, "checkpoint": checkpoint}
+
+    groups = shard.groups(digest_date)
+    logging.info(f"Digest for {digest_date} ({shard_key}): {len(groups)} preference group(s) pending.")
+    status, error = "complete", None
+    sent = failed = handed_out = 0
+    delivery_seconds = 0.0
+    results = []
+    for keywords, pending in groups:
+        key = group_key(shard_key, keywords)
+        group_checkpoint = get_checkpoint(digest_date, key)
+        if group_checkpoint["completed"]:
+            continue
+        if time.monotonic() >= deadline or (max_recipients and handed_out >= max_recipients):
+            status = "in_progress"
+            break
+
+        artifact = group_artifact(keywords)
+        if artifact is None or artifact.df.empty:
+            # Nothing to send this group today; mark it done so reruns move on
+            logging.warning(f"No articles found for group {key}; skipping {pending} subscribers.")
+            save_checkpoint(digest_date, key, group_checkpoint["last_subscriber_id"], 0, 0, True)
+            results.append({"group": key, "keywords": list(keywords), "status": "no_articles"})
+            continue
+        logging.info(
+            f"Group {key}: {pending} subscribers, analysis of {len(artifact.df)} articles built at "
+            f"{datetime.fromtimestamp(artifact.built_at, timezone.utc):%H:%M:%S} UTC."
+        )
+
+        def send(after_id: int):
+            recipients = BoundedRecipients(
+                shard.subscribers(after_id, digest_date, keywords),
+                max_recipients - handed_out if max_recipients else 0,
+                deadline
+            )
+            report = send_digest_to_all(
+                recipients,
+                artifact,
+                on_batch_complete=lambda batch: record_deliveries(digest_date, batch),
+                title=group_title(keywords)
+            )
+            return recipients, report
+
+        recipients, report = send(group_checkpoint["last_subscriber_id"])
+        completed = recipients.exhausted and report.error is None
+        # Everything handed out has been delivered or recorded as failed by the time
+        # send_digest_to_all returns, so the last id given out is a safe resume point.
+        if recipients.last_id is not None:
+            save_checkpoint(digest_date, key, recipients.last_id, report.sent, len(report.failed), False,
+                            report.elapsed_seconds)
+        handed_out += recipients.count
+        sent += report.sent
+        failed += len(report.failed)
+        delivery_seconds += report.elapsed_seconds
+        group_result = {"group": key, "keywords": list(keywords), "report": report.as_dict(), "retries": []}
+        results.append(group_result)
+
+        # Every subscriber in the group has been tried once. Before the group is marked
+        # done, send again to the day's failures that have attempts left (iter_subscribers
+        # only yields those from the start of the shard), until a pass finds nobody.
+        # A failure that now succeeds moves from the checkpoint's failed count to sent.
+        while completed:
+            if max_recipients and handed_out >= max_recipients:
+                completed = False
+                break
+            recipients, report = send(0)
+            completed = recipients.exhausted and report.error is None
+            if recipients.count == 0:
+                break
+            save_checkpoint(digest_date, key, 0, report.sent, -report.sent, False, report.elapsed_seconds)
+            handed_out += recipients.count
+            sent += report.sent
+            failed += len(report.failed)
+            delivery_seconds += report.elapsed_seconds
+            group_result["retries"].append(report.as_dict())
+
+        if completed:
+            save_checkpoint(digest_date, key, 0, 0, 0, True)
+        if report.error:
+            status, error = "error", report.error
+            break
+        if not completed:
+            status = "in_progress"
+            break
+
+    if status == "complete":
+        save_checkpoint(digest_date, shard_key, checkpoint["last_subscriber_id"], 0, 0, True)
+    logging.info(f"Database pool metrics: {pool_metrics()}")
+    return {
+        "status": status,
+        "digest_date": str(digest_date),
+        "shard": shard_key,
+        "groups": results,
+        "report": {"sent": sent, "failed": failed, "error": error},
+        "throughput_per_second": round(sent / delivery_seconds, 2) if delivery_seconds else None,
+        "elapsed_seconds": round(time.monotonic() - started, 3),
+    }
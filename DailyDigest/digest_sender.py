@@ -1,47 +1,196 @@
+import io
 import os
 import logging
-from flask import Flask, jsonify
+from datetime import date
+from flask import Flask, Response, jsonify, request, stream_with_context
 
-# The Dockerfile renames the headless files, so imports remain clean
-from db_utils import fetch_subscribers
-from email_utils import send_digest_to_all
-from news_utils import fetch_top_headlines
+from digest_runner import (
+    plan_shards, shard_status, refresh_headlines_artifact, Shard,
+    DIGEST_TIME_BUDGET_SECONDS, DIGEST_MAX_RECIPIENTS
+)
+from digest_jobs import (
+    enqueue_digest_job, get_job, list_jobs, start_job_workers, JOB_WORKERS, JOB_MIN_SLICE_SECONDS, JOB_MAX_SLICE_SECONDS
+)
+from db_pool import ensure_schema, pool_metrics
+from subscriber_io import import_subscriber_csv, iter_subscriber_csv
+from outbox_utils import drain_outbox
+from metrics_utils import render_prometheus
 
 app = Flask(__name__)
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s', force=True)
 
+# Digest runs execute on these background threads, outside any request
+if JOB_WORKERS > 0:
+    start_job_workers()
+
+def _optional_int(options, key):
+    return int(options[key]) if options.get(key) is not None else None
+
+def _parse_shard(options) -> Shard:
+    return Shard(
+        index=_optional_int(options, "shard_index"),
+        count=_optional_int(options, "shard_count"),
+        id_from=_optional_int(options, "id_from"),
+        id_to=_optional_int(options, "id_to")
+    )
+
+def _parse_date(value):
+    return date.fromisoformat(value) if value else None
+
+# Queue a digest run and answer at once with its job id; poll /jobs/<id> for progress.
+# Optional JSON body:
+#   {"digest_date": "YYYY-MM-DD", "time_budget_seconds": 240, "max_recipients": 0,
+#    "shard_index": 0, "shard_count": 4}            # modulo shard, or
+#    "id_from": 1, "id_to": 25000}                  # a range from /send-digest/plan
+# The job runs in slices of `time_budget_seconds` until every subscriber in the shard
+# has been processed. Triggering a date and shard whose job is still queued or running
+# returns that job instead of starting a second one.
 @app.route('/send-digest', methods=['POST'])
 def handle_digest_request():
-    logging.info("Authorized digest request received. Starting process...")
-    try:
-        logging.info("Fetching top headlines...")
-        articles = fetch_top_headlines(50)
-        if not articles:
-            logging.warning("No articles found to generate digest.")
-            return jsonify({"status": "complete", "message": "No articles found."}), 200
-        logging.info(f"Successfully fetched {len(articles)} articles.")
-
-        logging.info("Fetching subscribers from database...")
-        subscribers = fetch_subscribers()
-        if not subscribers:
-            logging.warning("No subscribers to send digest to.")
-            return jsonify({"status": "complete", "message": "No subscribers."}), 200
-        logging.info(f"Successfully fetched {len(subscribers)} subscribers.")
-
-        logging.info("Preparing and sending digest email to all subscribers...")
-        success = send_digest_to_all(subscribers, articles)
-        
-        if success:
-            logging.info("Digest sending process completed successfully.")
-            return jsonify({"status": "success", "message": f"Digest sent to {len(subscribers)} subscribers."}), 200
-        else:
-            logging.error("Digest sending process failed.")
-            return jsonify({"status": "error", "message": "Failed to send digest."}), 500
+    logging.info("Authorized digest request received. Queueing job...")
+    options = request.get_json(silent=True) or {}
+    try:
+        digest_date = _parse_date(options.get("digest_date"))
+        time_budget = float(options.get("time_budget_seconds", DIGEST_TIME_BUDGET_SECONDS))
+        max_recipients = int(options.get("max_recipients", DIGEST_MAX_RECIPIENTS))
+        shard = _parse_shard(options)
+        if not JOB_MIN_SLICE_SECONDS <= time_budget <= JOB_MAX_SLICE_SECONDS:
+            raise ValueError(
+                f"time_budget_seconds must be between {JOB_MIN_SLICE_SECONDS:g} and {JOB_MAX_SLICE_SECONDS:g}."
+            )
+        if max_recipients < 0:
+            raise ValueError("max_recipients must not be negative.")
+    except (TypeError, ValueError) as e:
+        return jsonify({"status": "error", "message": f"Invalid request options: {e}"}), 400
 
+    try:
+        job_id, created = enqueue_digest_job(digest_date, shard, max_recipients, time_budget)
+        logging.info(f"Digest job {job_id} for shard {shard.key} {'queued' if created else 'already active'}.")
+        return jsonify({
+            "status": "queued" if created else "already_queued",
+            "job_id": job_id,
+            "job_url": f"/jobs/{job_id}",
+        }), 202
     except Exception as e:
         logging.error(f"Critical error in digest request handler: {e}", exc_info=True)
         return jsonify({"status": "error", "message": "An internal server error occurred."}), 500
 
+# Status, progress (sent, failed, remaining) and throughput of one digest job
+@app.route('/jobs/<int:job_id>', methods=['GET'])
+def handle_job_request(job_id):
+    try:
+        job = get_job(job_id)
+    except Exception as e:
+        logging.error(f"Error reading digest job {job_id}: {e}", exc_info=True)
+        return jsonify({"status": "error", "message": "An internal server error occurred."}), 500
+    if job is None:
+        return jsonify({"status": "error", "message": f"No job with id {job_id}."}), 404
+    return jsonify(job), 200
+
+# Recent digest jobs, newest first; ?status=running and ?limit=50 narrow the list
+@app.route('/jobs', methods=['GET'])
+def handle_jobs_request():
+    try:
+        limit = min(int(request.args.get("limit", 20)), 500)
+    except ValueError as e:
+        return jsonify({"status": "error", "message": f"Invalid request options: {e}"}), 400
+    try:
+        return jsonify({"jobs": list_jobs(limit, request.args.get("status"))}), 200
+    except Exception as e:
+        logging.error(f"Error listing digest jobs: {e}", exc_info=True)
+        return jsonify({"status": "error", "message": "An internal server error occurred."}), 500
+
+# Coordinator: split subscribers into N id ranges; post each range to /send-digest
+@app.route('/send-digest/plan', methods=['GET', 'POST'])
+def handle_plan_request():
+    options = request.get_json(silent=True) or request.args
+    try:
+        count = int(options.get("shards", 1))
+        if count < 1:
+            raise ValueError("shards must be at least 1.")
+    except (TypeError, ValueError) as e:
+        return jsonify({"status": "error", "message": f"Invalid request options: {e}"}), 400
+    try:
+        ranges = plan_shards(count)
+        return jsonify({"status": "success", "shards": ranges}), 200
+    except Exception as e:
+        logging.error(f"Error planning digest shards: {e}", exc_info=True)
+        return jsonify({"status": "error", "message": "An internal server error occurred."}), 500
+
+# Per-shard progress and throughput for a digest date (defaults to today)
+@app.route('/send-digest/status', methods=['GET'])
+def handle_status_request():
+    try:
+        digest_date = _parse_date(request.args.get("digest_date"))
+    except ValueError as e:
+        return jsonify({"status": "error", "message": f"Invalid request options: {e}"}), 400
+    try:
+        return jsonify(shard_status(digest_date)), 200
+    except Exception as e:
+        logging.error(f"Error reading digest status: {e}", exc_info=True)
+        return jsonify({"status": "error", "message": "An internal server error occurred."}), 500
+
+# Recompute the shared analysis artifact ahead of dashboard traffic and the digest
+@app.route('/refresh-artifact', methods=['POST'])
+def handle_refresh_request():
+    try:
+        return jsonify(refresh_headlines_artifact()), 200
+    except Exception as e:
+        logging.error(f"Error refreshing analysis artifact: {e}", exc_info=True)
+        return jsonify({"status": "error", "message": "An internal server error occurred."}), 500
+
+# Send queued confirmation emails; meant for a frequent Cloud Scheduler job so the
+# outbox drains even while the dashboard's own worker thread is idle or throttled.
+# Optional JSON body: {"time_budget_seconds": 60}
+@app.route('/outbox/drain', methods=['POST'])
+def handle_outbox_drain():
+    options = request.get_json(silent=True) or {}
+    try:
+        time_budget = float(options.get("time_budget_seconds", 60))
+    except (TypeError, ValueError) as e:
+        return jsonify({"status": "error", "message": f"Invalid request options: {e}"}), 400
+    try:
+        totals = drain_outbox(time_budget=time_budget)
+        if totals.get("error"):
+            return jsonify({"status": "error", **totals}), 500
+        return jsonify({"status": "success", **totals}), 200
+    except Exception as e:
+        logging.error(f"Error draining the email outbox: {e}", exc_info=True)
+        return jsonify({"status": "error", "message": "An internal server error occurred."}), 500
+
+# Bulk import: POST a CSV body (header with an email column, optionally a name column).
+# The body is read and upserted in batches as it arrives; existing emails are skipped.
+@app.route('/subscribers/import', methods=['POST'])
+def handle_subscriber_import():
+    try:
+        ensure_schema()
+        stream = io.TextIOWrapper(request.stream, encoding="utf-8-sig", newline="")
+        result = import_subscriber_csv(stream)
+        logging.info(f"Subscriber import finished: {result}")
+        return jsonify({"status": "success", **result}), 200
+    except (ValueError, UnicodeDecodeError) as e:
+        return jsonify({"status": "error", "message": f"Invalid CSV: {e}"}), 400
+    except Exception as e:
+        logging.error(f"Error importing subscribers: {e}", exc_info=True)
+        return jsonify({"status": "error", "message": "An internal server error occurred."}), 500
+
+# Bulk export as CSV, streamed one page of subscribers at a time
+@app.route('/subscribers/export', methods=['GET'])
+def handle_subscriber_export():
+    return Response(
+        stream_with_context(iter_subscriber_csv()),
+        mimetype="text/csv",
+        headers={"Content-Disposition": "attachment; filename=subscribers.csv"}
+    )
+
+# Prometheus scrape target: per-stage latency histograms (fetch, sentiment, wordcloud,
+# lda, db, email_send, ...), cache hit/miss and delivery counters, and the pool's gauges.
+# Metrics live in this process, which is why the image runs a single Gunicorn worker.
+@app.route('/metrics', methods=['GET'])
+def handle_metrics():
+    gauges = {f"db_pool_{name}": value for name, value in pool_metrics().items() if isinstance(value, (int, float))}
+    return Response(render_prometheus(gauges), content_type="text/plain; version=0.0.4; charset=utf-8")
+
 if __name__ == "__main__":
     port = int(os.environ.get("PORT", 8080))
-    app.run(host='0.0.0.0', port=port)
\ No newline at end of file
+    app.run(host='0.0.0.0', port=port)
@@ -1,8 +1,64 @@
 import io
+import os
+import re
+import hashlib
+import logging
+from collections import Counter
 from typing import Iterable, Optional, Set, Dict, Any
-from wordcloud import WordCloud
-import nltk
 from nltk.corpus import stopwords
+from metrics_utils import timed
+from cache_utils import get_or_compute
+
+# Stopwords are loaded once at import. The images download the NLTK corpus at build
+# time, so a missing corpus is logged and WordCloud's own list is used instead of
+# downloading on the request path.
+try:
+    STOPWORDS = frozenset(stopwords.words('english'))
+except LookupError:
+    from wordcloud import STOPWORDS as WORDCLOUD_STOPWORDS
+    logging.warning("NLTK stopwords corpus not found; using WordCloud's built-in stopwords.")
+    STOPWORDS = frozenset(WORDCLOUD_STOPWORDS)
+
+WORDCLOUD_CACHE_TTL_SECONDS = int(os.getenv("WORDCLOUD_CACHE_TTL_SECONDS", "3600"))
+# A word pair seen at least this often is drawn as one phrase when collocations are on
+COLLOCATION_MIN_COUNT = 3
+
+_TOKEN = re.compile(r"[A-Za-z][A-Za-z'-]*[A-Za-z]")
+
+# Tokenize once and count words (and frequent word pairs) for generate_from_frequencies.
+# Counting is case-insensitive; each word is drawn in its most common spelling.
+def word_frequencies(text: str, stopwords_set: Set[str], collocations: bool = True) -> Dict[str, int]:
+    spellings = {}
+    counts = Counter()
+    previous = None
+    pairs = Counter()
+    for match in _TOKEN.finditer(text):
+        word = match.group(0)
+        if word.endswith("'s"):
+            word = word[:-2]
+        key = word.lower()
+        if key in stopwords_set or len(key) < 2:
+            previous = None
+            continue
+        counts[key] += 1
+        spellings.setdefault(key, Counter())[word] += 1
+        if collocations and previous is not None:
+            pairs[(previous, key)] += 1
+        previous = key
+
+    def spelled(key):
+        return spellings[key].most_common(1)[0][0]
+
+    frequencies = {}
+    for (first, second), count in pairs.items():
+        if count >= COLLOCATION_MIN_COUNT:
+            frequencies[f"{spelled(first)} {spelled(second)}"] = count
+            counts[first] -= count
+            counts[second] -= count
+    for key, count in counts.items():
+        if count > 0:
+            frequencies[spelled(key)] = count
+    return frequencies
 
 def generate_wordcloud_image(
     articles: Iterable[Dict[str, Any]],
@@ -13,37 +69,43 @@ def generate_wordcloud_image(
     fallback_text: str = "news world update",
     collocations: bool = True,
     stopwords_base: Optional[Set[str]] = None,
-    random_state: Optional[int] = None
+    random_state: Optional[int] = None,
+    image_format: str = "PNG"
 ) -> bytes:
     text = " ".join(
         ((a.get("title") or "") + " " + (a.get("description") or "")).strip()
         for a in articles
     ).strip()
 
-    if not text:
-        text = fallback_text
-        
-    if stopwords_base is None:
-        try:
-            sw = set(stopwords.words('english'))
-        except LookupError:            
-            nltk.download('stopwords')
-            sw = set(stopwords.words('english'))
-    else:        
-        sw = set(stopwords_base)
-
+    sw = set(STOPWORDS if stopwords_base is None else stopwords_base)
     if custom_stopwords:
         sw.update({s.lower() for s in custom_stopwords})
-    
-    wc = WordCloud(
-        width=width,
-        height=height,
-        background_color=background_color,
-        stopwords=sw,
-        collocations=collocations,
-        random_state=random_state
-    ).generate(text)
-    
-    buf = io.BytesIO()
-    wc.to_image().save(buf, format="PNG")
-    return buf.getvalue()
\ No newline at end of file
+
+    # Rendered images are cached by the article text and every render parameter
+    key = hashlib.blake2b(
+        "\0".join([
+            text, "|".join(sorted(sw)), str(width), str(height), background_color,
+            fallback_text, str(collocations), str(random_state), image_format.upper()
+        ]).encode("utf-8"),
+        digest_size=16
+    ).hexdigest()
+
+    def render() -> bytes:
+        with timed("wordcloud"):
+            # wordcloud pulls in matplotlib, so it is only imported when an image is actually rendered
+            from wordcloud import WordCloud
+            frequencies = word_frequencies(text, sw, collocations) if text else {}
+            if not frequencies:
+                frequencies = word_frequencies(fallback_text, set(), collocations=False)
+
+            wc = WordCloud(
+                width=width,
+                height=height,
+                background_color=background_color,
+                random_state=random_state
+            ).generate_from_frequencies(frequencies)
+
+            buf = io.BytesIO()
+            wc.to_image().save(buf, format=image_format.upper())
+            return buf.getvalue()
+    return get_or_compute("wordcloud", (key,), render, WORDCLOUD_CACHE_TTL_SECONDS)
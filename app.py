@@ -1,22 +1,16 @@
 import streamlit as st
-import pandas as pd
-import matplotlib.pyplot as plt
-import plotly.express as px
-from wordcloud import WordCloud
-import nltk
-from nltk.corpus import stopwords
-from sklearn.feature_extraction.text import CountVectorizer
-from sklearn.decomposition import LatentDirichletAllocation
-from vaderSentiment.vaderSentiment import SentimentIntensityAnalyzer
-from textblob import TextBlob
 from datetime import datetime, timedelta
 import os
 from dotenv import load_dotenv
 import logging
-from db_utils import init_db, email_exists, add_subscriber
-from email_utils import send_confirmation_email
-from news_utils import fetch_news, fetch_top_headlines
-from analysis_utils import generate_wordcloud_image
+from db_utils import init_db, add_subscriber, remove_subscriber
+from subscriber_io import verify_unsubscribe_token
+from outbox_utils import start_outbox_worker, notify_outbox_worker
+from news_utils import fetch_news, fetch_top_headlines, fetch_trend, fetch_comparison, search_stored, stored_entities
+from sentiment_utils import VADER, TEXTBLOB
+from artifact_utils import get_search_artifact, get_comparison_artifact, get_headlines_artifact, HEADLINES_LABEL
+from export_utils import EXPORT_FORMATS, export_bytes, export_filename
+from metrics_utils import trace, timed, stage_summary, cache_summary
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(message)s')
 
@@ -25,7 +19,10 @@ NEWS_API_KEY = os.getenv("NEWS_API_KEY")
 if not NEWS_API_KEY:
     st.error("NEWS_API_KEY environment variable not set! Please check your .env file.")
     st.stop()
-stop_words = set(stopwords.words('english'))
+# Searches page through NewsAPI concurrently, so analyses can go well past one page of 100
+MAX_ARTICLES = int(os.getenv("MAX_ARTICLES", "1000"))
+MAX_COMPARE_TOPICS = int(os.getenv("MAX_COMPARE_TOPICS", "5"))
+SENTIMENT_COLORS = {"Positive": "#2ecc71", "Negative": "#e74c3c", "Neutral": "#95a5a6"}
 
 st.set_page_config(
     page_title="TrendyTracker",
@@ -34,12 +31,33 @@ st.set_page_config(
 )
 st.title("TrendyTracker: The News Trend Analyzer")
 
+# Unsubscribe links in the digest carry a signed token for the subscriber's email
+unsubscribe_token = st.query_params.get("unsubscribe")
+if unsubscribe_token:
+    unsubscribe_email = verify_unsubscribe_token(unsubscribe_token)
+    if unsubscribe_email is None:
+        st.error("This unsubscribe link is not valid.")
+    else:
+        init_db()
+        if remove_subscriber(unsubscribe_email):
+            st.success(f"{unsubscribe_email} has been unsubscribed from the Daily News Digest.")
+        else:
+            st.info(f"{unsubscribe_email} is not subscribed to the Daily News Digest.")
+    del st.query_params["unsubscribe"]
+
 with st.sidebar:
     st.header("Controls")
-    mode = st.radio("Mode", ["Top Headlines", "Search"], index=0)
-    query = st.text_input("Search Topic", "India", disabled=(mode == "Top Headlines"))
+    mode = st.radio("Mode", ["Top Headlines", "Search", "Compare"], index=0)
+    if mode == "Compare":
+        compare_text = st.text_input(
+            "Topics to Compare", "India, China, Brazil",
+            help=f"Comma-separated, up to {MAX_COMPARE_TOPICS} topics. Articles to Analyze applies to each topic."
+        )
+        query = ""
+    else:
+        query = st.text_input("Search Topic", "India", disabled=(mode == "Top Headlines"))
     exact_match = st.checkbox("Exact Phrase Search", value=False, disabled=(mode == "Top Headlines"))
-    num_articles = st.slider("Articles to Analyze", min_value=10, max_value=100, value=50, step=5)
+    num_articles = st.slider("Articles to Analyze", min_value=10, max_value=MAX_ARTICLES, value=50, step=10)
     default_start = datetime.now() - timedelta(days=14)
     default_end = datetime.now()
     date_range = st.date_input(
@@ -49,50 +67,72 @@ with st.sidebar:
         min_value=datetime.now() - timedelta(days=29),
         disabled=(mode == "Top Headlines")
     )
+    # Answered from the local index in milliseconds, without a NewsAPI call
+    stored_only = st.checkbox("Search Stored Articles Only", value=False, disabled=(mode == "Top Headlines"))
+    entity_filter = None
+    if stored_only and mode == "Search" and isinstance(date_range, (list, tuple)) and len(date_range) == 2:
+        entity_filter = st.selectbox("Mentioning", ["Anyone"] + stored_entities(*date_range))
+        entity_filter = None if entity_filter == "Anyone" else entity_filter
     st.markdown("---")
     st.caption("Analysis Options")
     use_vader = st.checkbox("Use VADER Sentiment", True)
     show_topics = st.checkbox("Show Topic Modeling", True)
+    n_topics = st.slider("Number of Topics", min_value=2, max_value=10, value=3, disabled=not show_topics)
+    n_top_words = st.slider("Words per Topic", min_value=3, max_value=15, value=5, disabled=not show_topics)
+    show_timings = st.checkbox("Show Timing Panel", False)
 
-def run_analysis(articles, label):
-    if not articles:
+def run_analysis(artifact, label, trend_query=None, trend_exact=False):
+    # Imported here so a cold start does not pay for plotly before the first chart
+    import plotly.express as px
+    if artifact is None:
         st.error("No articles found. Try switching modes or adjusting filters.")
         st.stop()
-    data = [{
-        "Date": a.get("publishedAt"),
-        "Source": (a.get("source") or {}).get("name"),
-        "Title": a.get("title"),
-        "Content": a.get("description") or "",
-        "URL": a.get("url")
-    } for a in articles if a.get("title")]
-    df = pd.DataFrame(data)
+    df = artifact.df
     if df.empty:
         st.error("No usable articles returned.")
         st.stop()
-    df["Date"] = pd.to_datetime(df["Date"], errors="coerce").dt.tz_localize(None).dt.date
-    analyzer = SentimentIntensityAnalyzer()
-    df["Sentiment"] = df["Content"].astype(str).apply(lambda x: analyzer.polarity_scores(x)["compound"] if use_vader else TextBlob(x).sentiment.polarity)
-    df["SentimentLabel"] = df["Sentiment"].apply(lambda s: "Positive" if s > 0.1 else "Negative" if s < -0.1 else "Neutral")
     st.header(f"Analysis: {label}")
-    trend_data = df.groupby('Date', dropna=True).size().reset_index(name='Article Count')
-    if not trend_data.empty:
-        fig_timeline = px.line(trend_data, x='Date', y='Article Count', title='Number of Articles Over Time', markers=True)
+    if "Copies" in df and (df["Copies"] > 1).any():
+        st.caption(
+            f"{int(df['Copies'].sum()) - len(df)} near-duplicate copies of syndicated stories were merged; "
+            "each story is analyzed once and the Copies column shows how often it appeared."
+        )
+    # The timeline reads the store's trend rollups, so it can reach back past NewsAPI's 30-day window
+    history_col1, history_col2 = st.columns([3, 1])
+    with history_col1:
+        history_range = st.date_input(
+            "Trend History Range",
+            value=[datetime.now() - timedelta(days=30), datetime.now()],
+            max_value=datetime.now()
+        )
+    with history_col2:
+        granularity = st.selectbox("Granularity", ["Auto", "Hour", "Day", "Week"])
+    trend_rows = []
+    if isinstance(history_range, (list, tuple)) and len(history_range) == 2:
+        trend_rows = fetch_trend(
+            trend_query, history_range[0], history_range[1],
+            None if granularity == "Auto" else granularity.lower(), trend_exact
+        )
+    if trend_rows:
+        trend_data = {
+            "Period": [row[0] for row in trend_rows],
+            "Article Count": [row[1] for row in trend_rows],
+            "Avg Sentiment": [round(row[2], 3) for row in trend_rows]
+        }
+        fig_timeline = px.line(
+            trend_data, x='Period', y='Article Count', hover_data=['Avg Sentiment'],
+            title='Number of Articles Over Time', markers=True
+        )
         st.plotly_chart(fig_timeline, use_container_width=True)
+    else:
+        trend_data = df.groupby('Date', dropna=True).size().reset_index(name='Article Count')
+        if not trend_data.empty:
+            fig_timeline = px.line(trend_data, x='Date', y='Article Count', title='Number of Articles Over Time', markers=True)
+            st.plotly_chart(fig_timeline, use_container_width=True)
     col1, col2 = st.columns(2)
     with col1:
         st.subheader("Top Keywords")
-        custom = set(str(label).lower().split()) | stop_words
-        img_bytes = generate_wordcloud_image(
-            articles,
-            custom_stopwords=custom,
-            width=800,
-            height=400,
-            fallback_text="news world update",
-            collocations=True,
-            stopwords_base=stop_words,
-            random_state=42
-        )
-        st.image(img_bytes)
+        st.image(artifact.wordcloud)
     with col2:
         st.subheader("Sentiment Breakdown")
         sentiment_counts = df["SentimentLabel"].value_counts()
@@ -102,32 +142,18 @@ def run_analysis(articles, label):
             names=sentiment_counts.index, 
             title='Overall Sentiment Distribution', 
             color=sentiment_counts.index,
-            color_discrete_map={
-                "Positive": "#2ecc71",
-                "Negative": "#e74c3c",
-                "Neutral":  "#95a5a6"
-            }
+            color_discrete_map=SENTIMENT_COLORS
         )
         st.plotly_chart(fig_pie, use_container_width=True)
     if show_topics:
         st.subheader("Detected Topics (LDA)")
-        try:
-            vectorizer = CountVectorizer(max_df=0.9, min_df=2, stop_words='english')
-            dtm = vectorizer.fit_transform(df["Content"].astype(str))
-            if dtm.shape[0] > 0 and dtm.shape[1] > 0:
-                lda = LatentDirichletAllocation(n_components=3, random_state=42)
-                lda.fit(dtm)
-                vocab = vectorizer.get_feature_names_out()
-                for idx, topic in enumerate(lda.components_):
-                    top_words = [vocab[i] for i in topic.argsort()[-5:]]
-                    st.write(f"**Topic #{idx + 1}:** {', '.join(top_words)}")
-            else:
-                st.warning("Not enough content to perform topic modeling.")
-        except ValueError:
+        if artifact.topics:
+            for idx, top_words in enumerate(artifact.topics):
+                st.write(f"**Topic #{idx + 1}:** {', '.join(top_words)}")
+        else:
             st.warning("Not enough content to perform topic modeling.")
     st.subheader("Source Comparison")
-    source_stats = df.groupby("Source", dropna=True).agg(Articles=("Content", "count"), Avg_Sentiment=("Sentiment", "mean")).sort_values("Articles", ascending=False).head(10)
-    st.dataframe(source_stats.style.background_gradient(cmap="viridis", subset=["Articles"]).format({"Avg_Sentiment": "{:.2f}"}))
+    st.dataframe(artifact.source_stats.style.background_gradient(cmap="viridis", subset=["Articles"]).format({"Avg_Sentiment": "{:.2f}"}))
     st.subheader("Top Positive & Negative Headlines")
     col3, col4 = st.columns(2)
     with col3:
@@ -139,51 +165,163 @@ def run_analysis(articles, label):
         negative_df = df[df["Sentiment"] < -0.1].sort_values("Sentiment", ascending=True).head(5)
         st.table(negative_df[["Source", "Title"]])
     st.subheader("All Collected Articles")
-    st.dataframe(df[["Date", "Source", "Title", "SentimentLabel"]])
-    st.download_button(
-        label="Download Full Analysis (CSV)",
-        data=df.to_csv(index=False).encode('utf-8'),
-        file_name=f"news_analysis_{str(label).replace(' ', '_')}.csv",
-        mime="text/csv"
-    )
+    st.dataframe(df[[c for c in ["Date", "Source", "Title", "Copies", "SentimentLabel"] if c in df]])
+    # The export is only built when asked for, so reruns don't serialize the whole frame
+    export_col1, export_col2 = st.columns([1, 3])
+    with export_col1:
+        export_format = st.selectbox(
+            "Export format", list(EXPORT_FORMATS), format_func=lambda fmt: EXPORT_FORMATS[fmt].label
+        )
+    with export_col2:
+        st.write("")
+        if st.button("Prepare Full Analysis Download"):
+            with st.spinner("Building export..."):
+                data = export_bytes(df, export_format)
+            st.download_button(
+                label=f"Download Full Analysis ({EXPORT_FORMATS[export_format].label})",
+                data=data,
+                file_name=export_filename(label, export_format),
+                mime=EXPORT_FORMATS[export_format].mime
+            )
+
+# Topics from the comparison box, in the order typed, without repeats
+def compare_topics(text):
+    topics = {}
+    for topic in text.split(","):
+        topic = topic.strip()
+        if topic:
+            topics.setdefault(topic.lower(), topic)
+    return list(topics.values())[:MAX_COMPARE_TOPICS]
+
+def run_comparison(artifact):
+    import plotly.express as px
+    if artifact is None or artifact.df.empty:
+        st.error("No articles found for these topics. Try widening the date range.")
+        st.stop()
+    df = artifact.df
+    st.header(f"Comparison: {' vs '.join(repr(query) for query in artifact.queries)}")
+    shared = int((artifact.summary["Shared"] > 0).sum())
+    if shared:
+        st.caption(
+            "Stories returned for more than one topic were analyzed once and count towards each; "
+            "the Shared column and the table below show how much the topics overlap."
+        )
+    timeline = df.groupby(["Date", "Query"], dropna=True).size().reset_index(name="Article Count")
+    if not timeline.empty:
+        fig_timeline = px.line(
+            timeline, x="Date", y="Article Count", color="Query", title="Number of Articles Over Time", markers=True
+        )
+        st.plotly_chart(fig_timeline, use_container_width=True)
+    col1, col2 = st.columns(2)
+    with col1:
+        st.subheader("Sentiment by Topic")
+        sentiment_counts = df.groupby(["Query", "SentimentLabel"]).size().reset_index(name="Articles")
+        fig_bar = px.bar(
+            sentiment_counts, x="Query", y="Articles", color="SentimentLabel",
+            category_orders={"Query": artifact.queries}, color_discrete_map=SENTIMENT_COLORS
+        )
+        st.plotly_chart(fig_bar, use_container_width=True)
+    with col2:
+        st.subheader("Topic Summary")
+        st.dataframe(artifact.summary.style.format({
+            "Avg_Sentiment": "{:.2f}", "Positive": "{:.0%}", "Neutral": "{:.0%}", "Negative": "{:.0%}"
+        }))
+        st.subheader("Shared Stories")
+        st.dataframe(artifact.overlap)
+    st.subheader("Source Comparison")
+    for tab, query in zip(st.tabs(artifact.queries), artifact.queries):
+        with tab:
+            stats = artifact.source_stats[query]
+            if stats.empty:
+                st.info(f"No articles for '{query}'.")
+            else:
+                st.dataframe(stats.style.background_gradient(cmap="viridis", subset=["Articles"]).format({"Avg_Sentiment": "{:.2f}"}))
+    st.subheader("All Collected Articles")
+    st.dataframe(df[["Query", "Date", "Source", "Title", "Copies", "SentimentLabel"]])
+
+# Where this page load spent its time, next to this server process's running totals
+def timing_panel(run_timings):
+    with st.expander("Timing", expanded=True):
+        st.caption("This page load. Stages nest (analysis includes sentiment, wordcloud and lda), and "
+                   "work served from the cache does not appear.")
+        st.dataframe([
+            {"Stage": stage, "Calls": calls, "Seconds": round(seconds, 3)}
+            for stage, (calls, seconds) in sorted(run_timings.items(), key=lambda item: item[1][1], reverse=True)
+        ])
+        st.caption("Since this server process started")
+        st.dataframe(stage_summary())
+        caches = cache_summary()
+        if caches:
+            st.dataframe([{"cache": name, **entry} for name, entry in caches.items()])
 
 if "initialized" not in st.session_state:
     st.session_state.initialized = True
 
-if mode == "Top Headlines":
-    articles = fetch_top_headlines(num_articles)
-    run_analysis(articles, "Top Headlines (Global)")
-else:
-    if not isinstance(date_range, (list, tuple)) or len(date_range) != 2:
-        st.warning("Select a valid date range.")
-        st.stop()
-    start_date, end_date = date_range
-    if not query:
-        st.warning("Please enter a search topic.")
-        st.stop()
-    articles = fetch_news(query, num_articles, start_date, end_date, exact_match)
-    run_analysis(articles, f"'{query}'")
+sentiment_method = VADER if use_vader else TEXTBLOB
+
+with trace() as run_timings, timed("page"):
+    if mode == "Top Headlines":
+        # The default view is usually served straight from the precomputed artifact file
+        artifact = get_headlines_artifact(
+            fetch_top_headlines, num_articles, sentiment_method, show_topics, n_topics, n_top_words
+        )
+        run_analysis(artifact, HEADLINES_LABEL)
+    else:
+        if not isinstance(date_range, (list, tuple)) or len(date_range) != 2:
+            st.warning("Select a valid date range.")
+            st.stop()
+        start_date, end_date = date_range
+        if mode == "Compare":
+            topics = compare_topics(compare_text)
+            if len(topics) < 2:
+                st.warning("Enter at least two topics, separated by commas.")
+                st.stop()
+            if stored_only:
+                feeds = {topic: search_stored(topic, num_articles, start_date, end_date, exact_match) for topic in topics}
+            else:
+                feeds = fetch_comparison(tuple(topics), num_articles, start_date, end_date, exact_match)
+            run_comparison(get_comparison_artifact(feeds, sentiment_method) if any(feeds.values()) else None)
+        else:
+            if not query and not (stored_only and entity_filter):
+                st.warning("Please enter a search topic.")
+                st.stop()
+            if stored_only:
+                articles = search_stored(query, num_articles, start_date, end_date, exact_match, entity_filter)
+            else:
+                articles = fetch_news(query, num_articles, start_date, end_date, exact_match)
+            label = " + ".join(f"'{term}'" for term in (query, entity_filter) if term)
+            artifact = get_search_artifact(articles, label, sentiment_method, show_topics, n_topics, n_top_words) if articles else None
+            run_analysis(artifact, label, query, exact_match)
+if show_timings:
+    timing_panel(run_timings)
 
 st.markdown("---")
 init_db()
+# Confirmation emails are queued by the signup itself and sent from this background thread
+if os.getenv("OUTBOX_WORKER", "1") == "1":
+    start_outbox_worker()
 st.header("Subscribe for Daily News Digest")
 
 with st.form("subscribe_form", clear_on_submit=True):
     name = st.text_input("Name", placeholder="Your Name")
     email = st.text_input("Email", placeholder="your@email.com")
+    keywords = st.text_input(
+        "Digest Topics (optional)", placeholder="e.g. climate, elections",
+        help="Comma-separated keywords. Leave empty to receive the top headlines."
+    )
     submitted = st.form_submit_button("Subscribe")
 
     if submitted:
         logging.info(f"Subscription attempt: Name='{name}', Email='{email}'")
         if name and email:
-            if email_exists(email):
+            added = add_subscriber(name, email, keywords)
+            if added:
+                st.success(f"Thank you, {name}! A confirmation email is on its way to {email}.")
+                logging.info(f"Successfully added subscriber {email}")
+                notify_outbox_worker()
+            elif added is False:
                 st.warning("This email is already subscribed!")
             else:
-                if add_subscriber(name, email):
-                    st.success(f"Thank you, {name}! A confirmation has been sent to {email}.")
-                    logging.info(f"Successfully added subscriber {email}")
-                    send_confirmation_email(name, email)
-                else:
-                    st.error("Could not complete subscription. Please try again.")
+                st.error("Could not complete subscription. Please try again.")
         else:
             st.error("Please provide both a name and an email address.")
\ No newline at end of file
@@ -0,0 +1,649 @@
+import os
+import json
+import time
+import re
+import sqlite3
+import logging
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from newsapi_client import iter_everything, iter_top_headlines
+from metrics_utils import timed, cache_lookup
+
+# On-disk article store shared by the dashboard and the digest service.
+# Articles are keyed by URL; a feed (top headlines, or one search query) remembers
+# which articles it has seen and how far its ingestion has progressed.
+ARTICLE_STORE_PATH = os.getenv("ARTICLE_STORE_PATH", "articles.db")
+SEARCH_TTL_SECONDS = int(os.getenv("SEARCH_TTL_SECONDS", "3600"))
+HEADLINES_TTL_SECONDS = int(os.getenv("HEADLINES_TTL_SECONDS", "1800"))
+# Top headlines are a rolling window, not an archive
+HEADLINES_WINDOW_HOURS = int(os.getenv("HEADLINES_WINDOW_HOURS", "24"))
+
+TOP_HEADLINES_FEED = "top-headlines"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS articles (
+    url TEXT PRIMARY KEY,
+    published_at TEXT,
+    source TEXT,
+    title TEXT,
+    description TEXT,
+    payload TEXT NOT NULL,
+    ingested_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_articles_published_at ON articles (published_at);
+CREATE TABLE IF NOT EXISTS feed_articles (
+    feed_key TEXT NOT NULL,
+    url TEXT NOT NULL REFERENCES articles (url),
+    last_seen_at TEXT NOT NULL,
+    PRIMARY KEY (feed_key, url)
+);
+CREATE INDEX IF NOT EXISTS idx_feed_articles_seen ON feed_articles (feed_key, last_seen_at);
+CREATE TABLE IF NOT EXISTS feed_state (
+    feed_key TEXT PRIMARY KEY,
+    covered_from TEXT,
+    last_published_at TEXT,
+    last_fetched_at REAL NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS trend_buckets (
+    granularity TEXT NOT NULL,
+    feed_key TEXT NOT NULL,
+    bucket_start TEXT NOT NULL,
+    source TEXT NOT NULL,
+    article_count INTEGER NOT NULL,
+    sentiment_sum REAL NOT NULL,
+    PRIMARY KEY (granularity, feed_key, bucket_start, source)
+);
+CREATE TABLE IF NOT EXISTS search_coverage (
+    feed_key TEXT NOT NULL,
+    day TEXT NOT NULL,
+    fetched_at REAL NOT NULL,
+    PRIMARY KEY (feed_key, day)
+);
+CREATE TABLE IF NOT EXISTS term_postings (
+    term TEXT NOT NULL,
+    url TEXT NOT NULL REFERENCES articles (url),
+    positions TEXT NOT NULL,
+    PRIMARY KEY (term, url)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_term_postings_url ON term_postings (url);
+CREATE TABLE IF NOT EXISTS entity_postings (
+    entity TEXT NOT NULL COLLATE NOCASE,
+    url TEXT NOT NULL REFERENCES articles (url),
+    PRIMARY KEY (entity, url)
+) WITHOUT ROWID;
+"""
+
+# Trend rollups kept per feed and source. Each article is counted once per feed, in
+# the hour, day and week (starting Monday) of its publishedAt, with its VADER score.
+HOUR = "hour"
+DAY = "day"
+WEEK = "week"
+GRANULARITIES = (HOUR, DAY, WEEK)
+UNKNOWN_SOURCE = ""
+
+# Inverted index over stored titles and descriptions. Token positions are kept so
+# exact phrases can be matched like NewsAPI's quoted queries; title and description
+# positions are kept apart so a phrase never spans the two.
+_TOKEN = re.compile(r"[a-z0-9]+")
+_ENTITY = re.compile(r"\b[A-Z](?:[\w&-]|[.'](?=\w))*(?:\s+(?:of\s+)?[A-Z](?:[\w&-]|[.'](?=\w))*)*")
+_FIELD_GAP = 1000
+
+_schema_ready = False
+_schema_lock = threading.Lock()
+# One lock per feed: concurrent reruns of a search do not fetch the same delta twice,
+# while different searches (e.g. the topics of a comparison) ingest in parallel
+_ingest_locks = {}
+_ingest_locks_guard = threading.Lock()
+
+@contextmanager
+def _connect():
+    global _schema_ready
+    conn = sqlite3.connect(ARTICLE_STORE_PATH, timeout=30)
+    try:
+        if not _schema_ready:
+            with _schema_lock:
+                if not _schema_ready:
+                    conn.execute("PRAGMA journal_mode=WAL;")
+                    conn.executescript(SCHEMA)
+                    _schema_ready = True
+        with conn:
+            yield conn
+    finally:
+        conn.close()
+
+def _ingest_lock(feed_key: str) -> threading.Lock:
+    with _ingest_locks_guard:
+        return _ingest_locks.setdefault(feed_key, threading.Lock())
+
+def _utc_now() -> str:
+    return datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+def _as_date(value) -> str:
+    return value if isinstance(value, str) else value.strftime("%Y-%m-%d")
+
+def search_feed_key(query: str, exact_match: bool = False) -> str:
+    return f"everything:{'exact' if exact_match else 'any'}:{query.strip().lower()}"
+
+def _feed_state(conn, feed_key: str):
+    row = conn.execute(
+        "SELECT covered_from, last_published_at, last_fetched_at FROM feed_state WHERE feed_key = ?;",
+        (feed_key,)
+    ).fetchone()
+    return row or (None, None, 0.0)
+
+# Upsert articles and tag them with the feed; returns how many URLs were new to the store
+def store_articles(feed_key: str, articles: list) -> int:
+    now = _utc_now()
+    rows = []
+    for a in articles:
+        url = a.get("url")
+        if not url or not a.get("title") or a.get("title") == "[Removed]":
+            continue
+        rows.append((
+            url,
+            a.get("publishedAt"),
+            (a.get("source") or {}).get("name"),
+            a.get("title"),
+            a.get("description"),
+            json.dumps(a),
+            now
+        ))
+    if not rows:
+        return 0
+    # Only articles new to this feed count towards its trend history. They are scored
+    # before the write transaction opens, so the store is not locked while VADER runs.
+    with _connect() as conn:
+        trends = _trend_totals(feed_key, _new_rows(conn, rows, feed_key))
+        unindexed = _new_rows(conn, rows)
+    with _connect() as conn:
+        before = conn.total_changes
+        conn.executemany(
+            "INSERT OR IGNORE INTO articles (url, published_at, source, title, description, payload, ingested_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?);",
+            rows
+        )
+        added = conn.total_changes - before
+        _index_rows(conn, unindexed)
+        conn.executemany(
+            "INSERT INTO feed_articles (feed_key, url, last_seen_at) VALUES (?, ?, ?) "
+            "ON CONFLICT (feed_key, url) DO UPDATE SET last_seen_at = excluded.last_seen_at;",
+            [(feed_key, row[0], now) for row in rows]
+        )
+        _add_to_trends(conn, trends)
+    return added
+
+# Rows whose URL is not yet in the store, or not yet tagged with `feed_key` when given
+def _new_rows(conn, rows: list, feed_key: str = None) -> list:
+    known = set()
+    urls = [row[0] for row in rows]
+    for i in range(0, len(urls), 500):
+        chunk = urls[i:i + 500]
+        placeholders = ",".join("?" * len(chunk))
+        if feed_key is None:
+            cursor = conn.execute(f"SELECT url FROM articles WHERE url IN ({placeholders});", chunk)
+        else:
+            cursor = conn.execute(
+                f"SELECT url FROM feed_articles WHERE feed_key = ? AND url IN ({placeholders});",
+                (feed_key, *chunk)
+            )
+        known.update(url for (url,) in cursor)
+    fresh = {}
+    for row in rows:
+        if row[0] not in known:
+            fresh.setdefault(row[0], row)
+    return list(fresh.values())
+
+def _tokens(text: str) -> list:
+    return _TOKEN.findall((text or "").lower())
+
+def _entities(text: str) -> set:
+    from analysis_utils import STOPWORDS
+    found = set()
+    for match in _ENTITY.finditer(text or ""):
+        words = match.group(0).split()
+        if words[-1].endswith("'s"):
+            words[-1] = words[-1][:-2]
+        # Drop a capitalised stopword that merely starts the sentence ("The Bank of England")
+        while words and words[0].lower() in STOPWORDS:
+            words.pop(0)
+        entity = " ".join(words)
+        if len(entity) >= 2:
+            found.add(entity)
+    return found
+
+# `rows` are (url, published_at, source, title, description, ...) as built by store_articles
+def _index_rows(conn, rows: list):
+    postings, entities = [], []
+    for row in rows:
+        url, title, description = row[0], row[3], row[4]
+        positions = {}
+        for offset, field in ((0, title), (_FIELD_GAP, description)):
+            for i, token in enumerate(_tokens(field)):
+                positions.setdefault(token, []).append(offset + i)
+        postings.extend((term, url, ",".join(map(str, p))) for term, p in positions.items())
+        entities.extend((entity, url) for entity in _entities(f"{title or ''}. {description or ''}"))
+    conn.executemany("INSERT OR REPLACE INTO term_postings (term, url, positions) VALUES (?, ?, ?);", postings)
+    conn.executemany("INSERT OR IGNORE INTO entity_postings (entity, url) VALUES (?, ?);", entities)
+
+def _bucket_starts(published_at: str) -> dict:
+    day = datetime.strptime(published_at[:10], "%Y-%m-%d")
+    return {
+        HOUR: f"{published_at[:13]}:00",
+        DAY: published_at[:10],
+        WEEK: (day - timedelta(days=day.weekday())).strftime("%Y-%m-%d"),
+    }
+
+# Per-bucket (count, sentiment sum) for articles new to a feed.
+# `rows` are (url, published_at, source, title, description, ...) as built by store_articles.
+def _trend_totals(feed_key: str, rows: list) -> dict:
+    rows = [row for row in rows if row[1] and len(row[1]) >= 13]
+    if not rows:
+        return {}
+    from sentiment_utils import score_texts
+    scores = score_texts([row[4] or "" for row in rows])
+    totals = {}
+    for row, score in zip(rows, scores):
+        try:
+            buckets = _bucket_starts(row[1])
+        except ValueError:
+            continue
+        for granularity, bucket_start in buckets.items():
+            key = (granularity, feed_key, bucket_start, row[2] or UNKNOWN_SOURCE)
+            count, total = totals.get(key, (0, 0.0))
+            totals[key] = (count + 1, total + score)
+    return totals
+
+def _add_to_trends(conn, totals: dict):
+    if not totals:
+        return
+    conn.executemany(
+        "INSERT INTO trend_buckets (granularity, feed_key, bucket_start, source, article_count, sentiment_sum) "
+        "VALUES (?, ?, ?, ?, ?, ?) "
+        "ON CONFLICT (granularity, feed_key, bucket_start, source) DO UPDATE SET "
+        "article_count = trend_buckets.article_count + excluded.article_count, "
+        "sentiment_sum = trend_buckets.sentiment_sum + excluded.sentiment_sum;",
+        [(*key, count, total) for key, (count, total) in totals.items()]
+    )
+
+def _update_feed_state(feed_key: str, covered_from, articles: list):
+    newest = max((a.get("publishedAt") or "" for a in articles), default="") or None
+    with _connect() as conn:
+        conn.execute(
+            "INSERT INTO feed_state (feed_key, covered_from, last_published_at, last_fetched_at) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT (feed_key) DO UPDATE SET "
+            "covered_from = CASE WHEN excluded.covered_from IS NULL THEN feed_state.covered_from "
+            "    WHEN feed_state.covered_from IS NULL OR excluded.covered_from < feed_state.covered_from "
+            "    THEN excluded.covered_from ELSE feed_state.covered_from END, "
+            "last_published_at = MAX(COALESCE(feed_state.last_published_at, ''), COALESCE(excluded.last_published_at, '')), "
+            "last_fetched_at = excluded.last_fetched_at;",
+            (feed_key, covered_from, newest, time.time())
+        )
+
+def _day_end(day: str) -> float:
+    return (datetime.strptime(day, "%Y-%m-%d").replace(tzinfo=timezone.utc) + timedelta(days=1)).timestamp()
+
+# Contiguous runs of days in [start, end] that this search has not covered yet.
+# A day fetched after it ended stays covered; one fetched while it was still running
+# (i.e. today) is only covered for SEARCH_TTL_SECONDS.
+def _uncovered_ranges(conn, feed_key: str, start: str, end: str) -> list:
+    fetched = dict(conn.execute(
+        "SELECT day, fetched_at FROM search_coverage WHERE feed_key = ? AND day >= ? AND day <= ?;",
+        (feed_key, start, end)
+    ).fetchall())
+    now = time.time()
+    ranges = []
+    day = datetime.strptime(start, "%Y-%m-%d")
+    last = datetime.strptime(end, "%Y-%m-%d")
+    while day <= last:
+        key = _as_date(day)
+        fetched_at = fetched.get(key)
+        covered = fetched_at is not None and (fetched_at >= _day_end(key) or now - fetched_at < SEARCH_TTL_SECONDS)
+        if not covered:
+            if ranges and ranges[-1][1] == _as_date(day - timedelta(days=1)):
+                ranges[-1][1] = key
+            else:
+                ranges.append([key, key])
+        day += timedelta(days=1)
+    return [tuple(r) for r in ranges]
+
+def _days(first: str, last: str) -> list:
+    days = []
+    day = datetime.strptime(first, "%Y-%m-%d")
+    while _as_date(day) <= last:
+        days.append(_as_date(day))
+        day += timedelta(days=1)
+    return days
+
+def _mark_covered(feed_key: str, days, fetched_at: float):
+    rows = [(feed_key, day, fetched_at) for day in sorted(days)]
+    with _connect() as conn:
+        conn.executemany(
+            "INSERT INTO search_coverage (feed_key, day, fetched_at) VALUES (?, ?, ?) "
+            "ON CONFLICT (feed_key, day) DO UPDATE SET fetched_at = excluded.fetched_at;",
+            rows
+        )
+
+# Incremental ingestion for a search. NewsAPI is only asked for the days of the window
+# this search has not covered yet; a previously fetched but stale day (today) is only
+# asked for articles newer than the last stored publishedAt. A day only counts as covered
+# once all of its results were fetched; days the `max_articles` budget cut short (or never
+# reached) stay uncovered, so a later, larger search fetches them.
+# Pages are stored as they arrive; `on_progress(fetched_so_far)` is called after each.
+@timed("fetch")
+def ingest_search(query: str, from_date, to_date, max_articles: int, exact_match: bool = False,
+                  on_progress=None) -> int:
+    feed_key = search_feed_key(query, exact_match)
+    start, end = _as_date(from_date), _as_date(to_date)
+    with _ingest_lock(feed_key):
+        with _connect() as conn:
+            _, last_published_at, _ = _feed_state(conn, feed_key)
+            ranges = _uncovered_ranges(conn, feed_key, start, end)
+            # Days fetched in full before, now only stale; a day cut short has no row
+            stale = {day for (day,) in conn.execute(
+                "SELECT day FROM search_coverage WHERE feed_key = ? AND day >= ? AND day <= ?;", (feed_key, start, end)
+            )}
+        if not ranges:
+            cache_lookup("search_coverage", hits=1)
+            return 0
+        cache_lookup("search_coverage", misses=1)
+        started_at = time.time()
+        fetched, added, newest = 0, 0, []
+        completed = set()
+        for first, last in ranges:
+            if fetched >= max_articles:
+                break
+            fetch_from = first
+            # Only a day that was once fetched in full can be topped up with the newer articles;
+            # a day cut short by the budget still misses its older ones
+            if last_published_at and last_published_at[:10] == first and first in stale:
+                fetch_from = last_published_at
+            # End-of-day bound so a delta starting mid-day never sits after the window's end
+            for batch in iter_everything(query, fetch_from, f"{last}T23:59:59", max_articles - fetched, exact_match,
+                                         completed=completed):
+                added += store_articles(feed_key, batch)
+                fetched += len(batch)
+                newest.append(max(batch, key=lambda a: a.get("publishedAt") or ""))
+                if on_progress:
+                    on_progress(fetched)
+        # Day windows start on the day they cover (a delta window mid-way through it)
+        covered_days = {window[0][:10] for window in completed}
+        _mark_covered(feed_key, covered_days, started_at)
+        complete = all(day in covered_days for first, last in ranges for day in _days(first, last))
+        _update_feed_state(feed_key, start if complete else None, newest)
+    logging.info(f"Ingested {fetched} articles for '{query}' ({added} new) over {len(ranges)} uncovered range(s).")
+    return added
+
+@timed("fetch")
+def ingest_top_headlines(max_articles: int) -> int:
+    with _ingest_lock(TOP_HEADLINES_FEED):
+        with _connect() as conn:
+            _, _, last_fetched_at = _feed_state(conn, TOP_HEADLINES_FEED)
+        if time.time() - last_fetched_at < HEADLINES_TTL_SECONDS:
+            cache_lookup("headlines_feed", hits=1)
+            return 0
+        cache_lookup("headlines_feed", misses=1)
+        fetched, added, newest = 0, 0, []
+        for batch in iter_top_headlines(max_articles):
+            added += store_articles(TOP_HEADLINES_FEED, batch)
+            fetched += len(batch)
+            newest.append(max(batch, key=lambda a: a.get("publishedAt") or ""))
+        _update_feed_state(TOP_HEADLINES_FEED, None, newest)
+    logging.info(f"Ingested {fetched} top headlines ({added} new).")
+    return added
+
+# Read a feed back in NewsAPI's article shape, newest first
+@timed("store_read")
+def read_feed(feed_key: str, limit: int, from_date=None, to_date=None, seen_since: str = None) -> list:
+    conditions = ["f.feed_key = ?"]
+    params = [feed_key]
+    if from_date is not None:
+        conditions.append("a.published_at >= ?")
+        params.append(_as_date(from_date))
+    if to_date is not None:
+        # Dates are inclusive, so compare against the start of the following day
+        conditions.append("a.published_at < ?")
+        params.append(_as_date(datetime.strptime(_as_date(to_date), "%Y-%m-%d") + timedelta(days=1)))
+    if seen_since is not None:
+        conditions.append("f.last_seen_at >= ?")
+        params.append(seen_since)
+    query = (
+        "SELECT a.payload FROM feed_articles f JOIN articles a ON a.url = f.url "
+        f"WHERE {' AND '.join(conditions)} ORDER BY a.published_at DESC LIMIT ?;"
+    )
+    with _connect() as conn:
+        rows = conn.execute(query, (*params, limit)).fetchall()
+    return [json.loads(payload) for (payload,) in rows]
+
+def read_top_headlines(limit: int) -> list:
+    since = (datetime.now(timezone.utc) - timedelta(hours=HEADLINES_WINDOW_HOURS)).strftime("%Y-%m-%dT%H:%M:%SZ")
+    return read_feed(TOP_HEADLINES_FEED, limit, seen_since=since)
+
+# The search's own NewsAPI results, plus any other stored article the local index matches
+def read_search(query: str, from_date, to_date, limit: int, exact_match: bool = False) -> list:
+    articles = {a.get("url"): a for a in read_feed(search_feed_key(query, exact_match), limit, from_date, to_date)}
+    for a in search_index(query, from_date, to_date, limit, exact_match):
+        articles.setdefault(a.get("url"), a)
+    return sorted(articles.values(), key=lambda a: a.get("publishedAt") or "", reverse=True)[:limit]
+
+_backfilled = False
+
+# Index articles stored before the inverted index existed; runs once per process
+def _backfill_index():
+    global _backfilled
+    if _backfilled:
+        return
+    with _connect() as conn:
+        rows = conn.execute(
+            "SELECT url, published_at, source, title, description FROM articles a "
+            "WHERE NOT EXISTS (SELECT 1 FROM term_postings p WHERE p.url = a.url);"
+        ).fetchall()
+        _index_rows(conn, rows)
+    _backfilled = True
+
+def _has_phrase(positions: list) -> bool:
+    first, rest = positions[0], positions[1:]
+    return any(all(p + i + 1 in later for i, later in enumerate(rest)) for p in first)
+
+# The parts of a NewsAPI query: quoted phrases (optionally +/- prefixed), parentheses,
+# and words, which include the AND / OR / NOT operators
+_QUERY_PART = re.compile(r'[-+]?"[^"]*"|[()]|[^\s()"]+')
+
+# Parse a NewsAPI query into the alternatives it matches, so operators are never looked
+# up as words. Each alternative is a list of (terms, wanted) pairs that must all hold:
+# the phrase `terms` appears in the article, or with `wanted` False, does not.
+def _query_clauses(query: str) -> list:
+    parts = _QUERY_PART.findall(query or "")
+    pos = 0
+
+    def both(left, right):
+        return [a + b for a in left for b in right]
+
+    def any_of():
+        nonlocal pos
+        clauses = all_of()
+        while pos < len(parts) and parts[pos] == "OR":
+            pos += 1
+            clauses = clauses + all_of()
+        return clauses
+
+    def all_of():
+        nonlocal pos
+        clauses = [[]]
+        while pos < len(parts) and parts[pos] not in ("OR", ")"):
+            if parts[pos] == "AND":
+                pos += 1
+                continue
+            clauses = both(clauses, single())
+        return clauses
+
+    def single():
+        nonlocal pos
+        part = parts[pos]
+        pos += 1
+        if part == "NOT":
+            if pos >= len(parts) or parts[pos] in ("OR", ")"):
+                return [[]]
+            negated = [[]]
+            for clause in single():
+                negated = both(negated, [[(terms, not wanted)] for terms, wanted in clause])
+            return negated
+        if part == "(":
+            clauses = any_of()
+            if pos < len(parts) and parts[pos] == ")":
+                pos += 1
+            return clauses
+        terms = tuple(_tokens(part))
+        return [[(terms, not part.startswith("-"))]] if terms else [[]]
+
+    clauses = [[]]
+    while pos < len(parts):
+        if parts[pos] == ")":
+            # Unbalanced; skip it rather than drop the rest of the query
+            pos += 1
+            continue
+        clauses = both(clauses, any_of())
+    return clauses
+
+# Answer a search from the local index alone, newest first. The query is read with
+# NewsAPI's syntax (quoted phrases, +/-, AND / OR / NOT, parentheses); with `exact_match`
+# the whole query is one phrase. `entity` optionally restricts results to articles
+# mentioning that name.
+@timed("index_search")
+def search_index(query: str, from_date=None, to_date=None, limit: int = 100, exact_match: bool = False,
+                 entity: str = None) -> list:
+    _backfill_index()
+    if exact_match:
+        terms = tuple(_tokens(query))
+        clauses = [[(terms, True)]] if terms else [[]]
+    else:
+        clauses = _query_clauses(query)
+    # Candidates hold every wanted word of some alternative; phrases and exclusions are checked after
+    kept, branches, params = [], [], []
+    for clause in clauses:
+        parts = []
+        for term in dict.fromkeys(term for terms, wanted in clause if wanted for term in terms):
+            parts.append("SELECT url FROM term_postings WHERE term = ?")
+            params.append(term)
+        if entity:
+            parts.append("SELECT url FROM entity_postings WHERE entity = ?")
+            params.append(entity.strip())
+        if parts:
+            kept.append(clause)
+            branches.append(f"SELECT url FROM ({' INTERSECT '.join(parts)})")
+    if not branches:
+        return []
+    conditions = [f"a.url IN ({' UNION '.join(branches)})"]
+    if from_date is not None:
+        conditions.append("a.published_at >= ?")
+        params.append(_as_date(from_date))
+    if to_date is not None:
+        conditions.append("a.published_at < ?")
+        params.append(_as_date(datetime.strptime(_as_date(to_date), "%Y-%m-%d") + timedelta(days=1)))
+    where = " AND ".join(conditions)
+    positional = any(len(terms) > 1 or not wanted for clause in kept for terms, wanted in clause)
+    with _connect() as conn:
+        if not positional:
+            rows = conn.execute(
+                f"SELECT a.payload FROM articles a WHERE {where} ORDER BY a.published_at DESC LIMIT ?;",
+                (*params, limit)
+            ).fetchall()
+            return [json.loads(payload) for (payload,) in rows]
+        terms = sorted({term for clause in kept for words, _ in clause for term in words})
+        urls = [url for (url,) in conn.execute(
+            f"SELECT a.url FROM articles a WHERE {where} ORDER BY a.published_at DESC;", params
+        )]
+        matched = []
+        for i in range(0, len(urls), 500):
+            chunk = urls[i:i + 500]
+            positions = {}
+            for url, term, found in conn.execute(
+                f"SELECT url, term, positions FROM term_postings WHERE url IN ({','.join('?' * len(chunk))}) "
+                f"AND term IN ({','.join('?' * len(terms))});",
+                (*chunk, *terms)
+            ):
+                positions.setdefault(url, {})[term] = {int(p) for p in found.split(",")}
+            matched.extend(
+                url for url in chunk
+                if any(
+                    all(_has_phrase([positions.get(url, {}).get(term, set()) for term in words]) == wanted
+                        for words, wanted in clause)
+                    for clause in kept
+                )
+            )
+            if len(matched) >= limit:
+                break
+        matched = matched[:limit]
+        payloads = dict(conn.execute(
+            f"SELECT url, payload FROM articles WHERE url IN ({','.join('?' * len(matched))});", matched
+        ).fetchall()) if matched else {}
+    return [json.loads(payloads[url]) for url in matched]
+
+# Most mentioned entities in stored articles published in the range
+def top_entities(from_date=None, to_date=None, limit: int = 20) -> list:
+    _backfill_index()
+    conditions, params = [], []
+    if from_date is not None:
+        conditions.append("a.published_at >= ?")
+        params.append(_as_date(from_date))
+    if to_date is not None:
+        conditions.append("a.published_at < ?")
+        params.append(_as_date(datetime.strptime(_as_date(to_date), "%Y-%m-%d") + timedelta(days=1)))
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    with _connect() as conn:
+        return conn.execute(
+            "SELECT e.entity, COUNT(*) AS mentions FROM entity_postings e JOIN articles a ON a.url = e.url "
+            f"{where} GROUP BY e.entity ORDER BY mentions DESC, e.entity LIMIT ?;",
+            (*params, limit)
+        ).fetchall()
+
+
+# Rebuild a feed's trend history from the articles already stored, e.g. for a store
+# created before the trend index existed
+def rebuild_trends(feed_key: str):
+    with _connect() as conn:
+        rows = conn.execute(
+            "SELECT a.url, a.published_at, a.source, a.title, a.description "
+            "FROM feed_articles f JOIN articles a ON a.url = f.url WHERE f.feed_key = ?;",
+            (feed_key,)
+        ).fetchall()
+    totals = _trend_totals(feed_key, rows)
+    with _connect() as conn:
+        conn.execute("DELETE FROM trend_buckets WHERE feed_key = ?;", (feed_key,))
+        _add_to_trends(conn, totals)
+
+def _has_trends(conn, feed_key: str) -> bool:
+    return conn.execute(
+        "SELECT 1 FROM trend_buckets WHERE feed_key = ? LIMIT 1;", (feed_key,)
+    ).fetchone() is not None
+
+# Coarsest rollup that still gives a readable number of points for the range
+def pick_granularity(from_date, to_date) -> str:
+    days = (datetime.strptime(_as_date(to_date), "%Y-%m-%d") - datetime.strptime(_as_date(from_date), "%Y-%m-%d")).days
+    return HOUR if days <= 3 else DAY if days <= 120 else WEEK
+
+# Article counts and mean sentiment per bucket for a feed, oldest first. Reads only
+# the precomputed rollups, so the cost depends on the number of buckets, not articles.
+# Rows are (bucket_start, article_count, mean_sentiment), with the source inserted
+# after bucket_start when `by_source` is set.
+def read_trend(feed_key: str, from_date, to_date, granularity: str = None, by_source: bool = False) -> list:
+    granularity = granularity or pick_granularity(from_date, to_date)
+    if granularity not in GRANULARITIES:
+        raise ValueError(f"Unknown trend granularity: {granularity}")
+    start = _as_date(from_date)
+    if granularity == WEEK:
+        day = datetime.strptime(start, "%Y-%m-%d")
+        start = _as_date(day - timedelta(days=day.weekday()))
+    end = _as_date(datetime.strptime(_as_date(to_date), "%Y-%m-%d") + timedelta(days=1))
+    with _connect() as conn:
+        needs_rebuild = not _has_trends(conn, feed_key) and _feed_state(conn, feed_key)[2] > 0
+    if needs_rebuild:
+        rebuild_trends(feed_key)
+    columns = "bucket_start, source" if by_source else "bucket_start"
+    query = (
+        f"SELECT {columns}, SUM(article_count), SUM(sentiment_sum) / SUM(article_count) FROM trend_buckets "
+        "WHERE granularity = ? AND feed_key = ? AND bucket_start >= ? AND bucket_start < ? "
+        f"GROUP BY {columns} ORDER BY {columns};"
+    )
+    with _connect() as conn:
+        return conn.execute(query, (granularity, feed_key, start, end)).fetchall()
@@ -0,0 +1,345 @@
+import io
+import os
+import json
+import time
+import base64
+import hashlib
+import logging
+from typing import TYPE_CHECKING, List, NamedTuple, Optional
+from sentiment_utils import VADER
+from metrics_utils import timed, cache_lookup
+from cache_utils import get_or_compute, lookup, store
+
+# pandas, pyarrow and the NLP stack are imported inside the functions that use them,
+# so importing this module (e.g. for its constants) stays cheap on a cold start.
+if TYPE_CHECKING:
+    import pandas as pd
+
+# Precomputed analysis shared by the dashboard and the digest.
+# One refresh scores the articles, renders the word clouds, detects topics and ranks
+# sources, then writes everything to a single Parquet file: the scored frame as columns
+# and the rest as schema metadata. Readers just load the file.
+# ARTIFACT_DIR is local to each container, so the same Parquet bytes are also put in the
+# shared cache tier; an instance without a fresh local copy loads them from there.
+ARTIFACT_DIR = os.getenv("ARTIFACT_DIR", "artifacts")
+ARTIFACT_TTL_SECONDS = int(os.getenv("ARTIFACT_TTL_SECONDS", "1800"))
+# WEBP and a narrower image shrink the attachment; PNG stays the default for client support
+DIGEST_WORDCLOUD_FORMAT = os.getenv("DIGEST_WORDCLOUD_FORMAT", "PNG").upper()
+DIGEST_WORDCLOUD_WIDTH = int(os.getenv("DIGEST_WORDCLOUD_WIDTH", "800"))
+
+HEADLINES_LABEL = "Top Headlines (Global)"
+# Articles per digest; the dashboard's default view matches it, so both read the same artifact
+DIGEST_ARTICLES = 50
+_METADATA_KEY = b"trendytracker"
+
+class AnalysisArtifact(NamedTuple):
+    # Date, Source, Title, Content, URL, Copies, Sentiment, SentimentLabel, Topic
+    df: "pd.DataFrame"
+    wordcloud: bytes
+    digest_wordcloud: bytes
+    topics: Optional[List[List[str]]]
+    source_stats: "pd.DataFrame"
+    params: dict
+    built_at: float
+
+def articles_frame(articles: list) -> "pd.DataFrame":
+    import pandas as pd
+    data = [{
+        "Date": a.get("publishedAt"),
+        "Source": (a.get("source") or {}).get("name"),
+        "Title": a.get("title"),
+        "Content": a.get("description") or "",
+        "URL": a.get("url"),
+        "Copies": a.get("duplicateCount", 1)
+    } for a in articles if a.get("title")]
+    df = pd.DataFrame(data, columns=["Date", "Source", "Title", "Content", "URL", "Copies"])
+    df["Date"] = pd.to_datetime(df["Date"], errors="coerce", utc=True).dt.tz_localize(None).dt.date
+    return df
+
+def source_stats(df: "pd.DataFrame") -> "pd.DataFrame":
+    return (
+        df.groupby("Source", dropna=True)
+        .agg(Articles=("Content", "count"), Avg_Sentiment=("Sentiment", "mean"))
+        .sort_values("Articles", ascending=False)
+        .head(10)
+    )
+
+# Everything run_analysis and the digest need, computed once from a list of articles.
+# Near-duplicate copies of a story are collapsed first, so a syndicated story is scored,
+# counted and drawn once; its row's Copies column says how many copies were seen.
+# The digest's word cloud is only rendered when `digest_image` is set, i.e. for Top Headlines.
+@timed("analysis")
+def analyze_articles(articles: list, label: str, method: str = VADER, with_topics: bool = True,
+                     n_topics: int = 3, top_words: int = 5, digest_image: bool = False) -> AnalysisArtifact:
+    import pandas as pd
+    from analysis_utils import generate_wordcloud_image, STOPWORDS
+    from dedup_utils import dedupe_articles
+    from sentiment_utils import score_texts, label_sentiment
+    from topic_utils import extract_topics
+    with timed("dedup"):
+        articles = dedupe_articles(articles)
+    df = articles_frame(articles)
+    df["Sentiment"] = score_texts(df["Content"].astype(str), method)
+    df["SentimentLabel"] = df["Sentiment"].map(label_sentiment)
+
+    topics = None
+    df["Topic"] = pd.Series([None] * len(df), dtype="Int64")
+    if with_topics and not df.empty:
+        try:
+            result = extract_topics(df["Content"].astype(str), str(label), n_topics, top_words)
+            topics = result.topics
+            df["Topic"] = pd.Series([None if t is None else t + 1 for t in result.assignments], dtype="Int64")
+        except ValueError:
+            topics = []
+
+    wordcloud = generate_wordcloud_image(
+        articles,
+        custom_stopwords=set(str(label).lower().split()) | STOPWORDS,
+        width=800,
+        height=400,
+        fallback_text="news world update",
+        collocations=True,
+        stopwords_base=STOPWORDS,
+        random_state=42
+    )
+    digest_wordcloud = generate_wordcloud_image(
+        articles,
+        width=DIGEST_WORDCLOUD_WIDTH,
+        height=DIGEST_WORDCLOUD_WIDTH // 2,
+        image_format=DIGEST_WORDCLOUD_FORMAT
+    ) if digest_image else b""
+    return AnalysisArtifact(
+        df=df,
+        wordcloud=wordcloud,
+        digest_wordcloud=digest_wordcloud,
+        topics=topics,
+        source_stats=source_stats(df),
+        params={"label": label, "method": method, "with_topics": with_topics,
+                "n_topics": n_topics, "top_words": top_words},
+        built_at=time.time()
+    )
+
+class ComparisonArtifact(NamedTuple):
+    # One row per (story, topic): Date, Source, Title, Content, URL, Copies, Sentiment, SentimentLabel, Query
+    df: "pd.DataFrame"
+    # Per topic: Articles, Shared, Avg_Sentiment and the Positive/Neutral/Negative shares
+    summary: "pd.DataFrame"
+    # Stories matched by both topics; the diagonal is each topic's own story count
+    overlap: "pd.DataFrame"
+    source_stats: dict
+    queries: List[str]
+    built_at: float
+
+# Side-by-side analysis of several searches, `feeds` mapping each query to its articles.
+# The feeds are pooled before any work is done: an article several queries returned,
+# or a syndicated copy of it, is deduplicated and scored once and then counted under
+# every query it matched, so comparing N topics costs one analysis of their union.
+@timed("comparison")
+def compare_articles(feeds: dict, method: str = VADER) -> ComparisonArtifact:
+    import pandas as pd
+    from collections import Counter
+    from itertools import combinations
+    from dedup_utils import cluster_articles, merge_cluster
+    from sentiment_utils import score_texts, label_sentiment
+    queries = list(feeds)
+    unique, matched = {}, {}
+    for query, articles in feeds.items():
+        for a in articles:
+            key = a.get("url") or id(a)
+            unique.setdefault(key, a)
+            matched.setdefault(key, {})[query] = True
+    with timed("dedup"):
+        clusters = cluster_articles(list(unique.values()))
+    stories = []
+    for cluster in clusters:
+        hits = set()
+        for a in cluster.members:
+            hits.update(matched[a.get("url") or id(a)])
+        story = merge_cluster(cluster)
+        if story.get("title"):
+            stories.append((story, [query for query in queries if query in hits]))
+
+    df = articles_frame([story for story, _ in stories])
+    df["Sentiment"] = score_texts(df["Content"].astype(str), method)
+    df["SentimentLabel"] = df["Sentiment"].map(label_sentiment)
+    df["Query"] = [story_queries for _, story_queries in stories]
+
+    pairs, shared = Counter(), Counter()
+    for _, story_queries in stories:
+        for query in story_queries:
+            pairs[query, query] += 1
+            if len(story_queries) > 1:
+                shared[query] += 1
+        for a, b in combinations(story_queries, 2):
+            pairs[a, b] += 1
+            pairs[b, a] += 1
+    overlap = pd.DataFrame([[pairs[a, b] for b in queries] for a in queries], index=queries, columns=queries)
+
+    df = df.explode("Query", ignore_index=True)
+    summary = (
+        df.groupby("Query")
+        .agg(Articles=("Title", "count"), Avg_Sentiment=("Sentiment", "mean"))
+        .reindex(queries)
+    )
+    summary["Articles"] = summary["Articles"].fillna(0).astype(int)
+    summary.insert(1, "Shared", [shared[query] for query in queries])
+    shares = pd.crosstab(df["Query"], df["SentimentLabel"], normalize="index")
+    summary = summary.join(shares.reindex(index=queries, columns=["Positive", "Neutral", "Negative"], fill_value=0.0))
+    return ComparisonArtifact(
+        df=df,
+        summary=summary,
+        overlap=overlap,
+        source_stats={query: source_stats(df[df["Query"] == query]) for query in queries},
+        queries=queries,
+        built_at=time.time()
+    )
+
+# Identifies an article set by content, so the same set fetched by another process or
+# instance maps to the same cache entry
+def articles_digest(articles: list) -> str:
+    payload = json.dumps(articles, sort_keys=True, default=str).encode("utf-8")
+    return hashlib.blake2b(payload, digest_size=16).hexdigest()
+
+# analyze_articles through the shared cache, for searches that have no artifact file
+def get_search_artifact(articles: list, label: str, method: str = VADER, with_topics: bool = True,
+                        n_topics: int = 3, top_words: int = 5) -> AnalysisArtifact:
+    parts = (articles_digest(articles), label, method, with_topics, n_topics, top_words)
+    return get_or_compute(
+        "analysis", parts,
+        lambda: analyze_articles(articles, label, method, with_topics, n_topics, top_words),
+        ARTIFACT_TTL_SECONDS
+    )
+
+def get_comparison_artifact(feeds: dict, method: str = VADER) -> ComparisonArtifact:
+    parts = (tuple((query, articles_digest(articles)) for query, articles in feeds.items()), method)
+    return get_or_compute("comparison", parts, lambda: compare_articles(feeds, method), ARTIFACT_TTL_SECONDS)
+
+def _artifact_path(name: str) -> str:
+    return os.path.join(ARTIFACT_DIR, f"{name}.parquet")
+
+def _artifact_bytes(artifact: AnalysisArtifact) -> bytes:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    meta = {
+        "wordcloud": base64.b64encode(artifact.wordcloud).decode(),
+        "digest_wordcloud": base64.b64encode(artifact.digest_wordcloud).decode(),
+        "digest_wordcloud_format": DIGEST_WORDCLOUD_FORMAT,
+        "topics": artifact.topics,
+        "source_stats": artifact.source_stats.reset_index().to_dict(orient="records"),
+        "params": artifact.params,
+        "built_at": artifact.built_at,
+    }
+    table = pa.Table.from_pandas(artifact.df, preserve_index=False)
+    table = table.replace_schema_metadata({**(table.schema.metadata or {}), _METADATA_KEY: json.dumps(meta)})
+    buffer = io.BytesIO()
+    pq.write_table(table, buffer, compression="zstd")
+    return buffer.getvalue()
+
+def save_artifact(name: str, artifact: AnalysisArtifact):
+    data = _artifact_bytes(artifact)
+    store("artifact", (name,), data, ARTIFACT_TTL_SECONDS)
+    os.makedirs(ARTIFACT_DIR, exist_ok=True)
+    # Write then rename, so readers never see a half-written file
+    path = _artifact_path(name)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+# None when the artifact was written for another digest image format
+def _read_artifact(source) -> Optional[AnalysisArtifact]:
+    import pyarrow.parquet as pq
+    table = pq.read_table(source)
+    meta = json.loads(table.schema.metadata[_METADATA_KEY])
+    if meta.get("digest_wordcloud_format") != DIGEST_WORDCLOUD_FORMAT:
+        return None
+    import pandas as pd
+    stats = pd.DataFrame.from_records(meta["source_stats"], columns=["Source", "Articles", "Avg_Sentiment"])
+    return AnalysisArtifact(
+        df=table.to_pandas(),
+        wordcloud=base64.b64decode(meta["wordcloud"]),
+        digest_wordcloud=base64.b64decode(meta["digest_wordcloud"]),
+        topics=meta["topics"],
+        source_stats=stats.set_index("Source"),
+        params=meta["params"],
+        built_at=meta["built_at"]
+    )
+
+# Returns None when the artifact is missing, unreadable or older than `max_age` seconds.
+# The local file is tried first, then the copy another instance put in the shared cache.
+def load_artifact(name: str, max_age: float = ARTIFACT_TTL_SECONDS) -> Optional[AnalysisArtifact]:
+    path = _artifact_path(name)
+    try:
+        if time.time() - os.path.getmtime(path) <= max_age:
+            artifact = _read_artifact(path)
+            if artifact is not None:
+                return artifact
+    except (OSError, KeyError, ValueError) as e:
+        if not isinstance(e, FileNotFoundError):
+            logging.warning(f"Could not read analysis artifact {path}: {e}")
+    data = lookup("artifact", (name,))
+    if data is None:
+        return None
+    try:
+        artifact = _read_artifact(io.BytesIO(data))
+    except (OSError, KeyError, ValueError) as e:
+        logging.warning(f"Could not read shared analysis artifact {name}: {e}")
+        return None
+    if artifact is None or time.time() - artifact.built_at > max_age:
+        return None
+    return artifact
+
+def _options_suffix(max_articles: int, method: str, with_topics: bool, n_topics: int, top_words: int) -> str:
+    topics = f"{n_topics}x{top_words}" if with_topics else "notopics"
+    return f"{max_articles}-{method}-{topics}"
+
+def headlines_artifact_name(max_articles: int, method: str = VADER, with_topics: bool = True,
+                            n_topics: int = 3, top_words: int = 5) -> str:
+    return f"top_headlines-{_options_suffix(max_articles, method, with_topics, n_topics, top_words)}"
+
+def keywords_label(keywords) -> str:
+    return ", ".join(keywords)
+
+def keywords_artifact_name(keywords, max_articles: int, method: str = VADER, with_topics: bool = True,
+                           n_topics: int = 3, top_words: int = 5) -> str:
+    digest = hashlib.blake2b("\0".join(keywords).encode("utf-8"), digest_size=8).hexdigest()
+    return f"keywords_{digest}-{_options_suffix(max_articles, method, with_topics, n_topics, top_words)}"
+
+# Load the named artifact, rebuilding it from `articles_fn(max_articles)` when it is
+# missing or stale (or `refresh` is set). The refresh job and both services share this path.
+# `digest_image` renders the email's word cloud too, for the artifacts the digest sends.
+def _get_artifact(name: str, label: str, articles_fn, max_articles: int, method: str, with_topics: bool,
+                  n_topics: int, top_words: int, refresh: bool, digest_image: bool) -> Optional[AnalysisArtifact]:
+    if not refresh:
+        with timed("artifact_load"):
+            artifact = load_artifact(name)
+        cache_lookup("artifact", hits=int(artifact is not None), misses=int(artifact is None))
+        if artifact is not None:
+            return artifact
+    articles = articles_fn(max_articles)
+    if not articles:
+        return None
+    artifact = analyze_articles(articles, label, method, with_topics, n_topics, top_words, digest_image=digest_image)
+    try:
+        with timed("artifact_save"):
+            save_artifact(name, artifact)
+    except Exception as e:
+        logging.warning(f"Could not save analysis artifact {name}: {e}")
+    return artifact
+
+# Load the Top Headlines artifact for these options, rebuilding it from `articles_fn()`
+# when it is missing or stale. Only the digest's own options get the email word cloud.
+def get_headlines_artifact(articles_fn, max_articles: int = DIGEST_ARTICLES, method: str = VADER, with_topics: bool = True,
+                           n_topics: int = 3, top_words: int = 5, refresh: bool = False) -> Optional[AnalysisArtifact]:
+    name = headlines_artifact_name(max_articles, method, with_topics, n_topics, top_words)
+    return _get_artifact(name, HEADLINES_LABEL, articles_fn, max_articles, method, with_topics,
+                         n_topics, top_words, refresh, digest_image=name == headlines_artifact_name(DIGEST_ARTICLES))
+
+# The same for a keyword preference group's digest; `articles_fn(keywords, max_articles)`
+def get_keywords_artifact(keywords, articles_fn, max_articles: int = DIGEST_ARTICLES, method: str = VADER,
+                          with_topics: bool = True, n_topics: int = 3, top_words: int = 5,
+                          refresh: bool = False) -> Optional[AnalysisArtifact]:
+    keywords = tuple(keywords)
+    name = keywords_artifact_name(keywords, max_articles, method, with_topics, n_topics, top_words)
+    return _get_artifact(name, keywords_label(keywords), lambda limit: articles_fn(keywords, limit), max_articles,
+                         method, with_topics, n_topics, top_words, refresh, digest_image=True)
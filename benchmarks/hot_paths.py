@@ -0,0 +1,595 @@
+"""Throughput, latency and memory benchmarks for the analysis and digest hot paths.
+
+Each case runs in a fresh interpreter against a copy of the digest image's file
+layout (see import_time.digest_layout), on synthetic NewsAPI-shaped articles and
+subscribers generated from a fixed seed. NewsAPI, Brevo and Postgres are replaced
+by in-process fakes, so results depend only on this code and the machine:
+
+    ingest     fake NewsAPI pages -> article store, including indexing and trend rollups
+    dedup      MinHash/LSH near-duplicate clustering
+    sentiment  VADER scoring with a cold cache
+    wordcloud  word cloud rendering with a cold cache
+    topics     LDA topic extraction with cold model and result caches
+    analysis   analyze_articles, i.e. everything run_analysis charts
+    cache      storing a fetch result in the shared cache tier and reading it back
+               with an empty memory tier, as another instance would (SQLite, or a
+               fake Redis client with --cache-backend redis)
+    digest     run_digest over N subscribers in keyword groups (fake Brevo and Postgres)
+
+Article cases are sized in articles and the digest in subscribers. The digest's
+analyses are built before timing starts, as /refresh-artifact would, so its runs
+measure grouping, rendering and fan-out. The first run of a case (imports, lexicons,
+models) is reported separately; latency percentiles are over the `--repeat` runs
+after it, throughput is items per second at the median, and peak RSS is that of
+the case's own process (sentiment worker processes are not included).
+
+    python benchmarks/hot_paths.py [--stage NAME ...] [--sizes 100 1000 ...]
+        [--subscribers 1000 10000 ...] [--repeat N] [--seed N] [--brevo-latency SECONDS]
+        [--cache-backend sqlite|redis]
+        [--output FILE] [--compare FILE] [--tolerance RATIO]
+
+Prints one JSON report. With --compare, a case whose p50 latency or peak RSS grew by
+more than the tolerance over an earlier report counts as a regression, and the exit
+code is 1, as it is when any case fails.
+"""
+import os
+import sys
+import json
+import math
+import logging
+import time
+import random
+import bisect
+import argparse
+import platform
+import resource
+import itertools
+import threading
+import statistics
+import subprocess
+import tempfile
+import fnmatch
+from collections import Counter
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from import_time import ROOT, digest_layout
+
+ARTICLE_STAGES = ("ingest", "dedup", "sentiment", "wordcloud", "topics", "analysis", "cache")
+STAGES = ARTICLE_STAGES + ("digest",)
+DEFAULT_SIZES = [100, 1000, 10000]
+DEFAULT_SUBSCRIBERS = [1000, 10000]
+# Synthetic articles are published in the week before this instant, so every run sees the same data
+ANCHOR = datetime(2024, 6, 3, 12, 0, 0)
+# Articles available to the digest's headlines and keyword groups
+DIGEST_ARTICLE_POOL = 2000
+
+_SYLLABLES = ["ka", "lo", "mi", "ra", "ten", "vor", "sel", "dan", "qui", "pe", "zo", "ton", "mar", "bel", "ri", "sa"]
+_SENTIMENT_WORDS = [
+    "good", "great", "strong", "win", "hope", "growth", "record", "calm", "praise", "support",
+    "crisis", "attack", "fear", "loss", "decline", "scandal", "warning", "crash", "threat", "dispute",
+]
+_NAMES = ["Alder", "Brenn", "Castor", "Dalia", "Everett", "Farrow", "Galen", "Hollis", "Ivor", "Juno"]
+_SOURCES = [f"Synthetic Wire {i:02d}" for i in range(40)]
+
+# ---------------------------------------------------------------------------
+# Synthetic data
+# ---------------------------------------------------------------------------
+
+def _vocabulary(rng: random.Random, size: int = 5000) -> list:
+    words = set()
+    while len(words) < size:
+        words.add("".join(rng.choice(_SYLLABLES) for _ in range(rng.randint(2, 4))))
+    # Shuffled, so word frequency does not follow alphabetical order
+    words = sorted(words)
+    rng.shuffle(words)
+    return words
+
+class _Writer:
+    # Zipf-distributed words, so word clouds, topics and the index see a realistic skew
+    def __init__(self, rng: random.Random):
+        self.rng = rng
+        self.vocabulary = _vocabulary(rng)
+        self.cum_weights = list(itertools.accumulate(1 / (rank + 1) for rank in range(len(self.vocabulary))))
+
+    def words(self, count: int) -> list:
+        return self.rng.choices(self.vocabulary, cum_weights=self.cum_weights, k=count)
+
+    def sentence(self, low: int, high: int) -> str:
+        words = self.words(self.rng.randint(low, high))
+        words.insert(self.rng.randrange(len(words) + 1), self.rng.choice(_SENTIMENT_WORDS))
+        if self.rng.random() < 0.5:
+            words.insert(self.rng.randrange(len(words) + 1), " ".join(self.rng.sample(_NAMES, 2)))
+        return " ".join(words)
+
+# `n` NewsAPI-shaped articles published over the week before ANCHOR. About
+# `duplicate_ratio` of them are lightly edited copies of an earlier story from
+# another source, like syndicated wire stories.
+def synthetic_articles(n: int, seed: int = 1, duplicate_ratio: float = 0.2) -> list:
+    rng = random.Random(seed)
+    writer = _Writer(rng)
+    articles = []
+    for i in range(n):
+        published = ANCHOR - timedelta(seconds=rng.randrange(7 * 24 * 3600))
+        if articles and rng.random() < duplicate_ratio:
+            original = rng.choice(articles)
+            words = original["description"].split()
+            words[rng.randrange(len(words))] = writer.words(1)[0]
+            title, description = original["title"], " ".join(words)
+        else:
+            title = writer.sentence(6, 12).capitalize()
+            description = writer.sentence(20, 40).capitalize() + "."
+        articles.append({
+            "source": {"id": None, "name": rng.choice(_SOURCES)},
+            "author": None,
+            "title": title,
+            "description": description,
+            "url": f"https://news.example/{seed}/{i}",
+            "urlToImage": None,
+            "publishedAt": published.strftime("%Y-%m-%dT%H:%M:%SZ"),
+            "content": description,
+        })
+    return articles
+
+# Keyword preference groups drawn from the most frequent words, so every group has articles
+def synthetic_keyword_groups(seed: int = 1) -> list:
+    vocabulary = _Writer(random.Random(seed)).vocabulary
+    return [(vocabulary[0],), tuple(sorted(vocabulary[1:3])), (vocabulary[3],), tuple(sorted(vocabulary[4:6]))]
+
+# (id, name, email, keywords) rows; `keyword_share` of subscribers are in a keyword group
+def synthetic_subscribers(n: int, seed: int = 1, keyword_share: float = 0.2) -> list:
+    rng = random.Random(seed)
+    groups = synthetic_keyword_groups(seed)
+    return [
+        (i, f"Subscriber {i}", f"subscriber{i}@example.test",
+         rng.choice(groups) if rng.random() < keyword_share else ())
+        for i in range(1, n + 1)
+    ]
+
+# ---------------------------------------------------------------------------
+# Fakes for NewsAPI, Brevo and Postgres
+# ---------------------------------------------------------------------------
+
+class _FakeResponse:
+    def __init__(self, data: dict):
+        self.status_code = 200
+        self.headers = {}
+        self.content = b"{}"
+        self._data = data
+
+    def json(self):
+        return self._data
+
+    def raise_for_status(self):
+        pass
+
+# Stands in for newsapi_client's requests session: pages through a fixed article set,
+# newest first, honouring the `from`/`to` window of /everything like NewsAPI does
+class FakeNewsAPI:
+    def __init__(self, articles: list):
+        self.articles = sorted(articles, key=lambda a: a["publishedAt"])
+        self.published = [a["publishedAt"][:19] for a in self.articles]
+        self.requests = 0
+        self._lock = threading.Lock()
+
+    def get(self, url, params=None, timeout=None):
+        params = params or {}
+        with self._lock:
+            self.requests += 1
+        low, high = 0, len(self.articles)
+        if url.endswith("/everything"):
+            low = bisect.bisect_left(self.published, params["from"][:19])
+            high = bisect.bisect_right(self.published, params["to"][:19])
+        size, page = int(params.get("pageSize", 100)), int(params.get("page", 1))
+        window = self.articles[low:high][::-1]
+        return _FakeResponse({
+            "status": "ok",
+            "totalResults": len(window),
+            "articles": window[(page - 1) * size:page * size],
+        })
+
+# Accepts every message, optionally after a fixed network delay, and counts recipients
+class FakeBrevoApi:
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.calls = 0
+        self.recipients = 0
+        self._lock = threading.Lock()
+
+    def send_transac_email(self, message):
+        if self.latency:
+            time.sleep(self.latency)
+        with self._lock:
+            self.calls += 1
+            self.recipients += len(message.message_versions or [])
+
+# The redis-py calls cache_utils.RedisCache makes, against a dict with expiry times
+class FakeRedis:
+    def __init__(self):
+        self.entries = {}
+        self._lock = threading.Lock()
+
+    def _live(self, key):
+        entry = self.entries.get(key)
+        if entry is not None and entry[1] <= time.time():
+            del self.entries[key]
+            return None
+        return entry
+
+    def get(self, key):
+        with self._lock:
+            entry = self._live(key)
+        return entry[0] if entry else None
+
+    def set(self, key, value, px=None, nx=False):
+        if isinstance(value, str):
+            value = value.encode()
+        with self._lock:
+            if nx and self._live(key):
+                return None
+            self.entries[key] = (value, time.time() + px / 1000 if px else float("inf"))
+        return True
+
+    def pttl(self, key):
+        with self._lock:
+            entry = self._live(key)
+        if entry is None:
+            return -2
+        return -1 if entry[1] == float("inf") else int((entry[1] - time.time()) * 1000)
+
+    def delete(self, key):
+        with self._lock:
+            self.entries.pop(key, None)
+
+    def scan_iter(self, match="*"):
+        with self._lock:
+            return [key for key in list(self.entries) if fnmatch.fnmatch(key, match)]
+
+# In-memory versions of the db_utils functions the digest runner calls
+class FakeSubscriberDB:
+    def __init__(self, subscribers: list):
+        self.subscribers = subscribers
+        self.send_log = {}
+        self.checkpoints = {}
+
+    def _pending(self, digest_date, after_id=0, until_id=None, shard=None, keywords=None):
+        for subscriber_id, name, email, subscriber_keywords in self.subscribers:
+            if subscriber_id <= after_id or (until_id is not None and subscriber_id > until_id):
+                continue
+            if shard is not None and subscriber_id % shard[1] != shard[0]:
+                continue
+            if keywords is not None and subscriber_keywords != tuple(keywords):
+                continue
+            if digest_date is not None and self.send_log.get((digest_date, subscriber_id)) == "sent":
+                continue
+            yield subscriber_id, name, email, subscriber_keywords
+
+    def iter_subscribers(self, batch_size=1000, after_id=0, digest_date=None, until_id=None, shard=None,
+                         keywords=None):
+        for subscriber_id, name, email, _ in self._pending(digest_date, after_id, until_id, shard, keywords):
+            yield subscriber_id, name, email
+
+    def preference_groups(self, digest_date, after_id=0, until_id=None, shard=None):
+        counts = Counter(row[3] for row in self._pending(digest_date, after_id, until_id, shard))
+        return sorted(counts.items(), key=lambda item: (-item[1], item[0]))
+
+    def record_deliveries(self, digest_date, results):
+        for (subscriber_id, _, _), error in results:
+            if self.send_log.get((digest_date, subscriber_id)) != "sent":
+                self.send_log[(digest_date, subscriber_id)] = "sent" if error is None else "failed"
+
+    def get_checkpoint(self, digest_date, shard_key="all"):
+        return dict(self.checkpoints.get((digest_date, shard_key)) or {
+            "last_subscriber_id": 0, "sent_count": 0, "failed_count": 0, "completed": False, "elapsed_seconds": 0.0
+        })
+
+    def save_checkpoint(self, digest_date, shard_key, last_subscriber_id, sent, failed, completed,
+                        elapsed_seconds=0.0):
+        checkpoint = self.get_checkpoint(digest_date, shard_key)
+        checkpoint["last_subscriber_id"] = max(checkpoint["last_subscriber_id"], last_subscriber_id)
+        checkpoint["sent_count"] += sent
+        checkpoint["failed_count"] += failed
+        checkpoint["completed"] = checkpoint["completed"] or completed
+        checkpoint["elapsed_seconds"] += elapsed_seconds
+        self.checkpoints[(digest_date, shard_key)] = checkpoint
+
+    def list_checkpoints(self, digest_date):
+        return [{"shard_key": key, **checkpoint, "updated_at": None}
+                for (day, key), checkpoint in sorted(self.checkpoints.items()) if day == digest_date]
+
+    # Point the digest runner's database calls at this instance
+    def install(self, module):
+        for name in ("iter_subscribers", "preference_groups", "record_deliveries", "get_checkpoint",
+                     "save_checkpoint", "list_checkpoints"):
+            setattr(module, name, getattr(self, name))
+        module.ensure_schema = lambda: None
+
+# ---------------------------------------------------------------------------
+# Cases (run inside the child process)
+# ---------------------------------------------------------------------------
+
+def _reset_caches():
+    import sentiment_utils
+    import topic_utils
+    import cache_utils
+    with sentiment_utils._cache_lock:
+        sentiment_utils._cache.clear()
+    with topic_utils._lock:
+        topic_utils._models.clear()
+        topic_utils._results.clear()
+    cache_utils.clear_cache()
+
+def _ingest_case(size, seed, options, workdir):
+    import newsapi_client
+    import article_store
+    fake = FakeNewsAPI(synthetic_articles(size, seed))
+    newsapi_client._session = fake
+    stores = itertools.count()
+
+    def run():
+        _reset_caches()
+        # A new store each run, so every run ingests the full week
+        article_store.ARTICLE_STORE_PATH = os.path.join(workdir, f"articles-{next(stores)}.db")
+        article_store._schema_ready = False
+        added = article_store.ingest_search("benchmark", (ANCHOR - timedelta(days=7)).date(), ANCHOR.date(), size)
+        return {"stored": added, "newsapi_requests": fake.requests}
+    return run
+
+def _dedup_case(size, seed, options, workdir):
+    from dedup_utils import dedupe_articles
+    articles = synthetic_articles(size, seed)
+    return lambda: {"stories": len(dedupe_articles(articles))}
+
+def _sentiment_case(size, seed, options, workdir):
+    from sentiment_utils import score_texts, VADER
+    texts = [a["description"] for a in synthetic_articles(size, seed)]
+
+    def run():
+        _reset_caches()
+        score_texts(texts, VADER)
+    return run
+
+def _wordcloud_case(size, seed, options, workdir):
+    from analysis_utils import generate_wordcloud_image
+    articles = synthetic_articles(size, seed)
+
+    def run():
+        _reset_caches()
+        return {"image_bytes": len(generate_wordcloud_image(articles, random_state=42))}
+    return run
+
+def _topics_case(size, seed, options, workdir):
+    from topic_utils import extract_topics
+    texts = [a["description"] for a in synthetic_articles(size, seed)]
+
+    def run():
+        _reset_caches()
+        extract_topics(texts, "benchmark", 3, 5)
+    return run
+
+def _analysis_case(size, seed, options, workdir):
+    from artifact_utils import analyze_articles
+    articles = synthetic_articles(size, seed)
+
+    def run():
+        _reset_caches()
+        return {"stories": len(analyze_articles(articles, "benchmark").df)}
+    return run
+
+def _digest_case(size, seed, options, workdir):
+    import digest_runner
+    import email_utils
+    articles = synthetic_articles(DIGEST_ARTICLE_POOL, seed)
+    api = FakeBrevoApi(options.brevo_latency)
+
+    def keyword_news(keywords, limit):
+        wanted = set(keywords)
+        return [a for a in articles if wanted & set(f"{a['title']} {a['description']}".lower().split())][:limit]
+
+    digest_runner.fetch_top_headlines = lambda limit: articles[:limit]
+    digest_runner.fetch_keyword_news = keyword_news
+    digest_runner.send_digest_to_all = lambda *args, **kwargs: email_utils.send_digest_to_all(*args, api=api, **kwargs)
+    subscribers = synthetic_subscribers(size, seed)
+    for keywords in [()] + synthetic_keyword_groups(seed):
+        digest_runner.group_artifact(keywords)
+    dates = itertools.count()
+
+    def run():
+        # A fresh send log each run, so every run delivers to everyone
+        FakeSubscriberDB(subscribers).install(digest_runner)
+        calls_before = api.calls
+        result = digest_runner.run_digest(ANCHOR.date() + timedelta(days=next(dates)), time_budget=24 * 3600)
+        if result["status"] != "complete":
+            raise RuntimeError(f"Digest run ended with status {result['status']}: {result['report']}")
+        return {"sent": result["report"]["sent"], "groups": len(result["groups"]), "api_calls": api.calls - calls_before}
+    return run
+
+def _cache_case(size, seed, options, workdir):
+    import pickle
+    import cache_utils
+    if options.cache_backend == "redis":
+        cache_utils.configure_cache(cache_utils.RedisCache(FakeRedis()))
+    articles = synthetic_articles(size, seed)
+    keys = itertools.count()
+
+    def run():
+        key = (next(keys),)
+        cache_utils.get_or_compute("benchmark", key, lambda: articles, 3600)
+        # Another instance starts with an empty memory tier and only has the shared one
+        cache_utils._memory.clear()
+        restored = cache_utils.get_or_compute("benchmark", key, lambda: [], 3600)
+        return {"articles": len(restored), "entry_bytes": len(pickle.dumps(articles, protocol=pickle.HIGHEST_PROTOCOL))}
+    return run
+
+CASES = {
+    "ingest": _ingest_case,
+    "dedup": _dedup_case,
+    "sentiment": _sentiment_case,
+    "wordcloud": _wordcloud_case,
+    "topics": _topics_case,
+    "analysis": _analysis_case,
+    "digest": _digest_case,
+    "cache": _cache_case,
+}
+
+def _peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+def percentile(values: list, q: float) -> float:
+    ordered = sorted(values)
+    return ordered[max(math.ceil(q * len(ordered)) - 1, 0)]
+
+def run_case(stage: str, size: int, repeat: int, seed: int, options) -> dict:
+    logging.basicConfig(level=logging.WARNING)
+    with tempfile.TemporaryDirectory() as workdir:
+        run = CASES[stage](size, seed, options, workdir)
+        baseline_rss = _peak_rss_mb()
+        started = time.perf_counter()
+        run()
+        first_run = time.perf_counter() - started
+        timings, details = [], None
+        for _ in range(repeat):
+            started = time.perf_counter()
+            details = run()
+            timings.append(time.perf_counter() - started)
+    p50 = statistics.median(timings)
+    return {
+        "stage": stage,
+        "size": size,
+        "unit": "subscribers" if stage == "digest" else "articles",
+        "ok": True,
+        "runs": repeat,
+        "first_run_seconds": round(first_run, 4),
+        "mean_seconds": round(statistics.mean(timings), 4),
+        "p50_seconds": round(p50, 4),
+        "p95_seconds": round(percentile(timings, 0.95), 4),
+        "p99_seconds": round(percentile(timings, 0.99), 4),
+        "throughput_per_second": round(size / p50, 1) if p50 else None,
+        "baseline_rss_mb": round(baseline_rss, 1),
+        "peak_rss_mb": round(_peak_rss_mb(), 1),
+        "details": details or {},
+    }
+
+# ---------------------------------------------------------------------------
+# Driver
+# ---------------------------------------------------------------------------
+
+def _child_env(layout: str, workdir: str) -> dict:
+    env = {**os.environ, "PYTHONDONTWRITEBYTECODE": "1", "PYTHONPATH": layout}
+    # Explicit settings from the caller's environment win over these defaults
+    defaults = {
+        "NEWS_API_KEY": "benchmark",
+        "NEWS_API_RATE_PER_SECOND": "0",
+        "DELIVERY_RATE_PER_SECOND": "0",
+        "ARTICLE_STORE_PATH": os.path.join(workdir, "articles.db"),
+        "ARTIFACT_DIR": os.path.join(workdir, "artifacts"),
+        "ARTIFACT_TTL_SECONDS": str(7 * 24 * 3600),
+        "CACHE_PATH": os.path.join(workdir, "cache.db"),
+        "TEMPLATE_DIR": layout,
+        "UNSUBSCRIBE_SECRET": "benchmark",
+        "DASHBOARD_URL": "https://dashboard.example",
+    }
+    for name, value in defaults.items():
+        env.setdefault(name, value)
+    return env
+
+def run_isolated(stage: str, size: int, args, layout: str) -> dict:
+    with tempfile.TemporaryDirectory() as workdir:
+        command = [
+            sys.executable, os.path.abspath(__file__), "--case", stage, str(size),
+            "--repeat", str(args.repeat), "--seed", str(args.seed), "--brevo-latency", str(args.brevo_latency),
+            "--cache-backend", args.cache_backend,
+        ]
+        proc = subprocess.run(command, cwd=layout, env=_child_env(layout, workdir), capture_output=True, text=True)
+    if proc.returncode != 0:
+        lines = proc.stderr.strip().splitlines()
+        return {"stage": stage, "size": size, "ok": False, "error": lines[-1] if lines else "benchmark failed"}
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+# Mark cases whose p50 latency or peak RSS grew by more than `tolerance` over `baseline`
+def compare(results: list, baseline: dict, tolerance: float) -> bool:
+    previous = {(r["stage"], r["size"]): r for r in baseline.get("results", []) if r.get("ok")}
+    regressed = False
+    for result in results:
+        before = previous.get((result["stage"], result["size"]))
+        if not result.get("ok") or before is None:
+            continue
+        changes = {}
+        for field in ("p50_seconds", "peak_rss_mb"):
+            if before[field]:
+                changes[field] = round(result[field] / before[field] - 1, 3)
+        result["change"] = changes
+        result["regressed"] = any(change > tolerance for change in changes.values())
+        regressed = regressed or result["regressed"]
+    return regressed
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the analysis and digest hot paths on synthetic data.")
+    parser.add_argument("--stage", action="append", choices=STAGES, help="Only run these stages")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES,
+                        help="Article counts for the article stages, e.g. 100 1000 10000 100000")
+    parser.add_argument("--subscribers", type=int, nargs="+", default=DEFAULT_SUBSCRIBERS,
+                        help="Subscriber counts for the digest stage")
+    parser.add_argument("--repeat", type=int, default=5, help="Timed runs per case, after one warm-up run")
+    parser.add_argument("--seed", type=int, default=1, help="Seed for the synthetic data")
+    parser.add_argument("--brevo-latency", type=float, default=0.0, help="Seconds the fake Brevo API takes per call")
+    parser.add_argument("--cache-backend", choices=("sqlite", "redis"), default="sqlite",
+                        help="Shared tier for the cache stage; redis uses an in-process fake client")
+    parser.add_argument("--output", help="Also write the JSON report to this file")
+    parser.add_argument("--compare", help="Earlier report to check for regressions against")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed relative growth before a regression")
+    parser.add_argument("--case", nargs=2, metavar=("STAGE", "SIZE"), help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.case:
+        print(json.dumps(run_case(args.case[0], int(args.case[1]), args.repeat, args.seed, args)))
+        return 0
+
+    cases = [
+        (stage, size)
+        for stage in (args.stage or STAGES)
+        for size in (args.subscribers if stage == "digest" else args.sizes)
+    ]
+    with tempfile.TemporaryDirectory() as layout:
+        digest_layout(layout)
+        results = []
+        for stage, size in cases:
+            print(f"Running {stage} x {size}...", file=sys.stderr)
+            results.append(run_isolated(stage, size, args, layout))
+
+    regressed = False
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            regressed = compare(results, json.load(f), args.tolerance)
+    report = {
+        "commit": _git_commit(),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "seed": args.seed,
+        "repeat": args.repeat,
+        "brevo_latency_seconds": args.brevo_latency,
+        "cache_backend": args.cache_backend,
+        "ok": all(r["ok"] for r in results) and not regressed,
+        "results": results,
+    }
+
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    return 0 if report["ok"] else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
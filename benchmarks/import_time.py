@@ -0,0 +1,106 @@
+"""Cold-start import budget for the dashboard and the digest service.
+
+Each target's modules are imported in a fresh interpreter, `repeat` times, and the
+median wall time is compared with the budget in import_budget.json. A target also
+fails if any of its `forbidden` heavy packages ended up in sys.modules, i.e. they
+are no longer deferred to the feature that needs them.
+
+The digest is measured against a copy of the files laid out the way
+DailyDigest/Dockerfile builds the image (headless modules renamed to their
+expected names), so it sees exactly what the container imports.
+
+    python benchmarks/import_time.py [--budget FILE] [--output FILE] [--target NAME]
+
+Prints one JSON report and exits 1 when any target is over budget.
+"""
+import os
+import sys
+import json
+import glob
+import shutil
+import argparse
+import statistics
+import subprocess
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_BUDGET = os.path.join(os.path.dirname(os.path.abspath(__file__)), "import_budget.json")
+
+_PROBE = """
+import sys, json, time
+start = time.perf_counter()
+for name in {modules!r}:
+    __import__(name)
+elapsed = time.perf_counter() - start
+loaded = sorted({{name.split(".")[0] for name in sys.modules}})
+print(json.dumps({{"seconds": elapsed, "loaded": loaded}}))
+"""
+
+# Mirror DailyDigest/Dockerfile: shared modules, headless renames, then the service files
+def digest_layout(target_dir: str) -> str:
+    for path in glob.glob(os.path.join(ROOT, "*.py")):
+        shutil.copy(path, target_dir)
+    shutil.copy(os.path.join(ROOT, "db_utils_headless.py"), os.path.join(target_dir, "db_utils.py"))
+    shutil.copy(os.path.join(ROOT, "news_utils_headless.py"), os.path.join(target_dir, "news_utils.py"))
+    for path in glob.glob(os.path.join(ROOT, "DailyDigest", "*")):
+        if os.path.isfile(path) and not path.endswith("Dockerfile"):
+            shutil.copy(path, target_dir)
+    return target_dir
+
+def probe(modules, cwd: str) -> dict:
+    env = {**os.environ, "PYTHONDONTWRITEBYTECODE": "1", "PYTHONPATH": cwd}
+    proc = subprocess.run(
+        [sys.executable, "-c", _PROBE.format(modules=list(modules))],
+        cwd=cwd, env=env, capture_output=True, text=True
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else "import failed")
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+def measure(name: str, spec: dict, repeat: int) -> dict:
+    result = {"target": name, "budget_seconds": spec["max_seconds"]}
+    with tempfile.TemporaryDirectory() as tmp:
+        cwd = digest_layout(tmp) if name == "digest" else ROOT
+        try:
+            # The first run warms the OS file cache and byte-compiles; it is not counted
+            probe(spec["modules"], cwd)
+            runs = [probe(spec["modules"], cwd) for _ in range(repeat)]
+        except RuntimeError as e:
+            return {**result, "ok": False, "error": str(e)}
+    timings = [run["seconds"] for run in runs]
+    forbidden = sorted(set(spec.get("forbidden", [])) & set(runs[-1]["loaded"]))
+    median = statistics.median(timings)
+    return {
+        **result,
+        "median_seconds": round(median, 4),
+        "min_seconds": round(min(timings), 4),
+        "max_seconds": round(max(timings), 4),
+        "forbidden_loaded": forbidden,
+        "ok": median <= spec["max_seconds"] and not forbidden,
+    }
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Check cold-start import time against a budget.")
+    parser.add_argument("--budget", default=DEFAULT_BUDGET, help="Budget JSON file")
+    parser.add_argument("--output", help="Also write the JSON report to this file")
+    parser.add_argument("--target", action="append", help="Only measure these targets")
+    args = parser.parse_args(argv)
+
+    with open(args.budget, encoding="utf-8") as f:
+        budget = json.load(f)
+    targets = {
+        name: spec for name, spec in budget["targets"].items()
+        if not args.target or name in args.target
+    }
+    results = [measure(name, spec, budget.get("repeat", 5)) for name, spec in targets.items()]
+    report = {"python": sys.version.split()[0], "ok": all(r["ok"] for r in results), "results": results}
+
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    return 0 if report["ok"] else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
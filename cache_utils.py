@@ -0,0 +1,379 @@
+import os
+import time
+import uuid
+import pickle
+import sqlite3
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from functools import wraps
+from typing import Callable, Optional, Tuple
+from metrics_utils import cache_lookup
+
+# Two-tier cache for fetch results, analysed frames and rendered images.
+# Values are pickled once and kept in a per-process LRU (bounded by bytes) in front of
+# a shared tier that every process and instance pointed at it can read: a SQLite file
+# (default) or Redis. A miss takes a short lease on the key in the shared tier, so when
+# several threads or instances miss together only one computes and the rest wait for
+# its result instead of all calling NewsAPI.
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "sqlite").lower()
+CACHE_PATH = os.getenv("CACHE_PATH", "cache.db")
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+CACHE_MEMORY_BYTES = int(os.getenv("CACHE_MEMORY_BYTES", str(64 * 1024 * 1024)))
+CACHE_MAX_BYTES = int(os.getenv("CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+# How long a computing process holds a key before others give up waiting and compute it too
+CACHE_LOCK_SECONDS = float(os.getenv("CACHE_LOCK_SECONDS", "60"))
+# How long a fallback result (see Fallback) is cached instead of the caller's TTL
+CACHE_FALLBACK_TTL_SECONDS = float(os.getenv("CACHE_FALLBACK_TTL_SECONDS", "60"))
+
+MEMORY = "memory"
+SQLITE = "sqlite"
+REDIS = "redis"
+BACKENDS = (MEMORY, SQLITE, REDIS)
+
+_LOCK_POLL_SECONDS = 0.05
+_LOCK_POLL_MAX_SECONDS = 1.0
+
+# Per-process LRU of pickled values, evicting least recently used entries past `max_bytes`
+class MemoryCache:
+    def __init__(self, max_bytes: int = CACHE_MEMORY_BYTES):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Tuple[bytes, float]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[1] <= time.time():
+                self._drop(key)
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key: str, data: bytes, expires_at: float):
+        with self._lock:
+            self._drop(key)
+            if len(data) > self.max_bytes:
+                return
+            self._entries[key] = (data, expires_at)
+            self.size += len(data)
+            while self.size > self.max_bytes:
+                self._drop(next(iter(self._entries)))
+
+    def delete(self, key: str):
+        with self._lock:
+            self._drop(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    def _drop(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.size -= len(entry[0])
+
+_SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS cache_entries (
+    key TEXT PRIMARY KEY,
+    value BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    expires_at REAL NOT NULL,
+    accessed_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_cache_entries_accessed ON cache_entries (accessed_at);
+CREATE TABLE IF NOT EXISTS cache_locks (
+    key TEXT PRIMARY KEY,
+    token TEXT NOT NULL,
+    expires_at REAL NOT NULL
+);
+"""
+
+# Shared tier in a SQLite file. Every process on a host (and every instance mounting the
+# same volume) sees the same entries. Past `max_bytes`, expired entries go first and then
+# the least recently read ones.
+class SQLiteCache:
+    def __init__(self, path: str = CACHE_PATH, max_bytes: int = CACHE_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._ready = False
+        self._ready_lock = threading.Lock()
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            if not self._ready:
+                with self._ready_lock:
+                    if not self._ready:
+                        conn.execute("PRAGMA journal_mode=WAL;")
+                        conn.executescript(_SQLITE_SCHEMA)
+                        self._ready = True
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def get(self, key: str) -> Optional[Tuple[bytes, float]]:
+        now = time.time()
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT value, expires_at FROM cache_entries WHERE key = ? AND expires_at > ?;", (key, now)
+            ).fetchone()
+            if row is not None:
+                conn.execute("UPDATE cache_entries SET accessed_at = ? WHERE key = ?;", (now, key))
+        return (bytes(row[0]), row[1]) if row is not None else None
+
+    def set(self, key: str, data: bytes, expires_at: float):
+        if len(data) > self.max_bytes:
+            return
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO cache_entries (key, value, size, expires_at, accessed_at) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT (key) DO UPDATE SET value = excluded.value, size = excluded.size, "
+                "expires_at = excluded.expires_at, accessed_at = excluded.accessed_at;",
+                (key, sqlite3.Binary(data), len(data), expires_at, now)
+            )
+            (total,) = conn.execute("SELECT COALESCE(SUM(size), 0) FROM cache_entries;").fetchone()
+            if total > self.max_bytes:
+                self._evict(conn, now)
+
+    # Trim to 90% of the limit, so eviction does not run again on the very next write
+    def _evict(self, conn, now: float):
+        target = self.max_bytes * 0.9
+        conn.execute("DELETE FROM cache_entries WHERE expires_at <= ?;", (now,))
+        (total,) = conn.execute("SELECT COALESCE(SUM(size), 0) FROM cache_entries;").fetchone()
+        doomed = []
+        for key, size in conn.execute("SELECT key, size FROM cache_entries ORDER BY accessed_at;"):
+            if total <= target:
+                break
+            doomed.append((key,))
+            total -= size
+        conn.executemany("DELETE FROM cache_entries WHERE key = ?;", doomed)
+
+    def delete(self, key: str):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM cache_entries WHERE key = ?;", (key,))
+
+    def clear(self):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM cache_entries;")
+            conn.execute("DELETE FROM cache_locks;")
+
+    def acquire(self, key: str, token: str, ttl: float) -> bool:
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("DELETE FROM cache_locks WHERE key = ? AND expires_at <= ?;", (key, now))
+            cursor = conn.execute(
+                "INSERT OR IGNORE INTO cache_locks (key, token, expires_at) VALUES (?, ?, ?);", (key, token, now + ttl)
+            )
+            return cursor.rowcount == 1
+
+    def release(self, key: str, token: str):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM cache_locks WHERE key = ? AND token = ?;", (key, token))
+
+# Shared tier in Redis, for instances that share no disk. `client` is anything with
+# redis-py's get/set/pttl/delete/scan_iter, so tests can pass an in-memory fake. Size
+# limits are left to the server's maxmemory with an LRU eviction policy.
+class RedisCache:
+    def __init__(self, client=None, url: str = REDIS_URL):
+        if client is None:
+            try:
+                import redis
+            except ImportError:
+                raise RuntimeError("CACHE_BACKEND=redis needs the redis package installed.")
+            client = redis.Redis.from_url(url)
+        self.client = client
+
+    def get(self, key: str) -> Optional[Tuple[bytes, float]]:
+        data = self.client.get(key)
+        if data is None:
+            return None
+        remaining = self.client.pttl(key)
+        return data, time.time() + (remaining / 1000 if remaining and remaining > 0 else 0)
+
+    def set(self, key: str, data: bytes, expires_at: float):
+        ttl_ms = int((expires_at - time.time()) * 1000)
+        if ttl_ms > 0:
+            self.client.set(key, data, px=ttl_ms)
+
+    def delete(self, key: str):
+        self.client.delete(key)
+
+    # Only this cache's keys, so a Redis shared with other data is left alone
+    def clear(self):
+        for key in self.client.scan_iter(match="cache:*"):
+            self.client.delete(key)
+
+    def acquire(self, key: str, token: str, ttl: float) -> bool:
+        return bool(self.client.set(f"{key}:lock", token, nx=True, px=int(ttl * 1000)))
+
+    # Leases only prevent duplicate work, so a check-then-delete race is harmless here
+    def release(self, key: str, token: str):
+        held = self.client.get(f"{key}:lock")
+        if held is not None and (held.decode() if isinstance(held, bytes) else held) == token:
+            self.client.delete(f"{key}:lock")
+
+_memory = MemoryCache()
+_shared = None
+_shared_ready = False
+_shared_lock = threading.Lock()
+# Keys being computed in this process; other threads wait on the event instead of computing
+_inflight = {}
+_inflight_lock = threading.Lock()
+
+def _build_backend(name: str):
+    if name == MEMORY:
+        return None
+    if name == SQLITE:
+        return SQLiteCache()
+    if name == REDIS:
+        return RedisCache()
+    raise ValueError(f"Unknown CACHE_BACKEND: {name}")
+
+def shared_backend():
+    global _shared, _shared_ready
+    if not _shared_ready:
+        with _shared_lock:
+            if not _shared_ready:
+                _shared = _build_backend(CACHE_BACKEND)
+                _shared_ready = True
+    return _shared
+
+# Swap the shared tier, e.g. for RedisCache(fake_client) in a test; None keeps only the memory tier
+def configure_cache(backend=None):
+    global _shared, _shared_ready
+    with _shared_lock:
+        _shared, _shared_ready = backend, True
+    _memory.clear()
+
+def _shared_call(method: str, *args):
+    backend = shared_backend()
+    if backend is None:
+        return None
+    try:
+        return getattr(backend, method)(*args)
+    except Exception as e:
+        # The shared tier only saves work; when it is unreachable, carry on without it
+        logging.warning(f"Shared cache {method} failed: {e}")
+        return None
+
+# Returned by a computation that could only produce a stand-in, e.g. what the article
+# store held while NewsAPI was failing. The caller gets `value`, but it is cached for
+# `ttl` seconds only, so the next request soon tries again instead of serving it all TTL.
+class Fallback:
+    __slots__ = ("value", "ttl")
+
+    def __init__(self, value, ttl: float = CACHE_FALLBACK_TTL_SECONDS):
+        self.value = value
+        self.ttl = ttl
+
+def make_key(namespace: str, *parts) -> str:
+    digest = hashlib.blake2b(repr(parts).encode("utf-8"), digest_size=16).hexdigest()
+    return f"cache:{namespace}:{digest}"
+
+def _lookup(key: str) -> Optional[Tuple[bytes, float]]:
+    entry = _memory.get(key)
+    if entry is None:
+        entry = _shared_call("get", key)
+        if entry is not None:
+            _memory.set(key, *entry)
+    return entry
+
+# Wait for another instance holding the lease on `key` to store its result
+def _wait_for_shared(key: str) -> Optional[Tuple[bytes, float]]:
+    deadline = time.monotonic() + CACHE_LOCK_SECONDS
+    delay = _LOCK_POLL_SECONDS
+    while time.monotonic() < deadline:
+        time.sleep(delay)
+        entry = _lookup(key)
+        if entry is not None:
+            return entry
+        delay = min(delay * 2, _LOCK_POLL_MAX_SECONDS)
+    return None
+
+def _store(key: str, value, ttl: float):
+    data = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+    expires_at = time.time() + ttl
+    _memory.set(key, data, expires_at)
+    _shared_call("set", key, data, expires_at)
+
+def _compute_and_store(key: str, compute: Callable, ttl: float):
+    token = uuid.uuid4().hex
+    leased = _shared_call("acquire", key, token, CACHE_LOCK_SECONDS)
+    try:
+        if leased is False:
+            entry = _wait_for_shared(key)
+            if entry is not None:
+                return pickle.loads(entry[0])
+        value = compute()
+        if isinstance(value, Fallback):
+            value, ttl = value.value, min(value.ttl, ttl)
+        _store(key, value, ttl)
+        return value
+    finally:
+        if leased:
+            _shared_call("release", key, token)
+
+# Return the cached value for (namespace, key parts), or compute, store and return it.
+# Callers get their own unpickled copy on a hit. `namespace` names the cache in metrics.
+# `compute` may return a Fallback to have its value cached only briefly.
+def get_or_compute(namespace: str, parts: tuple, compute: Callable, ttl: float):
+    key = make_key(namespace, *parts)
+    while True:
+        entry = _lookup(key)
+        if entry is not None:
+            cache_lookup(namespace, hits=1)
+            return pickle.loads(entry[0])
+        with _inflight_lock:
+            event = _inflight.get(key)
+            leader = event is None
+            if leader:
+                event = _inflight[key] = threading.Event()
+        if not leader:
+            # Another thread here is computing it; if it fails, the loop tries again
+            event.wait(CACHE_LOCK_SECONDS)
+            continue
+        try:
+            cache_lookup(namespace, misses=1)
+            return _compute_and_store(key, compute, ttl)
+        finally:
+            with _inflight_lock:
+                _inflight.pop(key, None)
+            event.set()
+
+# Decorator form: the cache key is the namespace plus the call's arguments, which must
+# have a stable repr (strings, numbers, dates, tuples)
+def cached(namespace: str, ttl: float):
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            parts = (args, tuple(sorted(kwargs.items())))
+            return get_or_compute(namespace, parts, lambda: fn(*args, **kwargs), ttl)
+        return wrapper
+    return decorator
+
+# Plain reads and writes for values built outside get_or_compute, e.g. on a schedule
+def lookup(namespace: str, parts: tuple):
+    entry = _lookup(make_key(namespace, *parts))
+    return None if entry is None else pickle.loads(entry[0])
+
+def store(namespace: str, parts: tuple, value, ttl: float):
+    _store(make_key(namespace, *parts), value, ttl)
+
+def invalidate(namespace: str, *parts):
+    key = make_key(namespace, *parts)
+    _memory.delete(key)
+    _shared_call("delete", key)
+
+def clear_cache():
+    _memory.clear()
+    _shared_call("clear")
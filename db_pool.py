@@ -0,0 +1,264 @@
+import os
+import time
+import logging
+import threading
+from contextlib import contextmanager
+import psycopg2
+from psycopg2 import pool as pg_pool
+from dotenv import load_dotenv
+from metrics_utils import observe
+
+load_dotenv()
+INSTANCE_CONNECTION_NAME = os.getenv("INSTANCE_CONNECTION_NAME")
+
+# Database connection parameters
+DB_CONNECT_PARAMS = {}
+if INSTANCE_CONNECTION_NAME:
+    # Production env - Unix socket
+    logging.info("Connecting via Unix socket!")
+    DB_CONNECT_PARAMS = {
+        "host": f"/cloudsql/{INSTANCE_CONNECTION_NAME}",
+        "dbname": os.getenv("DBNAME"),
+        "user": os.getenv("DBUSER"),
+        "password": os.getenv("PASSWORD")
+    }
+else:
+    # Local dev - TCP socket
+    logging.info("Connecting via TCP socket!")
+    DB_CONNECT_PARAMS = {
+        "host": os.getenv("HOST"),
+        "dbname": os.getenv("DBNAME"),
+        "user": os.getenv("DBUSER"),
+        "password": os.getenv("PASSWORD"),
+        "port": os.getenv("PORT")
+    }
+
+# Pool sizing and health checks
+DB_POOL_MIN = int(os.getenv("DB_POOL_MIN", "1"))
+DB_POOL_MAX = int(os.getenv("DB_POOL_MAX", "5"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))
+# Idle connections older than this are pinged before being handed out
+DB_POOL_PING_AFTER = float(os.getenv("DB_POOL_PING_AFTER", "30"))
+
+SCHEMA_STATEMENTS = [
+    """
+    CREATE TABLE IF NOT EXISTS subscribers (
+        id SERIAL PRIMARY KEY,
+        name VARCHAR(255) NOT NULL,
+        email VARCHAR(255) UNIQUE NOT NULL,
+        subscribed_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+    );
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS digest_send_log (
+        digest_date DATE NOT NULL,
+        subscriber_id INTEGER NOT NULL REFERENCES subscribers(id) ON DELETE CASCADE,
+        status VARCHAR(16) NOT NULL,
+        error TEXT,
+        attempts INTEGER NOT NULL DEFAULT 1,
+        updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+        PRIMARY KEY (digest_date, subscriber_id)
+    );
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS digest_checkpoints (
+        digest_date DATE NOT NULL,
+        shard_key VARCHAR(64) NOT NULL DEFAULT 'all',
+        last_subscriber_id INTEGER NOT NULL DEFAULT 0,
+        sent_count INTEGER NOT NULL DEFAULT 0,
+        failed_count INTEGER NOT NULL DEFAULT 0,
+        completed BOOLEAN NOT NULL DEFAULT FALSE,
+        elapsed_seconds DOUBLE PRECISION NOT NULL DEFAULT 0,
+        updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+        PRIMARY KEY (digest_date, shard_key)
+    );
+    """,
+    # Preferences: `keywords` is kept normalised (lowercase, sorted, unique) so that
+    # subscribers with the same interests compare equal and share one digest.
+    # An empty list means the default Top Headlines digest.
+    """
+    ALTER TABLE subscribers
+        ADD COLUMN IF NOT EXISTS active BOOLEAN NOT NULL DEFAULT TRUE,
+        ADD COLUMN IF NOT EXISTS unsubscribed_at TIMESTAMP WITH TIME ZONE,
+        ADD COLUMN IF NOT EXISTS keywords TEXT[] NOT NULL DEFAULT '{}';
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_subscribers_active_id ON subscribers (id) WHERE active;",
+    "CREATE INDEX IF NOT EXISTS idx_subscribers_active_keywords ON subscribers (keywords, id) WHERE active;",
+    # Transactional outbox: emails are queued in the same transaction as the change
+    # that causes them and sent later by outbox_utils.drain_outbox
+    """
+    CREATE TABLE IF NOT EXISTS email_outbox (
+        id BIGSERIAL PRIMARY KEY,
+        kind VARCHAR(32) NOT NULL,
+        subscriber_id INTEGER REFERENCES subscribers(id) ON DELETE CASCADE,
+        recipient_name VARCHAR(255) NOT NULL,
+        recipient_email VARCHAR(255) NOT NULL,
+        status VARCHAR(16) NOT NULL DEFAULT 'pending',
+        attempts INTEGER NOT NULL DEFAULT 0,
+        last_error TEXT,
+        available_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW(),
+        claimed_at TIMESTAMP WITH TIME ZONE,
+        created_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW(),
+        sent_at TIMESTAMP WITH TIME ZONE
+    );
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_email_outbox_due ON email_outbox (available_at, id) WHERE status IN ('pending', 'sending');",
+    # Background digest runs (DailyDigest/digest_jobs.py). At most one job per digest
+    # date and shard may be queued or running at a time.
+    """
+    CREATE TABLE IF NOT EXISTS digest_jobs (
+        id BIGSERIAL PRIMARY KEY,
+        dedupe_key VARCHAR(128) NOT NULL,
+        options JSONB NOT NULL DEFAULT '{}',
+        status VARCHAR(16) NOT NULL DEFAULT 'queued',
+        attempts INTEGER NOT NULL DEFAULT 0,
+        sent INTEGER NOT NULL DEFAULT 0,
+        failed INTEGER NOT NULL DEFAULT 0,
+        elapsed_seconds DOUBLE PRECISION NOT NULL DEFAULT 0,
+        result JSONB,
+        error TEXT,
+        worker VARCHAR(128),
+        created_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW(),
+        started_at TIMESTAMP WITH TIME ZONE,
+        heartbeat_at TIMESTAMP WITH TIME ZONE,
+        finished_at TIMESTAMP WITH TIME ZONE
+    );
+    """,
+    "CREATE UNIQUE INDEX IF NOT EXISTS idx_digest_jobs_active ON digest_jobs (dedupe_key) WHERE status IN ('queued', 'running');",
+    "CREATE INDEX IF NOT EXISTS idx_digest_jobs_pending ON digest_jobs (id) WHERE status IN ('queued', 'running');",
+]
+
+_pool = None
+_pool_lock = threading.Lock()
+_slots = threading.BoundedSemaphore(DB_POOL_MAX)
+_last_used = {}
+_schema_ready = False
+_schema_lock = threading.Lock()
+
+_metrics_lock = threading.Lock()
+_metrics = {
+    "checkouts": 0,
+    "checkout_timeouts": 0,
+    "wait_seconds_total": 0.0,
+    "wait_seconds_max": 0.0,
+    "health_check_failures": 0,
+    "connections_discarded": 0,
+}
+
+class PoolTimeout(psycopg2.OperationalError):
+    pass
+
+def _get_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = pg_pool.ThreadedConnectionPool(DB_POOL_MIN, DB_POOL_MAX, **DB_CONNECT_PARAMS)
+                logging.info(f"Database pool created (min={DB_POOL_MIN}, max={DB_POOL_MAX}).")
+    return _pool
+
+def _is_healthy(conn) -> bool:
+    if conn.closed:
+        return False
+    if time.monotonic() - _last_used.get(id(conn), 0.0) < DB_POOL_PING_AFTER:
+        return True
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT 1;")
+        conn.rollback()
+        return True
+    except psycopg2.Error:
+        return False
+
+def _checkout():
+    pool = _get_pool()
+    # Retry once on a dead connection; the pool opens a fresh one in its place
+    for _ in range(2):
+        conn = pool.getconn()
+        if _is_healthy(conn):
+            return conn
+        with _metrics_lock:
+            _metrics["health_check_failures"] += 1
+            _metrics["connections_discarded"] += 1
+        _last_used.pop(id(conn), None)
+        pool.putconn(conn, close=True)
+    return pool.getconn()
+
+# Borrow a pooled connection; commits on success, rolls back on error
+@contextmanager
+def get_connection():
+    started = time.monotonic()
+    if not _slots.acquire(timeout=DB_POOL_TIMEOUT):
+        with _metrics_lock:
+            _metrics["checkout_timeouts"] += 1
+        raise PoolTimeout(f"Timed out after {DB_POOL_TIMEOUT}s waiting for a database connection.")
+    try:
+        conn = _checkout()
+    except Exception:
+        _slots.release()
+        raise
+    waited = time.monotonic() - started
+    with _metrics_lock:
+        _metrics["checkouts"] += 1
+        _metrics["wait_seconds_total"] += waited
+        _metrics["wait_seconds_max"] = max(_metrics["wait_seconds_max"], waited)
+    observe("db_wait", waited)
+    checked_out = time.monotonic()
+
+    broken = False
+    try:
+        with conn:
+            yield conn
+    except (psycopg2.OperationalError, psycopg2.InterfaceError):
+        broken = True
+        raise
+    finally:
+        broken = broken or bool(conn.closed)
+        if broken:
+            _last_used.pop(id(conn), None)
+            with _metrics_lock:
+                _metrics["connections_discarded"] += 1
+        else:
+            _last_used[id(conn)] = time.monotonic()
+        _get_pool().putconn(conn, close=broken)
+        _slots.release()
+        observe("db", time.monotonic() - checked_out)
+
+# One-time schema bootstrap per process
+def ensure_schema():
+    global _schema_ready
+    if _schema_ready:
+        return
+    with _schema_lock:
+        if _schema_ready:
+            return
+        with get_connection() as conn:
+            with conn.cursor() as cur:
+                for statement in SCHEMA_STATEMENTS:
+                    cur.execute(statement)
+        _schema_ready = True
+        logging.info("Database schema verified.")
+
+def pool_metrics() -> dict:
+    with _metrics_lock:
+        snapshot = dict(_metrics)
+    pool = _pool
+    if pool is not None and not pool.closed:
+        snapshot["open_connections"] = len(pool._pool) + len(pool._used)
+        snapshot["in_use"] = len(pool._used)
+        snapshot["idle"] = len(pool._pool)
+    else:
+        snapshot["open_connections"] = snapshot["in_use"] = snapshot["idle"] = 0
+    snapshot["min_size"] = DB_POOL_MIN
+    snapshot["max_size"] = DB_POOL_MAX
+    checkouts = snapshot["checkouts"]
+    snapshot["wait_seconds_avg"] = snapshot["wait_seconds_total"] / checkouts if checkouts else 0.0
+    return snapshot
+
+def close_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.closeall()
+            _pool = None
+            _last_used.clear()
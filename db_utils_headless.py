@@ -1,37 +1,157 @@
-import psycopg2
 import os
 import logging
-from dotenv import load_dotenv
-
-load_dotenv()
-DB_CONNECT_PARAMS = {}
-INSTANCE_CONNECTION_NAME = os.getenv("INSTANCE_CONNECTION_NAME") 
-
-if INSTANCE_CONNECTION_NAME:
-    # Cloud Run Environment
-    DB_CONNECT_PARAMS = {
-        "host": f"/cloudsql/{INSTANCE_CONNECTION_NAME}",
-        "user": os.getenv("DBUSER"),
-        "password": os.getenv("PASSWORD"),
-        "dbname": os.getenv("DBNAME")
-    }
-else:
-    # Local Environment for backend testing
-    DB_CONNECT_PARAMS = {
-        "host": os.getenv("HOST"),
-        "port": os.getenv("PORT"),
-        "user": os.getenv("DBUSER"),
-        "password": os.getenv("PASSWORD"),
-        "dbname": os.getenv("DBNAME")
-    }
-
-def fetch_subscribers():
-    query = "SELECT name, email FROM subscribers;"
-    try:
-        with psycopg2.connect(**DB_CONNECT_PARAMS) as conn:
-            with conn.cursor() as cur:
-                cur.execute(query)
-                return cur.fetchall()
-    except Exception as e:
-        logging.error(f"Error fetching subscribers: {e}")
-        return []
\ No newline at end of file
+from psycopg2.extras import execute_values
+from db_pool import get_connection
+
+SUBSCRIBER_BATCH_SIZE = int(os.getenv("SUBSCRIBER_BATCH_SIZE", "1000"))
+# A subscriber whose digest failed is sent it again until this many attempts that day
+DIGEST_MAX_ATTEMPTS = int(os.getenv("DIGEST_MAX_ATTEMPTS", "3"))
+
+def _subscriber_conditions(digest_date=None, until_id: int = None, shard: tuple = None, keywords=None):
+    conditions = ["s.active"]
+    params = []
+    if until_id is not None:
+        conditions.append("s.id <= %s")
+        params.append(until_id)
+    if shard is not None:
+        conditions.append("s.id %% %s = %s")
+        params.extend([shard[1], shard[0]])
+    if keywords is not None:
+        conditions.append("s.keywords = %s::text[]")
+        params.append(list(keywords))
+    if digest_date is not None:
+        conditions.append(
+            "NOT EXISTS (SELECT 1 FROM digest_send_log l"
+            " WHERE l.digest_date = %s AND l.subscriber_id = s.id AND (l.status = 'sent' OR l.attempts >= %s))"
+        )
+        params.extend([digest_date, DIGEST_MAX_ATTEMPTS])
+    return conditions, params
+
+# Stream active (id, name, email) rows in id order, one keyset page at a time.
+# The connection goes back to the pool between pages, so a slow consumer never pins it.
+# With `digest_date`, subscribers already sent that day's digest are skipped, and so are
+# those whose sends failed DIGEST_MAX_ATTEMPTS times; earlier failures are yielded again.
+# `until_id` bounds an id range and `shard=(index, count)` keeps only ids where id % count == index.
+# `keywords` keeps one preference group (an empty list is the Top Headlines group).
+def iter_subscribers(batch_size: int = SUBSCRIBER_BATCH_SIZE, after_id: int = 0, digest_date=None,
+                     until_id: int = None, shard: tuple = None, keywords=None):
+    conditions, params = _subscriber_conditions(digest_date, until_id, shard, keywords)
+    conditions.insert(0, "s.id > %s")
+    query = f"SELECT s.id, s.name, s.email FROM subscribers s WHERE {' AND '.join(conditions)} ORDER BY s.id LIMIT %s;"
+    last_id = after_id
+    while True:
+        try:
+            with get_connection() as conn:
+                with conn.cursor(name="subscriber_stream") as cur:
+                    cur.itersize = batch_size
+                    cur.execute(query, (last_id, *params, batch_size))
+                    rows = cur.fetchmany(batch_size)
+        except Exception as e:
+            logging.error(f"Error streaming subscribers after id {last_id}: {e}")
+            raise
+        if not rows:
+            return
+        yield from rows
+        if len(rows) < batch_size:
+            return
+        last_id = rows[-1][0]
+
+# Split the subscriber id space into `count` contiguous ranges of roughly equal size.
+# The last range is left open-ended so subscribers who join mid-run are still covered.
+def subscriber_id_ranges(count: int):
+    query = """
+        SELECT MIN(id), MAX(id), COUNT(*)
+        FROM (SELECT id, NTILE(%s) OVER (ORDER BY id) AS bucket FROM subscribers WHERE active) t
+        GROUP BY bucket ORDER BY bucket;
+    """
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(query, (count,))
+            rows = cur.fetchall()
+    ranges = [{"id_from": low, "id_to": high, "subscribers": total} for low, high, total in rows]
+    if ranges:
+        ranges[-1]["id_to"] = None
+    return ranges
+
+# Distinct keyword preferences among active subscribers still waiting for
+# `digest_date`'s digest in this slice, with how many subscribers share each.
+# Largest groups first; an empty tuple is the Top Headlines group.
+def preference_groups(digest_date, after_id: int = 0, until_id: int = None, shard: tuple = None):
+    conditions, params = _subscriber_conditions(digest_date, until_id, shard)
+    conditions.insert(0, "s.id > %s")
+    query = (
+        f"SELECT s.keywords, COUNT(*) FROM subscribers s WHERE {' AND '.join(conditions)} "
+        "GROUP BY s.keywords ORDER BY COUNT(*) DESC, s.keywords;"
+    )
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(query, (after_id, *params))
+            return [(tuple(keywords), count) for keywords, count in cur.fetchall()]
+
+# Record the outcome of a delivered batch: [((id, name, email), error_or_None), ...]
+def record_deliveries(digest_date, results):
+    rows = [
+        (digest_date, subscriber_id, "sent" if error is None else "failed", error)
+        for (subscriber_id, _, _), error in results
+    ]
+    if not rows:
+        return
+    query = """
+        INSERT INTO digest_send_log (digest_date, subscriber_id, status, error)
+        VALUES %s
+        ON CONFLICT (digest_date, subscriber_id) DO UPDATE
+        SET status = EXCLUDED.status,
+            error = EXCLUDED.error,
+            attempts = digest_send_log.attempts + 1,
+            updated_at = NOW()
+        WHERE digest_send_log.status <> 'sent';
+    """
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            execute_values(cur, query, rows)
+
+CHECKPOINT_FIELDS = ("last_subscriber_id", "sent_count", "failed_count", "completed", "elapsed_seconds")
+
+def get_checkpoint(digest_date, shard_key: str = "all"):
+    query = f"""
+        SELECT {', '.join(CHECKPOINT_FIELDS)}
+        FROM digest_checkpoints WHERE digest_date = %s AND shard_key = %s;
+    """
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(query, (digest_date, shard_key))
+            row = cur.fetchone()
+    if row is None:
+        return {"last_subscriber_id": 0, "sent_count": 0, "failed_count": 0, "completed": False, "elapsed_seconds": 0.0}
+    return dict(zip(CHECKPOINT_FIELDS, row))
+
+# All shard checkpoints for a digest date, for the coordinator's status view
+def list_checkpoints(digest_date):
+    query = f"""
+        SELECT shard_key, {', '.join(CHECKPOINT_FIELDS)}, updated_at
+        FROM digest_checkpoints WHERE digest_date = %s ORDER BY shard_key;
+    """
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(query, (digest_date,))
+            rows = cur.fetchall()
+    return [dict(zip(("shard_key",) + CHECKPOINT_FIELDS + ("updated_at",), row)) for row in rows]
+
+# Advance the checkpoint; counts are added to whatever earlier invocations recorded
+def save_checkpoint(digest_date, shard_key: str, last_subscriber_id: int, sent: int, failed: int, completed: bool,
+                    elapsed_seconds: float = 0.0):
+    query = """
+        INSERT INTO digest_checkpoints
+            (digest_date, shard_key, last_subscriber_id, sent_count, failed_count, completed, elapsed_seconds)
+        VALUES (%s, %s, %s, %s, %s, %s, %s)
+        ON CONFLICT (digest_date, shard_key) DO UPDATE
+        SET last_subscriber_id = GREATEST(digest_checkpoints.last_subscriber_id, EXCLUDED.last_subscriber_id),
+            sent_count = digest_checkpoints.sent_count + EXCLUDED.sent_count,
+            failed_count = digest_checkpoints.failed_count + EXCLUDED.failed_count,
+            completed = digest_checkpoints.completed OR EXCLUDED.completed,
+            elapsed_seconds = digest_checkpoints.elapsed_seconds + EXCLUDED.elapsed_seconds,
+            updated_at = NOW();
+    """
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(query, (digest_date, shard_key, last_subscriber_id, sent, failed, completed, elapsed_seconds))
@@ -0,0 +1,111 @@
+import os
+import re
+import hashlib
+from typing import Dict, List, NamedTuple
+
+# Near-duplicate detection for syndicated stories.
+# Each article's title + description is reduced to a MinHash signature, and an LSH
+# index over signature bands proposes candidates, so clustering stays roughly linear
+# in the number of articles instead of comparing every pair.
+DEDUP_THRESHOLD = float(os.getenv("DEDUP_THRESHOLD", "0.6"))
+# 16 bands of 4 rows put the LSH threshold near 0.5, just under the default
+MINHASH_PERMUTATIONS = 64
+LSH_BANDS = 16
+SHINGLE_SIZE = 3
+
+_MERSENNE_PRIME = (1 << 31) - 1
+_TOKEN = re.compile(r"[a-z0-9]+")
+
+class ArticleCluster(NamedTuple):
+    representative: dict
+    members: List[dict]
+
+def _text(article: dict) -> str:
+    return f"{article.get('title') or ''} {article.get('description') or ''}".lower()
+
+def _shingles(text: str) -> set:
+    tokens = _TOKEN.findall(text)
+    if len(tokens) <= SHINGLE_SIZE:
+        return {" ".join(tokens)} if tokens else set()
+    return {" ".join(tokens[i:i + SHINGLE_SIZE]) for i in range(len(tokens) - SHINGLE_SIZE + 1)}
+
+def _hash32(shingle: str) -> int:
+    return int.from_bytes(hashlib.blake2b(shingle.encode("utf-8"), digest_size=4).digest(), "little")
+
+_params = None
+
+def _permutations():
+    global _params
+    if _params is None:
+        import numpy as np
+        rng = np.random.default_rng(1)
+        a = rng.integers(1, _MERSENNE_PRIME, MINHASH_PERMUTATIONS, dtype=np.uint64)
+        b = rng.integers(0, _MERSENNE_PRIME, MINHASH_PERMUTATIONS, dtype=np.uint64)
+        _params = (a[:, None], b[:, None])
+    return _params
+
+# One row per article; an article with no words gets an all-max row and matches nothing
+def minhash_signatures(articles: List[dict]):
+    import numpy as np
+    a, b = _permutations()
+    signatures = np.full((len(articles), MINHASH_PERMUTATIONS), np.iinfo(np.uint64).max, dtype=np.uint64)
+    for i, article in enumerate(articles):
+        shingles = _shingles(_text(article))
+        if not shingles:
+            continue
+        hashes = np.fromiter((_hash32(s) for s in shingles), dtype=np.uint64, count=len(shingles))
+        # a < 2^31 and hashes < 2^32, so the products fit in 64 bits
+        signatures[i] = ((a * hashes + b) % _MERSENNE_PRIME).min(axis=1)
+    return signatures
+
+def _find(parent: list, i: int) -> int:
+    while parent[i] != i:
+        parent[i] = parent[parent[i]]
+        i = parent[i]
+    return i
+
+# Earliest published copy represents the cluster; it is most likely the original wire story
+def _pick_representative(members: List[dict]) -> dict:
+    return min(members, key=lambda a: a.get("publishedAt") or "9999")
+
+def cluster_articles(articles: List[dict], threshold: float = DEDUP_THRESHOLD) -> List[ArticleCluster]:
+    if not articles:
+        return []
+    import numpy as np
+    signatures = minhash_signatures(articles)
+    rows = MINHASH_PERMUTATIONS // LSH_BANDS
+    parent = list(range(len(articles)))
+    empty = signatures[:, 0] == np.iinfo(np.uint64).max
+    for band in range(LSH_BANDS):
+        buckets: Dict[bytes, int] = {}
+        band_slice = signatures[:, band * rows:(band + 1) * rows]
+        for i in range(len(articles)):
+            if empty[i]:
+                continue
+            key = band_slice[i].tobytes()
+            first = buckets.setdefault(key, i)
+            if first == i:
+                continue
+            # Check each candidate against the bucket's first member only, which keeps a
+            # large cluster of copies linear rather than quadratic
+            root_i, root_first = _find(parent, i), _find(parent, first)
+            if root_i != root_first and (signatures[i] == signatures[first]).mean() >= threshold:
+                parent[root_i] = root_first
+
+    groups: Dict[int, List[dict]] = {}
+    for i, article in enumerate(articles):
+        groups.setdefault(_find(parent, i), []).append(article)
+    return [ArticleCluster(_pick_representative(members), members) for members in groups.values()]
+
+# A copy of the cluster's representative with `duplicateCount` (copies in the cluster,
+# 1 for a unique story) and `duplicateSources` (the other copies' source names)
+def merge_cluster(cluster: ArticleCluster) -> dict:
+    rep = cluster.representative
+    others = sorted({
+        (a.get("source") or {}).get("name") or "" for a in cluster.members if a is not rep
+    } - {"", (rep.get("source") or {}).get("name") or ""})
+    return {**rep, "duplicateCount": len(cluster.members), "duplicateSources": others}
+
+# Collapse near-duplicates, keeping input order by each cluster's first appearance
+def dedupe_articles(articles: List[dict], threshold: float = DEDUP_THRESHOLD) -> List[dict]:
+    return [merge_cluster(cluster) for cluster in cluster_articles(list(articles), threshold)]
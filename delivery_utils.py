@@ -0,0 +1,167 @@
+import os
+import time
+import random
+import logging
+import threading
+from dataclasses import dataclass, field
+from itertools import islice
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+from urllib3.exceptions import HTTPError as TransportError
+from sib_api_v3_sdk.rest import ApiException
+from rate_limit import RateLimiter
+from metrics_utils import timed, count
+
+# Delivery engine tuning
+DELIVERY_WORKERS = int(os.getenv("DELIVERY_WORKERS", "4"))
+DELIVERY_RATE_PER_SECOND = float(os.getenv("DELIVERY_RATE_PER_SECOND", "10"))
+# Recipients per API call via messageVersions (Brevo accepts up to 1000)
+DELIVERY_BATCH_SIZE = min(int(os.getenv("DELIVERY_BATCH_SIZE", "100")), 1000)
+DELIVERY_MAX_RETRIES = int(os.getenv("DELIVERY_MAX_RETRIES", "5"))
+DELIVERY_BACKOFF_BASE = float(os.getenv("DELIVERY_BACKOFF_BASE", "0.5"))
+DELIVERY_BACKOFF_MAX = float(os.getenv("DELIVERY_BACKOFF_MAX", "30"))
+
+Recipient = Tuple[int, str, str]
+
+# Only failures keep their addresses; successes are counted so a large send does not
+# hold every delivered address in memory
+@dataclass
+class DeliveryReport:
+    sent: int = 0
+    failed: Dict[str, str] = field(default_factory=dict)
+    api_calls: int = 0
+    retries: int = 0
+    elapsed_seconds: float = 0.0
+    error: Optional[str] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None and not self.failed
+
+    def as_dict(self) -> dict:
+        return {
+            "sent": self.sent,
+            "failed": len(self.failed),
+            "failures": self.failed,
+            "api_calls": self.api_calls,
+            "retries": self.retries,
+            "elapsed_seconds": round(self.elapsed_seconds, 3),
+            "error": self.error,
+        }
+
+def _is_retryable(exc: Exception) -> bool:
+    if isinstance(exc, ApiException):
+        return exc.status == 429 or (exc.status or 0) >= 500
+    return isinstance(exc, TransportError)
+
+def _retry_delay(exc: Exception, attempt: int, backoff_base: float) -> float:
+    headers = getattr(exc, "headers", None) or {}
+    retry_after = headers.get("Retry-After") if hasattr(headers, "get") else None
+    if retry_after:
+        try:
+            return min(float(retry_after), DELIVERY_BACKOFF_MAX)
+        except ValueError:
+            pass
+    delay = backoff_base * (2 ** attempt)
+    return min(delay + random.uniform(0, delay / 2), DELIVERY_BACKOFF_MAX)
+
+def _describe(exc: Exception) -> str:
+    if isinstance(exc, ApiException):
+        return f"HTTP {exc.status}: {exc.reason}"
+    return str(exc) or exc.__class__.__name__
+
+# Sends one batch, retrying transient errors. A 400 on a multi-recipient batch is bisected
+# so one malformed address does not fail everyone it was batched with.
+def _send_batch(api, build_message, batch, limiter, max_retries, backoff_base, stats):
+    attempt = 0
+    while True:
+        limiter.acquire()
+        with stats["lock"]:
+            stats["api_calls"] += 1
+        try:
+            with timed("email_send"):
+                api.send_transac_email(build_message(batch))
+            return [(recipient, None) for recipient in batch]
+        except Exception as e:
+            if _is_retryable(e) and attempt < max_retries:
+                with stats["lock"]:
+                    stats["retries"] += 1
+                time.sleep(_retry_delay(e, attempt, backoff_base))
+                attempt += 1
+                continue
+            if isinstance(e, ApiException) and e.status == 400 and len(batch) > 1:
+                middle = len(batch) // 2
+                return (
+                    _send_batch(api, build_message, batch[:middle], limiter, max_retries, backoff_base, stats)
+                    + _send_batch(api, build_message, batch[middle:], limiter, max_retries, backoff_base, stats)
+                )
+            reason = _describe(e)
+            return [(recipient, reason) for recipient in batch]
+
+def _batches(recipients: Iterable[Recipient], size: int):
+    iterator = iter(recipients)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+# Fan recipients out over a bounded worker pool, `batch_size` recipients per API call.
+# `build_message(batch)` returns the SendSmtpEmail for a batch; `on_batch_complete(results)`
+# receives [(recipient, error_or_None), ...] as each batch finishes.
+def deliver(
+    api,
+    recipients: Iterable[Recipient],
+    build_message: Callable[[List[Recipient]], object],
+    workers: int = DELIVERY_WORKERS,
+    rate_per_second: float = DELIVERY_RATE_PER_SECOND,
+    batch_size: int = DELIVERY_BATCH_SIZE,
+    max_retries: int = DELIVERY_MAX_RETRIES,
+    backoff_base: float = DELIVERY_BACKOFF_BASE,
+    on_batch_complete: Optional[Callable[[list], None]] = None,
+) -> DeliveryReport:
+    report = DeliveryReport()
+    limiter = RateLimiter(rate_per_second)
+    stats = {"lock": threading.Lock(), "api_calls": 0, "retries": 0}
+    started = time.monotonic()
+    # Bound in-flight work so a streamed recipient source is never read far ahead
+    max_in_flight = max(workers, 1) * 2
+
+    def collect(done):
+        for future in done:
+            results = future.result()
+            failures = sum(error is not None for _, error in results)
+            count("emails_total", len(results) - failures, outcome="sent")
+            count("emails_total", failures, outcome="failed")
+            report.sent += len(results) - failures
+            for (_, _, email), error in results:
+                if error is not None:
+                    report.failed[email] = error
+                    logging.warning(f"Digest delivery to {email} failed: {error}")
+            if on_batch_complete:
+                try:
+                    on_batch_complete(results)
+                except Exception as e:
+                    logging.error(f"Batch completion callback failed: {e}")
+
+    with ThreadPoolExecutor(max_workers=max(workers, 1), thread_name_prefix="delivery") as pool:
+        pending = set()
+        try:
+            for batch in _batches(recipients, max(batch_size, 1)):
+                if len(pending) >= max_in_flight:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    collect(done)
+                pending.add(pool.submit(
+                    _send_batch, api, build_message, batch, limiter, max_retries, backoff_base, stats
+                ))
+        except Exception as e:
+            logging.error(f"Recipient source failed mid-delivery: {e}")
+            report.error = f"Recipient source failed: {e}"
+        if pending:
+            done, _ = wait(pending)
+            collect(done)
+
+    report.api_calls = stats["api_calls"]
+    report.retries = stats["retries"]
+    report.elapsed_seconds = time.monotonic() - started
+    return report
@@ -1,12 +1,14 @@
 import base64
+import html
+from typing import Iterable, Tuple
 from datetime import datetime
 import os
 import logging
-import pandas as pd
-from vaderSentiment.vaderSentiment import SentimentIntensityAnalyzer
-from analysis_utils import generate_wordcloud_image
+from artifact_utils import DIGEST_WORDCLOUD_FORMAT
 import sib_api_v3_sdk
-from sib_api_v3_sdk.rest import ApiException
+from delivery_utils import DeliveryReport, deliver
+from template_utils import SafeHtml, get_template, preload_templates
+from subscriber_io import UNSUBSCRIBE_SECRET, unsubscribe_token
 from dotenv import load_dotenv
 load_dotenv()
 
@@ -14,98 +16,128 @@ load_dotenv()
 BREVO_API_KEY = os.getenv("BREVO_API_KEY")
 configuration = sib_api_v3_sdk.Configuration()
 configuration.api_key['api-key'] = BREVO_API_KEY
+# Point at a local stand-in for the Brevo API, e.g. during load tests
+BREVO_API_HOST = os.getenv("BREVO_API_HOST")
+if BREVO_API_HOST:
+    configuration.host = BREVO_API_HOST
 api_instance = sib_api_v3_sdk.TransactionalEmailsApi(sib_api_v3_sdk.ApiClient(configuration))
 
+# Unsubscribe links point at the dashboard, which verifies the signed token
+DASHBOARD_URL = os.getenv("DASHBOARD_URL")
+DIGEST_TITLE = "Top 10 Headlines"
+
+# Templates are compiled once at import; each image only ships the ones it uses
+DIGEST_TEMPLATE = "digest.html"
+CONFIRMATION_TEMPLATE = "email_template.html"
+preload_templates([DIGEST_TEMPLATE, CONFIRMATION_TEMPLATE])
+
 # Send Daily Digest to All Subscribers
-def send_digest_to_all(subscribers: list, articles: list):
-    if not BREVO_API_KEY:
+# `subscribers` may be any iterable of (id, name, email) rows, e.g. db_utils.iter_subscribers(),
+# and is consumed lazily so memory does not grow with the size of the list.
+# `artifact` is the precomputed Top Headlines analysis from artifact_utils.
+# Returns a DeliveryReport with the sent count and the addresses that failed.
+# `title` heads the article list, e.g. a keyword group's topics instead of the headlines.
+def send_digest_to_all(subscribers: Iterable[Tuple[int, str, str]], artifact, api=None, on_batch_complete=None,
+                       title: str = DIGEST_TITLE) -> DeliveryReport:
+    if not BREVO_API_KEY and api is None:
         logging.error("BREVO_API_KEY is not set. Cannot send digest.")
-        return False
-    if not subscribers:
-        logging.info("No subscribers to send digest to. Skipping.")
-        return True
-    if not articles:
+        return DeliveryReport(error="BREVO_API_KEY is not set.")
+    if artifact is None or artifact.df.empty:
         logging.info("No articles for today's digest. Skipping.")
-        return True
+        return DeliveryReport()
 
     try:
-        wordcloud_image_bytes = generate_wordcloud_image(articles)
-        wordcloud_b64 = base64.b64encode(wordcloud_image_bytes).decode()
+        wordcloud_b64 = base64.b64encode(artifact.digest_wordcloud).decode()
+        df = artifact.df.sort_values(by='Sentiment', ascending=False).head(10)
 
-        df = pd.DataFrame(articles)
-        analyzer = SentimentIntensityAnalyzer()
-        df['sentiment'] = df['description'].fillna('').apply(lambda x: analyzer.polarity_scores(x)['compound'])
-        df = df.sort_values(by='sentiment', ascending=False).head(10)
-
-        articles_html = "<ul>"
+        items = []
         for _, row in df.iterrows():
-            source = (row.get("source") or {}).get("name", "N/A")
-            articles_html += f"<li><a href='{row['url']}'>{row['title']}</a><span>Source: {source}</span></li>"
-        articles_html += "</ul>"
+            source = row['Source'] or "N/A"
+            # Near-duplicate copies were merged into this story by analyze_articles
+            copies = int(row.get('Copies', 1) or 1)
+            if copies > 1:
+                source = f"{source} and {copies - 1} more"
+            items.append(
+                f"<li><a href='{html.escape(str(row['URL']))}'>{html.escape(str(row['Title']))}</a>"
+                f"<span>Source: {html.escape(str(source))}</span></li>"
+            )
+        articles_html = SafeHtml("<ul>" + "".join(items) + "</ul>")
 
-        with open('digest.html', 'r', encoding='utf-8') as f:
-            html_template = f.read()
+        # Shared parts are rendered once per run; the name stays a Brevo param so
+        # one message body serves every recipient in a batch
+        unsubscribe_html = SafeHtml(
+            "<p><a href='{{ params.unsubscribe_url }}' style='color: #bdc3c7;'>Unsubscribe</a></p>"
+            if DASHBOARD_URL and UNSUBSCRIBE_SECRET else ""
+        )
+        html_content = get_template(DIGEST_TEMPLATE).partial(**{
+            "params.articles_html": articles_html,
+            "params.digest_title": title,
+            "params.unsubscribe_html": unsubscribe_html,
+        }).render()
 
         sender = {"name": "TrendyTracker", "email": "codewithabhishek2026@gmail.com"}
         subject = f"Your Daily News Digest - {datetime.now().strftime('%B %d, %Y')}"
+        attachment = [{
+            "content": wordcloud_b64,
+            "name": f"wordcloud.{DIGEST_WORDCLOUD_FORMAT.lower()}",
+            "contentType": f"image/{DIGEST_WORDCLOUD_FORMAT.lower()}",
+            "cid": "wordcloudimage"
+        }]
 
-        for name, email in subscribers:
-            personalized_html = (
-                html_template
-                .replace("{{ params.name }}", name)
-                .replace("{{ params.articles_html }}", articles_html)
-            )
+        def recipient_params(name, email):
+            params = {"name": name}
+            if unsubscribe_html:
+                params["unsubscribe_url"] = f"{DASHBOARD_URL.rstrip('/')}/?unsubscribe={unsubscribe_token(email)}"
+            return params
 
-            send_smtp_email = sib_api_v3_sdk.SendSmtpEmail(
+        def build_message(batch):
+            return sib_api_v3_sdk.SendSmtpEmail(
                 sender=sender,
                 subject=subject,
-                to=[{"email": email, "name": name}],
-                html_content=personalized_html,
-                attachment=[{
-                    "content": wordcloud_b64,
-                    "name": "wordcloud.png",
-                    "contentType": "image/png",
-                    "cid": "wordcloudimage"
-                }]
+                html_content=html_content,
+                attachment=attachment,
+                message_versions=[
+                    {"to": [{"email": email, "name": name}], "params": recipient_params(name, email)}
+                    for _, name, email in batch
+                ]
             )
-            
-            api_instance.send_transac_email(send_smtp_email)
-
-        logging.info(f"Successfully sent digest to {len(subscribers)} subscribers.")
-        return True
-
     except Exception as e:
         logging.error(f"An unexpected error occurred in send_digest_to_all: {e}")
-        return False
+        return DeliveryReport(error=str(e))
 
-# Send Confirmation Email
-def send_confirmation_email(recipient_name: str, recipient_email: str) -> bool:
-    if not BREVO_API_KEY:
-        logging.error("BREVO_API_KEY is not set. Cannot send email.")
-        return False
+    report = deliver(api or api_instance, subscribers, build_message, on_batch_complete=on_batch_complete)
+    if not report.sent and not report.failed:
+        logging.info("No subscribers to send digest to.")
+    else:
+        logging.info(
+            f"Digest delivered to {report.sent} subscribers, {len(report.failed)} failed "
+            f"({report.api_calls} API calls, {report.elapsed_seconds:.1f}s)."
+        )
+    return report
 
+# Send queued confirmation emails from the outbox: rows are (outbox_id, name, email).
+# Recipients are batched through Brevo messageVersions like the digest, with the
+# name filled in per recipient by Brevo.
+def send_confirmations(recipients: Iterable[Tuple[int, str, str]], api=None, on_batch_complete=None) -> DeliveryReport:
+    if not BREVO_API_KEY and api is None:
+        logging.error("BREVO_API_KEY is not set. Cannot send confirmation emails.")
+        return DeliveryReport(error="BREVO_API_KEY is not set.")
     try:
-        with open('email_template.html', 'r', encoding='utf-8') as f:
-            html_content = f.read()
-        html_content = html_content.replace('{{ name }}', recipient_name)
-        sender = {"name": "TrendyTracker", "email": "codewithabhishek2026@gmail.com"}
-        to = [{"email": recipient_email, "name": recipient_name}]
-        subject = "Welcome to TrendyTracker!"
-        send_smtp_email = sib_api_v3_sdk.SendSmtpEmail(
-            to=to, 
-            sender=sender, 
-            subject=subject, 
-            html_content=html_content
-        )
-        api_instance.send_transac_email(send_smtp_email)
-        logging.info(f"Confirmation email sent successfully to {recipient_email}")
-        return True
+        html_content = get_template(CONFIRMATION_TEMPLATE).render(name=SafeHtml("{{ params.name }}"))
     except FileNotFoundError:
-        logging.error("email_template.html not found.")
-        return False
-    except ApiException as e:
-        logging.error(f"Brevo API exception when sending email to {recipient_email}: {e}")
-        return False
-    except Exception as e:
-        logging.error(f"An unexpected error occurred in send_confirmation_email: {e}")
-        return False
\ No newline at end of file
+        logging.error(f"{CONFIRMATION_TEMPLATE} not found.")
+        return DeliveryReport(error=f"{CONFIRMATION_TEMPLATE} not found.")
+    sender = {"name": "TrendyTracker", "email": "codewithabhishek2026@gmail.com"}
+
+    def build_message(batch):
+        return sib_api_v3_sdk.SendSmtpEmail(
+            sender=sender,
+            subject="Welcome to TrendyTracker!",
+            html_content=html_content,
+            message_versions=[
+                {"to": [{"email": email, "name": name}], "params": {"name": name}}
+                for _, name, email in batch
+            ]
+        )
+
+    return deliver(api or api_instance, recipients, build_message, on_batch_complete=on_batch_complete)
@@ -0,0 +1,76 @@
+import os
+import gzip
+import re
+import tempfile
+from typing import BinaryIO, Dict, NamedTuple
+
+# Downloadable exports of an analysis frame.
+# Files are only built when a download is requested, and are written chunk by chunk
+# into a spooled temporary file, so peak memory is one chunk plus the compressed output
+# (which moves to disk past EXPORT_SPOOL_BYTES) rather than the whole frame as text.
+EXPORT_CHUNK_ROWS = int(os.getenv("EXPORT_CHUNK_ROWS", "1000"))
+EXPORT_SPOOL_BYTES = int(os.getenv("EXPORT_SPOOL_BYTES", str(8 * 1024 * 1024)))
+
+EXPORT_COLUMNS = ["Date", "Source", "Title", "Content", "URL", "Copies", "Sentiment", "SentimentLabel", "Topic"]
+
+class ExportFormat(NamedTuple):
+    label: str
+    extension: str
+    mime: str
+
+CSV_GZ = "csv.gz"
+PARQUET = "parquet"
+EXPORT_FORMATS: Dict[str, ExportFormat] = {
+    CSV_GZ: ExportFormat("CSV (gzip)", "csv.gz", "application/gzip"),
+    PARQUET: ExportFormat("Parquet", "parquet", "application/vnd.apache.parquet"),
+}
+
+def _chunks(df, chunk_rows: int):
+    for start in range(0, len(df), chunk_rows):
+        yield df.iloc[start:start + chunk_rows]
+
+def write_csv_gz(df, fileobj: BinaryIO, chunk_rows: int = EXPORT_CHUNK_ROWS):
+    with gzip.GzipFile(fileobj=fileobj, mode="wb") as gz:
+        gz.write((",".join(df.columns) + "\n").encode("utf-8"))
+        for chunk in _chunks(df, chunk_rows):
+            gz.write(chunk.to_csv(index=False, header=False).encode("utf-8"))
+
+# The schema is fixed up front so every chunk becomes a row group of the same shape,
+# even when a chunk's Topic or Source column happens to be all missing.
+def _parquet_schema(columns):
+    import pyarrow as pa
+    types = {
+        "Date": pa.date32(),
+        "Copies": pa.int64(),
+        "Sentiment": pa.float64(),
+        "Topic": pa.int64(),
+    }
+    return pa.schema([(name, types.get(name, pa.string())) for name in columns])
+
+def write_parquet(df, fileobj: BinaryIO, chunk_rows: int = EXPORT_CHUNK_ROWS):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    schema = _parquet_schema(df.columns)
+    with pq.ParquetWriter(fileobj, schema, compression="zstd") as writer:
+        for chunk in _chunks(df, chunk_rows):
+            writer.write_table(pa.Table.from_pandas(chunk, schema=schema, preserve_index=False))
+
+_WRITERS = {CSV_GZ: write_csv_gz, PARQUET: write_parquet}
+
+# Write the export columns of `df` in `fmt` to an open binary file
+def write_export(df, fmt: str, fileobj: BinaryIO, chunk_rows: int = EXPORT_CHUNK_ROWS):
+    if fmt not in _WRITERS:
+        raise ValueError(f"Unknown export format: {fmt}")
+    columns = [c for c in EXPORT_COLUMNS if c in df.columns]
+    _WRITERS[fmt](df[columns], fileobj, chunk_rows)
+
+# Build the export and return its bytes, for st.download_button
+def export_bytes(df, fmt: str, chunk_rows: int = EXPORT_CHUNK_ROWS) -> bytes:
+    with tempfile.SpooledTemporaryFile(max_size=EXPORT_SPOOL_BYTES) as f:
+        write_export(df, fmt, f, chunk_rows)
+        f.seek(0)
+        return f.read()
+
+def export_filename(label: str, fmt: str) -> str:
+    stem = re.sub(r"[^A-Za-z0-9_-]+", "_", str(label)).strip("_") or "analysis"
+    return f"news_analysis_{stem}.{EXPORT_FORMATS[fmt].extension}"
@@ -0,0 +1,188 @@
+import time
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+# Lightweight in-process metrics shared by the dashboard and the digest service.
+# Pipeline stages (fetch, sentiment, word cloud, LDA, DB, email send, ...) are timed into
+# fixed-bucket histograms, and counters track cache hits and delivery outcomes. The digest
+# service renders everything in Prometheus text format on /metrics; the dashboard shows
+# the same numbers, plus the stages of the current page load, in its timing panel.
+# Stages may nest (e.g. "analysis" includes "sentiment"), so their times do not add up.
+METRICS_PREFIX = "trendytracker"
+# Histogram bucket upper bounds in seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_COUNTER_HELP = {
+    "stage_errors_total": "Stage executions that raised an exception.",
+    "cache_requests_total": "Cache lookups by cache and result (hit or miss).",
+    "emails_total": "Emails handed to Brevo by outcome (sent or failed).",
+    "newsapi_requests_total": "NewsAPI HTTP requests by status code.",
+    "digest_jobs_total": "Digest jobs finished by status.",
+}
+
+class _Histogram:
+    __slots__ = ("buckets", "count", "sum", "max")
+
+    def __init__(self):
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds: float):
+        self.buckets[bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+        self.max = max(self.max, seconds)
+
+    # Linear interpolation inside the bucket holding the q-th observation, like
+    # Prometheus' histogram_quantile; the open-ended bucket reports the observed max
+    def quantile(self, q: float) -> float:
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, in_bucket in enumerate(self.buckets):
+            if in_bucket and seen + in_bucket >= rank:
+                if i == len(LATENCY_BUCKETS):
+                    return self.max
+                lower = LATENCY_BUCKETS[i - 1] if i else 0.0
+                upper = min(LATENCY_BUCKETS[i], self.max)
+                return lower + (upper - lower) * (rank - seen) / in_bucket
+            seen += in_bucket
+        return self.max
+
+_lock = threading.Lock()
+_stages: Dict[str, _Histogram] = {}
+_counters: Dict[tuple, float] = {}
+_local = threading.local()
+
+def _labels_key(labels: dict) -> tuple:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+# Record one execution of `stage` that took `seconds`
+def observe(stage: str, seconds: float):
+    with _lock:
+        histogram = _stages.get(stage)
+        if histogram is None:
+            histogram = _stages[stage] = _Histogram()
+        histogram.observe(seconds)
+    spans = getattr(_local, "spans", None)
+    if spans is not None:
+        entry = spans.setdefault(stage, [0, 0.0])
+        entry[0] += 1
+        entry[1] += seconds
+
+def count(name: str, amount: float = 1, **labels):
+    key = (name, _labels_key(labels))
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + amount
+
+def cache_lookup(cache: str, hits: int = 0, misses: int = 0):
+    if hits:
+        count("cache_requests_total", hits, cache=cache, result="hit")
+    if misses:
+        count("cache_requests_total", misses, cache=cache, result="miss")
+
+# Time the enclosed block (or decorated function) as one execution of `stage`.
+# Errors are timed and counted too; control flow such as st.stop() is only timed.
+@contextmanager
+def timed(stage: str):
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        count("stage_errors_total", stage=stage)
+        raise
+    finally:
+        observe(stage, time.perf_counter() - started)
+
+# Collect the stages run by this thread inside the block, e.g. one Streamlit rerun.
+# Yields {stage: [calls, seconds]}; work done on pool threads is only in the totals.
+@contextmanager
+def trace():
+    spans = {}
+    previous = getattr(_local, "spans", None)
+    _local.spans = spans
+    try:
+        yield spans
+    finally:
+        _local.spans = previous
+
+def stage_summary() -> List[dict]:
+    with _lock:
+        rows = [{
+            "stage": stage,
+            "calls": h.count,
+            "total_seconds": round(h.sum, 4),
+            "mean_seconds": round(h.sum / h.count, 4) if h.count else 0.0,
+            "p50_seconds": round(h.quantile(0.5), 4),
+            "p95_seconds": round(h.quantile(0.95), 4),
+            "max_seconds": round(h.max, 4),
+        } for stage, h in _stages.items()]
+    return sorted(rows, key=lambda row: row["total_seconds"], reverse=True)
+
+# {cache: {"hits": n, "misses": n, "hit_rate": ratio or None}}
+def cache_summary() -> Dict[str, dict]:
+    caches = {}
+    with _lock:
+        for (name, labels), value in _counters.items():
+            if name != "cache_requests_total":
+                continue
+            labels = dict(labels)
+            entry = caches.setdefault(labels["cache"], {"hits": 0, "misses": 0})
+            entry["hits" if labels["result"] == "hit" else "misses"] += int(value)
+    for entry in caches.values():
+        total = entry["hits"] + entry["misses"]
+        entry["hit_rate"] = round(entry["hits"] / total, 3) if total else None
+    return dict(sorted(caches.items()))
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(labels) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels) + "}"
+
+def _format_value(value: float) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+# Everything recorded so far in the Prometheus text exposition format (version 0.0.4).
+# `gauges` adds point-in-time values owned by the caller, e.g. db_pool.pool_metrics().
+def render_prometheus(gauges: Optional[Dict[str, float]] = None) -> str:
+    lines = []
+    histogram_name = f"{METRICS_PREFIX}_stage_seconds"
+    with _lock:
+        stages = {stage: (list(h.buckets), h.count, h.sum) for stage, h in _stages.items()}
+        counters = dict(_counters)
+    if stages:
+        lines.append(f"# HELP {histogram_name} Time spent per pipeline stage.")
+        lines.append(f"# TYPE {histogram_name} histogram")
+        for stage, (buckets, total_count, total_sum) in sorted(stages.items()):
+            cumulative = 0
+            for bound, in_bucket in zip(LATENCY_BUCKETS + (float("inf"),), buckets):
+                cumulative += in_bucket
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f"{histogram_name}_bucket{_format_labels([('stage', stage), ('le', le)])} {cumulative}")
+            lines.append(f"{histogram_name}_sum{_format_labels([('stage', stage)])} {repr(total_sum)}")
+            lines.append(f"{histogram_name}_count{_format_labels([('stage', stage)])} {total_count}")
+    for name in sorted({name for name, _ in counters}):
+        metric = f"{METRICS_PREFIX}_{name}"
+        lines.append(f"# HELP {metric} {_COUNTER_HELP.get(name, name)}")
+        lines.append(f"# TYPE {metric} counter")
+        for (counter, labels), value in sorted(counters.items()):
+            if counter == name:
+                lines.append(f"{metric}{_format_labels(labels)} {_format_value(value)}")
+    for name, value in sorted((gauges or {}).items()):
+        metric = f"{METRICS_PREFIX}_{name}"
+        lines.append(f"# TYPE {metric} gauge")
+        lines.append(f"{metric} {_format_value(value)}")
+    return "\n".join(lines) + "\n"
+
+def reset_metrics():
+    with _lock:
+        _stages.clear()
+        _counters.clear()
@@ -1,13 +1,17 @@
-import os
-import requests
 import streamlit as st
-from dotenv import load_dotenv
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from newsapi_client import NEWS_API_KEY, NewsAPIError
+from article_store import (
+    ingest_search, ingest_top_headlines, read_search, read_top_headlines, read_trend,
+    search_index, top_entities, search_feed_key, TOP_HEADLINES_FEED, SEARCH_TTL_SECONDS, HEADLINES_TTL_SECONDS
+)
+from cache_utils import cached, Fallback
 
-load_dotenv()
-NEWS_API_KEY = os.getenv("NEWS_API_KEY")
-
-# Fetch news articles based on query and date range
-@st.cache_data(ttl=3600)
+# Fetch news articles based on query and date range.
+# New articles are ingested into the local store; results are always read back from it.
+# Results go through the shared cache, so other processes and instances reuse them;
+# when NewsAPI fails, what the store holds is served but only cached briefly.
+@cached("news_search", SEARCH_TTL_SECONDS)
 def fetch_news(query, max_articles, from_date, to_date, exact_match=False):
     if not NEWS_API_KEY:
         st.error("NEWS_API_KEY is not configured.")
@@ -15,54 +19,78 @@ def fetch_news(query, max_articles, from_date, to_date, exact_match=False):
     if not query:
         return []
 
-    # If exact_match is True, wrap the query in double quotes
-    search_query = f'"{query}"' if exact_match else query
-        
-    url = (
-        f"https://newsapi.org/v2/everything?"
-        f"q={search_query}&"
-        f"from={from_date.strftime('%Y-%m-%d')}&"
-        f"to={to_date.strftime('%Y-%m-%d')}&"
-        f"pageSize={min(max_articles, 100)}&"
-        f"language=en&"
-        f"sortBy=publishedAt&"
-        f"apiKey={NEWS_API_KEY}"
-    )
+    # Pages are fetched concurrently and stored as they arrive; the bar is cleared
+    # afterwards so a cached replay of this function leaves nothing behind
+    progress = st.progress(0.0, text="Fetching articles...")
+    def on_progress(fetched):
+        progress.progress(min(fetched / max_articles, 1.0), text=f"Fetched {fetched} of up to {max_articles} articles...")
     try:
-        r = requests.get(url, timeout=15)
-        r.raise_for_status()
-        data = r.json()
-        if data.get("status") == "ok":
-            return data.get("articles", [])
-        else:
-            st.warning(f"API Error: {data.get('message', 'Unknown error')}")
-            return []
-    except requests.exceptions.RequestException as e:
-        st.error(f"NewsAPI request failed: {e}")
-        return []
+        ingest_search(query, from_date, to_date, max_articles, exact_match, on_progress=on_progress)
+    except NewsAPIError as e:
+        # Serve whatever the store already holds for this query
+        st.warning(str(e))
+        return Fallback(read_search(query, from_date, to_date, max_articles, exact_match))
+    finally:
+        progress.empty()
+    return read_search(query, from_date, to_date, max_articles, exact_match)
+
+# Fetch several searches for the comparison view. The topics are ingested on parallel
+# threads (their NewsAPI pages still share one rate limit) and read back from the store.
+# Returns {query: articles} in the order given.
+@cached("news_comparison", SEARCH_TTL_SECONDS)
+def fetch_comparison(queries, max_articles, from_date, to_date, exact_match=False):
+    if not NEWS_API_KEY:
+        st.error("NEWS_API_KEY is not configured.")
+        return {}
+    queries = tuple(queries)
+    if not queries:
+        return {}
 
-# Fetch top headlines
-@st.cache_data(ttl=1800)
+    # Widgets are only touched from this thread; the workers just ingest
+    progress = st.progress(0.0, text=f"Fetching {len(queries)} topics...")
+    failed = False
+    try:
+        with ThreadPoolExecutor(max_workers=len(queries), thread_name_prefix="compare") as pool:
+            futures = {
+                pool.submit(ingest_search, query, from_date, to_date, max_articles, exact_match): query
+                for query in queries
+            }
+            for done, future in enumerate(as_completed(futures), 1):
+                try:
+                    future.result()
+                except NewsAPIError as e:
+                    st.warning(f"{futures[future]}: {e}")
+                    failed = True
+                progress.progress(done / len(queries), text=f"Fetched {done} of {len(queries)} topics...")
+    finally:
+        progress.empty()
+    feeds = {query: read_search(query, from_date, to_date, max_articles, exact_match) for query in queries}
+    return Fallback(feeds) if failed else feeds
+
+# Search only the articles already stored, through the local inverted index; never calls NewsAPI
+def search_stored(query, max_articles, from_date, to_date, exact_match=False, entity=None):
+    return search_index(query, from_date, to_date, max_articles, exact_match, entity or None)
+
+# Names most mentioned in stored articles over the range, for the entity filter
+def stored_entities(from_date, to_date, limit=50):
+    return [entity for entity, _ in top_entities(from_date, to_date, limit)]
+
+# Fetch top headlines; the digest service's fetcher shares this cache namespace
+@cached("top_headlines", HEADLINES_TTL_SECONDS)
 def fetch_top_headlines(max_articles):
     if not NEWS_API_KEY:
         st.error("NEWS_API_KEY is not configured.")
         return []
 
-    url = (
-        f"https://newsapi.org/v2/top-headlines?"
-        f"language=en&"
-        f"pageSize={min(max_articles, 100)}&"
-        f"apiKey={NEWS_API_KEY}"
-    )
     try:
-        r = requests.get(url, timeout=15)
-        r.raise_for_status()
-        data = r.json()
-        if data.get("status") == "ok":
-            return data.get("articles", [])
-        else:
-            st.warning(f"API Error: {data.get('message', 'Unknown error')}")
-            return []
-    except requests.exceptions.RequestException as e:
-        st.error(f"NewsAPI request failed: {e}")
-        return []
\ No newline at end of file
+        ingest_top_headlines(max_articles)
+    except NewsAPIError as e:
+        st.warning(str(e))
+        return Fallback(read_top_headlines(max_articles))
+    return read_top_headlines(max_articles)
+
+# Article counts and mean sentiment over time for a search, or for top headlines when
+# `query` is empty. Served from the store's rollups, so any stored range can be charted.
+def fetch_trend(query, from_date, to_date, granularity=None, exact_match=False, by_source=False):
+    feed_key = search_feed_key(query, exact_match) if query else TOP_HEADLINES_FEED
+    return read_trend(feed_key, from_date, to_date, granularity, by_source)
@@ -1,31 +1,42 @@
-import os
-import requests
 import logging
-from dotenv import load_dotenv
-
-load_dotenv()
-NEWS_API_KEY = os.getenv("NEWS_API_KEY")
+from datetime import datetime, timedelta, timezone
+from newsapi_client import NEWS_API_KEY, NewsAPIError
+from article_store import (
+    ingest_search, ingest_top_headlines, read_search, read_top_headlines, HEADLINES_WINDOW_HOURS,
+    SEARCH_TTL_SECONDS, HEADLINES_TTL_SECONDS
+)
+from cache_utils import cached, Fallback
 
+# Headlines come from the shared article store, so the digest reuses what the dashboard already fetched.
+# The cache namespace matches the dashboard's, so either service can serve the other's result.
+@cached("top_headlines", HEADLINES_TTL_SECONDS)
 def fetch_top_headlines(max_articles):
     if not NEWS_API_KEY:
         logging.error("NEWS_API_KEY is not configured.")
         return []
 
-    url = (
-        f"https://newsapi.org/v2/top-headlines?"
-        f"language=en&"
-        f"pageSize={min(max_articles, 100)}&"
-        f"apiKey={NEWS_API_KEY}"
-    )
     try:
-        r = requests.get(url, timeout=15)
-        r.raise_for_status()
-        data = r.json()
-        if data.get("status") == "ok":
-            return data.get("articles", [])
-        else:
-            logging.warning(f"API Error: {data.get('message', 'Unknown error')}")
-            return []
-    except requests.exceptions.RequestException as e:
-        logging.error(f"NewsAPI request failed: {e}")
-        return []
\ No newline at end of file
+        ingest_top_headlines(max_articles)
+    except NewsAPIError as e:
+        # Serve what the store holds, but let the next run try NewsAPI again
+        logging.warning(str(e))
+        return Fallback(read_top_headlines(max_articles))
+    return read_top_headlines(max_articles)
+
+# Recent articles matching any of a subscriber group's keywords, over the same
+# rolling window as the headlines
+@cached("keyword_news", SEARCH_TTL_SECONDS)
+def fetch_keyword_news(keywords, max_articles):
+    if not NEWS_API_KEY:
+        logging.error("NEWS_API_KEY is not configured.")
+        return []
+
+    query = " OR ".join(f'"{k}"' if " " in k else k for k in keywords)
+    to_date = datetime.now(timezone.utc).date()
+    from_date = (datetime.now(timezone.utc) - timedelta(hours=HEADLINES_WINDOW_HOURS)).date()
+    try:
+        ingest_search(query, from_date, to_date, max_articles)
+    except NewsAPIError as e:
+        logging.warning(str(e))
+        return Fallback(read_search(query, from_date, to_date, max_articles))
+    return read_search(query, from_date, to_date, max_articles)
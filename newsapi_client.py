@@ -0,0 +1,192 @@
+import os
+import time
+import logging
+import threading
+from datetime import date, datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+import requests
+from requests.adapters import HTTPAdapter
+from dotenv import load_dotenv
+from rate_limit import RateLimiter
+from metrics_utils import timed, count
+
+load_dotenv()
+NEWS_API_KEY = os.getenv("NEWS_API_KEY")
+NEWS_API_URL = os.getenv("NEWS_API_URL", "https://newsapi.org/v2")
+NEWS_API_WORKERS = int(os.getenv("NEWS_API_WORKERS", "4"))
+NEWS_API_RATE_PER_SECOND = float(os.getenv("NEWS_API_RATE_PER_SECOND", "5"))
+NEWS_API_MAX_RETRIES = int(os.getenv("NEWS_API_MAX_RETRIES", "3"))
+PAGE_SIZE = 100
+
+class NewsAPIError(Exception):
+    def __init__(self, message: str, code: str = None):
+        super().__init__(message)
+        self.code = code
+
+# One pooled session for every NewsAPI call in the process
+_session = requests.Session()
+_session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=max(NEWS_API_WORKERS, 10)))
+_limiter = RateLimiter(NEWS_API_RATE_PER_SECOND)
+
+def _request(endpoint: str, params: dict) -> dict:
+    if not NEWS_API_KEY:
+        raise NewsAPIError("NEWS_API_KEY is not configured.")
+    attempt = 0
+    while True:
+        _limiter.acquire()
+        try:
+            with timed("newsapi_request"):
+                r = _session.get(f"{NEWS_API_URL}/{endpoint}", params={**params, "apiKey": NEWS_API_KEY}, timeout=15)
+            count("newsapi_requests_total", endpoint=endpoint, status=r.status_code)
+            if r.status_code == 429 and attempt < NEWS_API_MAX_RETRIES:
+                time.sleep(float(r.headers.get("Retry-After") or 2 ** attempt))
+                attempt += 1
+                continue
+            data = r.json() if r.content else {}
+            if r.status_code >= 400 and data.get("status") != "error":
+                r.raise_for_status()
+        except (requests.exceptions.RequestException, ValueError) as e:
+            raise NewsAPIError(f"NewsAPI request failed: {e}") from e
+        if data.get("status") != "ok":
+            raise NewsAPIError(f"API Error: {data.get('message', 'Unknown error')}", data.get("code"))
+        return data
+
+def _iso(value) -> str:
+    return value if isinstance(value, str) else value.isoformat()
+
+# Raw NewsAPI calls shared by the dashboard, the digest service and the article store.
+# Dates may be date/datetime objects or ISO strings; `from_date` may carry a time.
+def get_everything(query: str, from_date, to_date, page_size: int = PAGE_SIZE, exact_match: bool = False, page: int = 1) -> list:
+    return _everything_page(query, from_date, to_date, page_size, exact_match, page).get("articles", [])
+
+def _everything_page(query, from_date, to_date, page_size, exact_match, page) -> dict:
+    # If exact_match is True, wrap the query in double quotes
+    search_query = f'"{query}"' if exact_match else query
+    return _request("everything", {
+        "q": search_query,
+        "from": _iso(from_date),
+        "to": _iso(to_date),
+        "pageSize": min(page_size, PAGE_SIZE),
+        "page": page,
+        "language": "en",
+        "sortBy": "publishedAt",
+    })
+
+def get_top_headlines(page_size: int = PAGE_SIZE, page: int = 1) -> list:
+    return _request("top-headlines", {
+        "language": "en",
+        "pageSize": min(page_size, PAGE_SIZE),
+        "page": page,
+    }).get("articles", [])
+
+def _parse(value) -> datetime:
+    if isinstance(value, datetime):
+        return value.replace(tzinfo=None)
+    if isinstance(value, date):
+        return datetime(value.year, value.month, value.day)
+    return datetime.fromisoformat(value.replace("Z", "+00:00")).replace(tzinfo=None)
+
+# Split [from, to] into day-sized windows, newest first. iter_everything requests them in
+# this order and stops once the budget is spoken for, so a budget smaller than the range
+# holds covers only its newest days, as one sortBy=publishedAt query over it would.
+def _date_slices(from_date, to_date):
+    start, end = _parse(from_date), _parse(to_date)
+    if end < start:
+        return []
+    slices = []
+    cursor = end
+    while cursor > start:
+        day_start = max(start, cursor.replace(hour=0, minute=0, second=0, microsecond=0))
+        if day_start == cursor:
+            day_start = max(start, cursor - timedelta(days=1))
+        slices.append((day_start.strftime("%Y-%m-%dT%H:%M:%S"), cursor.strftime("%Y-%m-%dT%H:%M:%S")))
+        cursor = day_start
+    return slices or [(start.strftime("%Y-%m-%dT%H:%M:%S"), end.strftime("%Y-%m-%dT%H:%M:%S"))]
+
+# Concurrent, paginated, date-sliced fetch of up to `budget` unique articles.
+# Yields lists of articles (deduplicated by URL) as each page arrives, so callers can
+# store or render them incrementally instead of waiting for the whole set.
+# When `completed` is given, each day window whose results were all taken (its last page
+# was reached without the budget cutting it short) is added to it as (from, to).
+def iter_everything(query: str, from_date, to_date, budget: int, exact_match: bool = False,
+                    workers: int = NEWS_API_WORKERS, completed: set = None):
+    seen = set()
+    seen_lock = threading.Lock()
+    slices = _date_slices(from_date, to_date)
+    if not slices or budget <= 0:
+        return
+
+    def fetch(window, page):
+        try:
+            return window, page, _everything_page(query, window[0], window[1], PAGE_SIZE, exact_match, page)
+        except NewsAPIError as e:
+            e.window = window
+            raise
+
+    collected = 0
+    first_error = None
+    queue = [(window, 1) for window in slices]
+    with ThreadPoolExecutor(max_workers=max(workers, 1), thread_name_prefix="newsapi") as pool:
+        pending = set()
+        while queue or pending:
+            # Only keep as many requests in flight as could still fit in the budget
+            while queue and len(pending) < workers and collected + len(pending) * PAGE_SIZE < budget:
+                pending.add(pool.submit(fetch, *queue.pop(0)))
+            if not pending:
+                break
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    window, page, data = future.result()
+                except NewsAPIError as e:
+                    # Free plans cap results per query; treat it as the end of that window,
+                    # since asking again cannot return more
+                    if e.code == "maximumResultsReached":
+                        if completed is not None:
+                            completed.add(e.window)
+                    else:
+                        first_error = first_error or e
+                        logging.warning(f"NewsAPI page request failed: {e}")
+                    continue
+                articles = data.get("articles", [])
+                fresh = []
+                truncated = False
+                with seen_lock:
+                    for a in articles:
+                        url = a.get("url")
+                        if not url or url in seen:
+                            continue
+                        if collected >= budget:
+                            truncated = True
+                            break
+                        seen.add(url)
+                        fresh.append(a)
+                        collected += 1
+                if fresh:
+                    yield fresh
+                if truncated:
+                    continue
+                if len(articles) == PAGE_SIZE and page * PAGE_SIZE < data.get("totalResults", 0):
+                    queue.append((window, page + 1))
+                elif completed is not None:
+                    completed.add(window)
+            if collected >= budget:
+                for future in pending:
+                    future.cancel()
+                break
+    if first_error is not None and not collected:
+        raise first_error
+
+# Top headlines paginate too, but are a single small feed, so pages are fetched in order
+def iter_top_headlines(budget: int):
+    page = 1
+    collected = 0
+    while collected < budget:
+        data = _request("top-headlines", {"language": "en", "pageSize": PAGE_SIZE, "page": page})
+        articles = data.get("articles", [])[:budget - collected]
+        if articles:
+            collected += len(articles)
+            yield articles
+        if len(data.get("articles", [])) < PAGE_SIZE or page * PAGE_SIZE >= data.get("totalResults", 0):
+            return
+        page += 1
@@ -0,0 +1,133 @@
+import os
+import time
+import logging
+import threading
+from db_pool import get_connection, ensure_schema
+
+# Drains the email outbox filled by signups (see subscriber_io.upsert_subscriber).
+# Rows are claimed with FOR UPDATE SKIP LOCKED, so the dashboard's background thread
+# and the digest service's /outbox/drain endpoint can run at the same time without
+# sending an email twice. A claim that is never completed (e.g. the process died
+# mid-send) is picked up again after OUTBOX_CLAIM_TIMEOUT_SECONDS.
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "100"))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "5"))
+OUTBOX_RETRY_SECONDS = float(os.getenv("OUTBOX_RETRY_SECONDS", "60"))
+OUTBOX_CLAIM_TIMEOUT_SECONDS = float(os.getenv("OUTBOX_CLAIM_TIMEOUT_SECONDS", "300"))
+OUTBOX_POLL_SECONDS = float(os.getenv("OUTBOX_POLL_SECONDS", "5"))
+
+# Claimed rows: (id, kind, recipient_name, recipient_email, attempts)
+def claim_outbox(limit: int = OUTBOX_BATCH_SIZE) -> list:
+    query = """
+        UPDATE email_outbox o
+        SET status = 'sending', attempts = o.attempts + 1, claimed_at = NOW()
+        WHERE o.id IN (
+            SELECT id FROM email_outbox
+            WHERE available_at <= NOW()
+              AND (status = 'pending'
+                   OR (status = 'sending' AND claimed_at < NOW() - make_interval(secs => %s)))
+            ORDER BY available_at, id
+            LIMIT %s
+            FOR UPDATE SKIP LOCKED
+        )
+        RETURNING o.id, o.kind, o.recipient_name, o.recipient_email, o.attempts;
+    """
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(query, (OUTBOX_CLAIM_TIMEOUT_SECONDS, limit))
+            return cur.fetchall()
+
+# Record a delivered batch: [((id, name, email), error_or_None), ...]. Failures go back
+# to pending with exponential backoff until OUTBOX_MAX_ATTEMPTS, then stay 'failed'.
+def complete_outbox(results) -> None:
+    sent = [row[0] for row, error in results if error is None]
+    failed = [(error, row[0]) for row, error in results if error is not None]
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            if sent:
+                cur.execute(
+                    "UPDATE email_outbox SET status = 'sent', sent_at = NOW(), last_error = NULL "
+                    "WHERE id = ANY(%s);",
+                    (sent,)
+                )
+            for error, outbox_id in failed:
+                cur.execute(
+                    """
+                    UPDATE email_outbox
+                    SET last_error = %s,
+                        status = CASE WHEN attempts >= %s THEN 'failed' ELSE 'pending' END,
+                        available_at = NOW() + make_interval(secs => %s * POWER(2, attempts - 1))
+                    WHERE id = %s;
+                    """,
+                    (error, OUTBOX_MAX_ATTEMPTS, OUTBOX_RETRY_SECONDS, outbox_id)
+                )
+
+# Hand claimed rows back without using up an attempt, e.g. when Brevo is not configured:
+# nothing was sent, so the rows wait OUTBOX_RETRY_SECONDS and are tried again as new
+def release_outbox(outbox_ids: list, error: str) -> None:
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                """
+                UPDATE email_outbox
+                SET status = 'pending', attempts = GREATEST(attempts - 1, 0), claimed_at = NULL,
+                    last_error = %s, available_at = NOW() + make_interval(secs => %s)
+                WHERE id = ANY(%s) AND status = 'sending';
+                """,
+                (error, OUTBOX_RETRY_SECONDS, outbox_ids)
+            )
+
+# Send everything that is due, one claimed batch at a time, until the outbox is empty
+# or `time_budget` seconds have passed. Returns counts for logging and the endpoint.
+def drain_outbox(api=None, batch_size: int = OUTBOX_BATCH_SIZE, time_budget: float = None) -> dict:
+    from email_utils import send_confirmations
+    from subscriber_io import CONFIRMATION_EMAIL
+    ensure_schema()
+    deadline = time.monotonic() + time_budget if time_budget else None
+    totals = {"sent": 0, "failed": 0, "batches": 0}
+    while deadline is None or time.monotonic() < deadline:
+        rows = claim_outbox(batch_size)
+        if not rows:
+            break
+        totals["batches"] += 1
+        unknown = [((row[0], row[2], row[3]), f"Unknown outbox kind: {row[1]}") for row in rows
+                   if row[1] != CONFIRMATION_EMAIL]
+        if unknown:
+            complete_outbox(unknown)
+        recipients = [(row[0], row[2], row[3]) for row in rows if row[1] == CONFIRMATION_EMAIL]
+        report = send_confirmations(recipients, api=api, on_batch_complete=complete_outbox)
+        if report.error:
+            # A configuration problem, not a delivery failure: nothing was attempted, so the
+            # claimed rows go back without counting against OUTBOX_MAX_ATTEMPTS
+            release_outbox([recipient[0] for recipient in recipients], report.error)
+            totals["error"] = report.error
+            break
+        totals["sent"] += report.sent
+        totals["failed"] += len(report.failed) + len(unknown)
+    return totals
+
+_worker = None
+_worker_lock = threading.Lock()
+_wake = threading.Event()
+
+def _run_worker():
+    while True:
+        _wake.wait(OUTBOX_POLL_SECONDS)
+        _wake.clear()
+        try:
+            totals = drain_outbox()
+            if totals["batches"]:
+                logging.info(f"Outbox drained: {totals}")
+        except Exception as e:
+            logging.error(f"Outbox worker failed: {e}")
+
+# Start the in-process drain thread once per process; safe to call on every rerun
+def start_outbox_worker():
+    global _worker
+    with _worker_lock:
+        if _worker is None or not _worker.is_alive():
+            _worker = threading.Thread(target=_run_worker, name="outbox-worker", daemon=True)
+            _worker.start()
+
+# Ask the worker to drain now rather than at its next poll, e.g. right after a signup
+def notify_outbox_worker():
+    _wake.set()
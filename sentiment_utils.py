@@ -0,0 +1,111 @@
+import os
+import hashlib
+import logging
+import threading
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterable, List
+from metrics_utils import timed, cache_lookup
+
+# Shared sentiment scoring for the dashboard and the digest.
+# Scores are memoised by a hash of (method, text), so an article that has been
+# scored once costs a dictionary lookup on every later rerun or digest.
+SENTIMENT_CACHE_SIZE = int(os.getenv("SENTIMENT_CACHE_SIZE", "50000"))
+# Batches with at least this many uncached texts are split across worker processes
+SENTIMENT_PARALLEL_THRESHOLD = int(os.getenv("SENTIMENT_PARALLEL_THRESHOLD", "2000"))
+SENTIMENT_WORKERS = int(os.getenv("SENTIMENT_WORKERS", str(os.cpu_count() or 1)))
+
+VADER = "vader"
+TEXTBLOB = "textblob"
+METHODS = (VADER, TEXTBLOB)
+
+_scorers = {}
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+_pool = None
+_pool_lock = threading.Lock()
+
+# Analyzers are built once per process (including each worker process)
+def _scorer(method: str):
+    scorer = _scorers.get(method)
+    if scorer is None:
+        if method == VADER:
+            from vaderSentiment.vaderSentiment import SentimentIntensityAnalyzer
+            analyzer = SentimentIntensityAnalyzer()
+            scorer = lambda text: analyzer.polarity_scores(text)["compound"]
+        elif method == TEXTBLOB:
+            from textblob import TextBlob
+            scorer = lambda text: TextBlob(text).sentiment.polarity
+        else:
+            raise ValueError(f"Unknown sentiment method: {method}")
+        _scorers[method] = scorer
+    return scorer
+
+# Runs in the worker processes; it only touches module-level state that a spawned
+# child rebuilds when it imports this module
+def _score_chunk(method: str, texts: List[str]) -> List[float]:
+    scorer = _scorer(method)
+    return [scorer(text) for text in texts]
+
+# Workers are spawned rather than forked: forking a process that already runs Streamlit,
+# Gunicorn or delivery threads can copy held locks into the child and deadlock it
+def _get_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ProcessPoolExecutor(
+                    max_workers=SENTIMENT_WORKERS, mp_context=multiprocessing.get_context("spawn")
+                )
+    return _pool
+
+def _score_uncached(method: str, texts: List[str], workers: int) -> List[float]:
+    if workers <= 1 or len(texts) < SENTIMENT_PARALLEL_THRESHOLD:
+        return _score_chunk(method, texts)
+    chunk_size = -(-len(texts) // (workers * 4))
+    chunks = [texts[i:i + chunk_size] for i in range(0, len(texts), chunk_size)]
+    try:
+        results = _get_pool().map(_score_chunk, [method] * len(chunks), chunks)
+        return [score for chunk in results for score in chunk]
+    except Exception as e:
+        logging.warning(f"Parallel sentiment scoring failed, falling back to a single process: {e}")
+        return _score_chunk(method, texts)
+
+def _key(method: str, text: str) -> bytes:
+    return hashlib.blake2b(f"{method}\0{text}".encode("utf-8"), digest_size=16).digest()
+
+# Score a list or Series of texts with VADER (compound) or TextBlob (polarity).
+# Returns a list of floats in input order.
+@timed("sentiment")
+def score_texts(texts: Iterable, method: str = VADER, workers: int = SENTIMENT_WORKERS) -> List[float]:
+    if method not in METHODS:
+        raise ValueError(f"Unknown sentiment method: {method}")
+    texts = ["" if text is None else str(text) for text in texts]
+    keys = [_key(method, text) for text in texts]
+    scores = [None] * len(texts)
+    missing = {}
+    with _cache_lock:
+        for i, key in enumerate(keys):
+            score = _cache.get(key)
+            if score is None:
+                missing.setdefault(key, []).append(i)
+            else:
+                _cache.move_to_end(key)
+                scores[i] = score
+    cache_lookup("sentiment", hits=len(texts) - sum(len(indices) for indices in missing.values()),
+                 misses=len(missing))
+    if missing:
+        unique = [texts[indices[0]] for indices in missing.values()]
+        fresh = _score_uncached(method, unique, workers)
+        with _cache_lock:
+            for (key, indices), score in zip(missing.items(), fresh):
+                for i in indices:
+                    scores[i] = score
+                _cache[key] = score
+            while len(_cache) > SENTIMENT_CACHE_SIZE:
+                _cache.popitem(last=False)
+    return scores
+
+def label_sentiment(score: float) -> str:
+    return "Positive" if score > 0.1 else "Negative" if score < -0.1 else "Neutral"
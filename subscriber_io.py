@@ -0,0 +1,239 @@
+import io
+import os
+import re
+import csv
+import sys
+import hmac
+import base64
+import hashlib
+import logging
+import argparse
+from typing import Iterable, Iterator, Optional, TextIO, Tuple
+from psycopg2.extras import execute_values
+from db_pool import get_connection, ensure_schema
+
+# Bulk subscriber import/export, shared by the CLI below and the digest service.
+# Both directions stream: imports are upserted a batch at a time and exports are
+# read a keyset page at a time, so neither holds the whole list in memory.
+IMPORT_BATCH_SIZE = 1000
+EXPORT_BATCH_SIZE = 5000
+EXPORT_COLUMNS = ("id", "name", "email", "subscribed_at", "active", "keywords")
+# Outbox kind queued by a signup
+CONFIRMATION_EMAIL = "confirmation"
+MAX_KEYWORDS = 5
+MAX_KEYWORD_LENGTH = 50
+
+# Signs unsubscribe links; without it digests are sent without one
+UNSUBSCRIBE_SECRET = os.getenv("UNSUBSCRIBE_SECRET")
+
+_EMAIL = re.compile(r"^[^@\s]+@[^@\s]+\.[^@\s]+$")
+
+# Canonical form of a keyword preference: lowercase, trimmed, unique and sorted,
+# so subscribers with the same interests land in the same digest group
+def normalize_keywords(keywords) -> list:
+    if isinstance(keywords, str):
+        keywords = keywords.split(",")
+    cleaned = {" ".join(k.split()).lower()[:MAX_KEYWORD_LENGTH] for k in keywords or () if k and k.strip()}
+    return sorted(cleaned)[:MAX_KEYWORDS]
+
+# Single-statement signup: True if the subscriber was added (or an unsubscribed
+# email came back), False if the email is already an active subscriber.
+# A new subscriber's confirmation email is queued in the outbox by the same
+# statement, so signup never waits on Brevo and never loses the email.
+def upsert_subscriber(name: str, email: str, keywords=()) -> bool:
+    query = """
+        WITH added AS (
+            INSERT INTO subscribers (name, email, keywords) VALUES (%s, %s, %s)
+            ON CONFLICT (email) DO UPDATE
+            SET name = EXCLUDED.name, keywords = EXCLUDED.keywords, active = TRUE, unsubscribed_at = NULL
+            WHERE NOT subscribers.active
+            RETURNING id, name, email
+        ), queued AS (
+            INSERT INTO email_outbox (kind, subscriber_id, recipient_name, recipient_email)
+            SELECT %s, id, name, email FROM added
+        )
+        SELECT id FROM added;
+    """
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(query, (name, email, normalize_keywords(keywords), CONFIRMATION_EMAIL))
+            return cur.fetchone() is not None
+
+# Returns False when no subscriber has this email
+def set_preferences(email: str, keywords) -> bool:
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                "UPDATE subscribers SET keywords = %s WHERE email = %s;",
+                (normalize_keywords(keywords), email)
+            )
+            return cur.rowcount > 0
+
+# Returns False when no active subscriber has this email
+def unsubscribe(email: str) -> bool:
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                "UPDATE subscribers SET active = FALSE, unsubscribed_at = NOW() WHERE email = %s AND active;",
+                (email,)
+            )
+            return cur.rowcount > 0
+
+def _signature(email: str) -> str:
+    return hmac.new(UNSUBSCRIBE_SECRET.encode(), email.encode(), hashlib.sha256).hexdigest()[:32]
+
+# Opaque token carried by a digest's unsubscribe link; None when links are disabled
+def unsubscribe_token(email: str) -> Optional[str]:
+    if not UNSUBSCRIBE_SECRET:
+        return None
+    encoded = base64.urlsafe_b64encode(email.encode()).decode().rstrip("=")
+    return f"{encoded}.{_signature(email)}"
+
+# The email a token was issued for, or None if it is malformed or not ours
+def verify_unsubscribe_token(token: str) -> Optional[str]:
+    if not UNSUBSCRIBE_SECRET or not token or "." not in token:
+        return None
+    encoded, signature = token.rsplit(".", 1)
+    try:
+        email = base64.urlsafe_b64decode(encoded + "=" * (-len(encoded) % 4)).decode()
+    except (ValueError, UnicodeDecodeError):
+        return None
+    return email if hmac.compare_digest(signature, _signature(email)) else None
+
+def _batches(rows: Iterable, size: int) -> Iterator[list]:
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+# Insert (name, email) rows, skipping emails that are already subscribed.
+# Each batch is one execute_values statement in its own transaction, so a long
+# import holds a pooled connection for one batch at a time and keeps what it wrote
+# if it fails part way. Returns {"inserted": n, "skipped": n}.
+def bulk_upsert_subscribers(rows: Iterable[Tuple[str, str]], batch_size: int = IMPORT_BATCH_SIZE) -> dict:
+    query = """
+        INSERT INTO subscribers (name, email) VALUES %s
+        ON CONFLICT (email) DO NOTHING RETURNING id;
+    """
+    inserted = skipped = 0
+    for batch in _batches(rows, batch_size):
+        with get_connection() as conn:
+            with conn.cursor() as cur:
+                added = len(execute_values(cur, query, batch, page_size=len(batch), fetch=True))
+        inserted += added
+        skipped += len(batch) - added
+    return {"inserted": inserted, "skipped": skipped}
+
+# Header names compared by their letters alone, so "E-mail" and "email_address" match "email"
+def _column(fieldnames, wanted: str) -> Optional[str]:
+    letters = {field: re.sub(r"[^a-z]", "", field.lower()) for field in fieldnames if field}
+    for field, name in letters.items():
+        if name == wanted:
+            return field
+    for field, name in letters.items():
+        if wanted in name:
+            return field
+    return None
+
+# Yield (name, email) rows from a CSV with a header. Column names are matched
+# loosely ("Email Address", "E-mail", "Full Name", ...) so exports from other tools load as-is;
+# without a name column the email's local part is used. Rows without a valid email
+# are counted in `stats["invalid"]` and skipped.
+def read_subscriber_csv(stream: TextIO, stats: dict = None) -> Iterator[Tuple[str, str]]:
+    stats = {} if stats is None else stats
+    stats.setdefault("invalid", 0)
+    reader = csv.DictReader(stream)
+    email_field = _column(reader.fieldnames or [], "email")
+    if email_field is None:
+        raise ValueError("CSV needs a header with an email column.")
+    name_field = _column([f for f in reader.fieldnames if f != email_field], "name")
+    for record in reader:
+        email = (record.get(email_field) or "").strip()
+        if not _EMAIL.match(email):
+            stats["invalid"] += 1
+            continue
+        name = (record.get(name_field) or "").strip() if name_field else ""
+        yield (name or email.split("@")[0])[:255], email[:255]
+
+def import_subscriber_csv(stream: TextIO, batch_size: int = IMPORT_BATCH_SIZE) -> dict:
+    stats = {"invalid": 0}
+    result = bulk_upsert_subscribers(read_subscriber_csv(stream, stats), batch_size)
+    return {**result, **stats}
+
+# Yield the subscriber list as CSV text, one chunk per keyset page
+def iter_subscriber_csv(batch_size: int = EXPORT_BATCH_SIZE) -> Iterator[str]:
+    query = f"""
+        SELECT {', '.join(EXPORT_COLUMNS)} FROM subscribers
+        WHERE id > %s ORDER BY id LIMIT %s;
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_COLUMNS)
+    yield buffer.getvalue()
+    last_id = 0
+    while True:
+        with get_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(query, (last_id, batch_size))
+                rows = cur.fetchall()
+        if not rows:
+            return
+        buffer.seek(0)
+        buffer.truncate()
+        for row in rows:
+            writer.writerow(row[:3] + (row[3].isoformat() if row[3] else "", row[4], ";".join(row[5])))
+        yield buffer.getvalue()
+        if len(rows) < batch_size:
+            return
+        last_id = rows[-1][0]
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Import or export TrendyTracker subscribers as CSV.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    import_cmd = commands.add_parser("import", help="Add subscribers from a CSV file; existing emails are skipped")
+    import_cmd.add_argument("path", help="CSV file to read, or - for stdin")
+    import_cmd.add_argument("--batch-size", type=int, default=IMPORT_BATCH_SIZE)
+    export_cmd = commands.add_parser("export", help="Write all subscribers to a CSV file")
+    export_cmd.add_argument("path", help="CSV file to write, or - for stdout")
+    export_cmd.add_argument("--batch-size", type=int, default=EXPORT_BATCH_SIZE)
+    prefs_cmd = commands.add_parser("prefs", help="Set a subscriber's digest keywords (empty for Top Headlines)")
+    prefs_cmd.add_argument("email")
+    prefs_cmd.add_argument("keywords", nargs="?", default="", help="Comma-separated keywords")
+    unsubscribe_cmd = commands.add_parser("unsubscribe", help="Stop sending digests to a subscriber")
+    unsubscribe_cmd.add_argument("email")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    ensure_schema()
+    if args.command == "import":
+        stream = sys.stdin if args.path == "-" else open(args.path, newline="", encoding="utf-8-sig")
+        try:
+            result = import_subscriber_csv(stream, args.batch_size)
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+        logging.info(f"Imported subscribers: {result}")
+    elif args.command == "prefs":
+        if not set_preferences(args.email, args.keywords):
+            logging.error(f"No subscriber with email {args.email}.")
+            return 1
+    elif args.command == "unsubscribe":
+        if not unsubscribe(args.email):
+            logging.error(f"No active subscriber with email {args.email}.")
+            return 1
+    else:
+        stream = sys.stdout if args.path == "-" else open(args.path, "w", newline="", encoding="utf-8")
+        try:
+            for chunk in iter_subscriber_csv(args.batch_size):
+                stream.write(chunk)
+        finally:
+            if stream is not sys.stdout:
+                stream.close()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,85 @@
+import os
+import re
+import html
+import logging
+import threading
+from typing import Dict, Iterable, List, Tuple
+
+TEMPLATE_DIR = os.getenv("TEMPLATE_DIR", os.path.dirname(os.path.abspath(__file__)))
+
+_PLACEHOLDER = re.compile(r"\{\{\s*([\w.]+)\s*\}\}")
+
+# Marks a value as already-safe markup so it is substituted without escaping
+class SafeHtml(str):
+    pass
+
+# A template split once into literal text and placeholder slots.
+# Rendering is a single join; placeholders without a value are kept verbatim
+# so Brevo can still fill its own `{{ params.* }}` fields server-side.
+class CompiledTemplate:
+    def __init__(self, parts: List[Tuple[bool, str, str]]):
+        # Each part is (is_placeholder, field_or_text, original_source)
+        self._parts = parts
+        self.fields = frozenset(value for is_field, value, _ in parts if is_field)
+
+    @classmethod
+    def compile(cls, source: str) -> "CompiledTemplate":
+        parts = []
+        position = 0
+        for match in _PLACEHOLDER.finditer(source):
+            if match.start() > position:
+                parts.append((False, source[position:match.start()], ""))
+            parts.append((True, match.group(1), match.group(0)))
+            position = match.end()
+        if position < len(source):
+            parts.append((False, source[position:], ""))
+        return cls(parts)
+
+    @staticmethod
+    def _value(value) -> str:
+        return value if isinstance(value, SafeHtml) else html.escape(str(value))
+
+    # Bake in the fields shared by every recipient, returning a smaller template
+    def partial(self, **values) -> "CompiledTemplate":
+        parts = []
+        for is_field, value, source in self._parts:
+            if is_field and value in values:
+                is_field, value, source = False, self._value(values[value]), ""
+            if not is_field and parts and not parts[-1][0]:
+                parts[-1] = (False, parts[-1][1] + value, "")
+            else:
+                parts.append((is_field, value, source))
+        return CompiledTemplate(parts)
+
+    def render(self, **values) -> str:
+        return "".join(
+            (self._value(values[value]) if value in values else source) if is_field else value
+            for is_field, value, source in self._parts
+        )
+
+_cache: Dict[str, CompiledTemplate] = {}
+_cache_lock = threading.Lock()
+
+def _template_path(name: str) -> str:
+    path = os.path.join(TEMPLATE_DIR, name)
+    return path if os.path.exists(path) else name
+
+# Load and compile a template once per process
+def get_template(name: str) -> CompiledTemplate:
+    template = _cache.get(name)
+    if template is None:
+        with _cache_lock:
+            template = _cache.get(name)
+            if template is None:
+                with open(_template_path(name), 'r', encoding='utf-8') as f:
+                    template = CompiledTemplate.compile(f.read())
+                _cache[name] = template
+    return template
+
+# Warm the cache at startup; images that do not ship a template simply skip it
+def preload_templates(names: Iterable[str]):
+    for name in names:
+        try:
+            get_template(name)
+        except FileNotFoundError:
+            logging.debug(f"Template {name} not present in this image; skipping preload.")
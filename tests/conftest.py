@@ -0,0 +1,300 @@
+import os
+import sys
+import bisect
+import contextlib
+import threading
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# The digest service imports its headless modules under their plain names, like its image does
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "DailyDigest"))
+
+os.environ.setdefault("NEWS_API_KEY", "test")
+# No background digest workers in tests; they would poll a database that is not there
+os.environ.setdefault("JOB_WORKERS", "0")
+
+# Mirror DailyDigest/Dockerfile, which installs the headless modules under these names
+import db_utils_headless
+import news_utils_headless
+sys.modules["db_utils"] = db_utils_headless
+sys.modules["news_utils"] = news_utils_headless
+
+
+class FakeResponse:
+    def __init__(self, data: dict, status_code: int = 200):
+        self.data = data
+        self.status_code = status_code
+        self.headers = {}
+        self.content = b"{}"
+
+    def json(self):
+        return self.data
+
+    def raise_for_status(self):
+        pass
+
+
+# Stands in for newsapi_client's requests session: pages through a fixed article set,
+# newest first, honouring the `from`/`to` window of /everything like NewsAPI does
+class FakeNewsAPI:
+    def __init__(self, articles: list):
+        self.articles = sorted(articles, key=lambda a: a["publishedAt"])
+        self.published = [a["publishedAt"][:19] for a in self.articles]
+        self.requests = []
+        self._lock = threading.Lock()
+
+    def get(self, url, params=None, timeout=None):
+        params = params or {}
+        with self._lock:
+            self.requests.append(params)
+        low = bisect.bisect_left(self.published, params["from"][:19])
+        high = bisect.bisect_right(self.published, params["to"][:19])
+        size, page = int(params.get("pageSize", 100)), int(params.get("page", 1))
+        window = self.articles[low:high][::-1]
+        return FakeResponse({
+            "status": "ok",
+            "totalResults": len(window),
+            "articles": window[(page - 1) * size:page * size],
+        })
+
+
+# One article in NewsAPI's shape; the URL defaults to one derived from source and title
+def news_article(title: str, published: str, source: str = "Wire", description: str = "", url: str = None) -> dict:
+    slug = "-".join((title or "").lower().split()) or "untitled"
+    return {
+        "source": {"id": None, "name": source},
+        "title": title,
+        "description": description,
+        "url": url or f"https://{source.lower()}.example/{slug}/{published}",
+        "publishedAt": published,
+    }
+
+
+def make_articles(query: str, end: datetime, days: int, per_day: int) -> list:
+    articles = []
+    for day in range(days):
+        for i in range(per_day):
+            published = end - timedelta(days=day, minutes=10 * i + 1)
+            articles.append({
+                "source": {"id": None, "name": f"Source {i % 5}"},
+                "title": f"{query} story {day}-{i}",
+                "description": f"What happened in {query} on day {day}, item {i}.",
+                "url": f"https://news.example/{query}/{day}/{i}",
+                "publishedAt": published.strftime("%Y-%m-%dT%H:%M:%SZ"),
+            })
+    return articles
+
+
+# Subscriber rows (id, name, email) numbered from 1; with `keywords`, rows also carry
+# them as the fourth column, the shape FakeDigestDB takes
+def subscriber_rows(n: int, keywords=None) -> list:
+    rows = [(i, f"user{i}", f"user{i}@example.com") for i in range(1, n + 1)]
+    return rows if keywords is None else [row + (tuple(keywords),) for row in rows]
+
+
+# A scored analysis frame like analyze_articles builds: `n` rows over three sources,
+# alternating sentiment, and every third row without a topic
+def analysis_frame(n: int = 5):
+    import pandas as pd
+    from datetime import date
+    scores = [0.5 if i % 2 else -0.4 for i in range(n)]
+    return pd.DataFrame({
+        "Date": [date(2024, 6, 1 + i % 3) for i in range(n)],
+        "Source": [f"Source {i % 3}" for i in range(n)],
+        "Title": [f"Story {i}, with a comma" for i in range(n)],
+        "Content": [f"What happened in story {i}." for i in range(n)],
+        "URL": [f"https://news.example/{i}" for i in range(n)],
+        "Copies": [1 + i % 2 for i in range(n)],
+        "Sentiment": scores,
+        "SentimentLabel": ["Positive" if s > 0.1 else "Negative" for s in scores],
+        "Topic": pd.Series([None if i % 3 == 0 else i % 2 + 1 for i in range(n)], dtype="Int64"),
+    })
+
+
+# A psycopg2 cursor that records its statements and answers with fixed rows.
+# Patch a module's get_connection with `cursor.connection` to route it here.
+class FakeCursor:
+    def __init__(self, rows=()):
+        self.rows = list(rows)
+        self.executed = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    @property
+    def rowcount(self):
+        return len(self.rows)
+
+    def connection(self):
+        return contextlib.nullcontext(SimpleNamespace(cursor=lambda *args, **kwargs: self))
+
+    def execute(self, query, params=None):
+        self.executed.append((query, params))
+
+    def fetchone(self):
+        return self.rows[0] if self.rows else None
+
+    def fetchall(self):
+        return self.rows
+
+
+# In-memory stand-in for the digest's Postgres helpers in db_utils_headless, with the
+# same send-log rules: 'sent' rows are final, failed ones come back until they reach
+# DIGEST_MAX_ATTEMPTS, and checkpoint counts add up across saves.
+class FakeDigestDB:
+    def __init__(self, subscribers: list):
+        # (id, name, email, keywords)
+        self.subscribers = sorted(subscribers)
+        self.log = {}
+        self.checkpoints = {}
+
+    def _waiting(self, digest_date, after_id=0, until_id=None, shard=None, keywords=None):
+        from db_utils_headless import DIGEST_MAX_ATTEMPTS
+        for subscriber in self.subscribers:
+            sid = subscriber[0]
+            if sid <= after_id or (until_id is not None and sid > until_id):
+                continue
+            if shard is not None and sid % shard[1] != shard[0]:
+                continue
+            if keywords is not None and tuple(subscriber[3]) != tuple(keywords):
+                continue
+            status, attempts = self.log.get((digest_date, sid), (None, 0))
+            if digest_date is not None and (status == "sent" or attempts >= DIGEST_MAX_ATTEMPTS):
+                continue
+            yield subscriber
+
+    def iter_subscribers(self, batch_size=None, after_id=0, digest_date=None, until_id=None, shard=None,
+                         keywords=None):
+        for sid, name, email, _ in self._waiting(digest_date, after_id, until_id, shard, keywords):
+            yield sid, name, email
+
+    def preference_groups(self, digest_date, after_id=0, until_id=None, shard=None):
+        counts = {}
+        for subscriber in self._waiting(digest_date, after_id, until_id, shard):
+            counts[tuple(subscriber[3])] = counts.get(tuple(subscriber[3]), 0) + 1
+        return sorted(counts.items(), key=lambda item: (-item[1], item[0]))
+
+    def record_deliveries(self, digest_date, results):
+        for (sid, _, _), error in results:
+            status, attempts = self.log.get((digest_date, sid), (None, 0))
+            if status != "sent":
+                self.log[digest_date, sid] = ("sent" if error is None else "failed", attempts + 1)
+
+    def get_checkpoint(self, digest_date, shard_key="all"):
+        return dict(self.checkpoints.get((digest_date, shard_key)) or {
+            "last_subscriber_id": 0, "sent_count": 0, "failed_count": 0, "completed": False, "elapsed_seconds": 0.0
+        })
+
+    def save_checkpoint(self, digest_date, shard_key, last_subscriber_id, sent, failed, completed,
+                        elapsed_seconds=0.0):
+        row = self.get_checkpoint(digest_date, shard_key)
+        row["last_subscriber_id"] = max(row["last_subscriber_id"], last_subscriber_id)
+        row["sent_count"] += sent
+        row["failed_count"] += failed
+        row["completed"] = row["completed"] or completed
+        row["elapsed_seconds"] += elapsed_seconds
+        self.checkpoints[digest_date, shard_key] = row
+
+    def list_checkpoints(self, digest_date):
+        return [dict(row, shard_key=key, updated_at=None)
+                for (day, key), row in sorted(self.checkpoints.items()) if day == digest_date]
+
+
+# Stands in for email_utils.send_digest_to_all: "delivers" two recipients per batch,
+# failing each subscriber in `failures` that many times (-1 for always)
+class FakeDigestSender:
+    def __init__(self, failures: dict = None):
+        self.failures = dict(failures or {})
+        self.deliveries = []
+
+    def __call__(self, subscribers, artifact, api=None, on_batch_complete=None, title=None):
+        from delivery_utils import DeliveryReport
+        report = DeliveryReport()
+        batch = []
+
+        def flush():
+            results = []
+            for sid, name, email in batch:
+                remaining = self.failures.get(sid, 0)
+                error = "HTTP 400: Bad Request" if remaining else None
+                if remaining > 0:
+                    self.failures[sid] = remaining - 1
+                self.deliveries.append((sid, error))
+                results.append(((sid, name, email), error))
+                if error is None:
+                    report.sent += 1
+                else:
+                    report.failed[email] = error
+            if on_batch_complete:
+                on_batch_complete(results)
+            batch.clear()
+
+        for recipient in subscribers:
+            batch.append(recipient)
+            if len(batch) == 2:
+                flush()
+        if batch:
+            flush()
+        return report
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    import article_store
+    import newsapi_client
+    from rate_limit import RateLimiter
+    monkeypatch.setattr(article_store, "ARTICLE_STORE_PATH", str(tmp_path / "articles.db"))
+    monkeypatch.setattr(article_store, "_schema_ready", False)
+    monkeypatch.setattr(newsapi_client, "NEWS_API_KEY", "test")
+    monkeypatch.setattr(newsapi_client, "_limiter", RateLimiter(0))
+    return article_store
+
+
+@pytest.fixture
+def fake_newsapi(monkeypatch):
+    import newsapi_client
+
+    def install(articles):
+        fake = FakeNewsAPI(articles)
+        monkeypatch.setattr(newsapi_client, "_session", fake)
+        return fake
+    return install
+
+
+# Every test gets its own shared cache tier, so nothing leaks between tests or into cache.db
+@pytest.fixture(autouse=True)
+def shared_cache(tmp_path):
+    import cache_utils
+    backend = cache_utils.SQLiteCache(str(tmp_path / "cache.db"))
+    cache_utils.configure_cache(backend)
+    yield backend
+    cache_utils.configure_cache(None)
+
+
+# Runs digest_runner against FakeDigestDB and FakeDigestSender, with a one-row artifact
+# for every preference group
+@pytest.fixture
+def digest(monkeypatch):
+    import types
+    import pandas as pd
+    import digest_runner
+
+    def install(subscribers, failures=None):
+        db, sender = FakeDigestDB(subscribers), FakeDigestSender(failures)
+        for name in ("iter_subscribers", "preference_groups", "record_deliveries", "get_checkpoint",
+                     "save_checkpoint", "list_checkpoints"):
+            monkeypatch.setattr(digest_runner, name, getattr(db, name))
+        monkeypatch.setattr(digest_runner, "send_digest_to_all", sender)
+        monkeypatch.setattr(digest_runner, "ensure_schema", lambda: None)
+        monkeypatch.setattr(digest_runner, "pool_metrics", lambda: {})
+        artifact = types.SimpleNamespace(df=pd.DataFrame({"Title": ["story"]}), built_at=0.0)
+        monkeypatch.setattr(digest_runner, "group_artifact", lambda keywords: artifact)
+        return db, sender
+    return install
@@ -0,0 +1,54 @@
+from datetime import datetime, timedelta, timezone
+
+from conftest import make_articles
+
+END = datetime.now(timezone.utc).replace(tzinfo=None, hour=12, minute=0, second=0, microsecond=0) - timedelta(days=1)
+START = END - timedelta(days=13)
+
+
+def test_budget_cut_search_leaves_older_days_uncovered(store, fake_newsapi):
+    fake = fake_newsapi(make_articles("india", END, days=14, per_day=20))
+    store.ingest_search("India", START.date(), END.date(), 50)
+    small = store.read_search("India", START.date(), END.date(), 1000)
+    assert len(small) == 50
+
+    requests_before = len(fake.requests)
+    store.ingest_search("India", START.date(), END.date(), 1000)
+    assert len(fake.requests) > requests_before
+    assert len(store.read_search("India", START.date(), END.date(), 1000)) == 14 * 20
+
+
+def test_fully_fetched_days_are_not_fetched_again(store, fake_newsapi):
+    fake = fake_newsapi(make_articles("india", END, days=14, per_day=20))
+    store.ingest_search("India", START.date(), END.date(), 1000)
+    requests_before = len(fake.requests)
+    assert store.ingest_search("India", START.date(), END.date(), 1000) == 0
+    assert len(fake.requests) == requests_before
+
+
+def test_only_completed_days_are_marked_covered(store, fake_newsapi):
+    fake_newsapi(make_articles("india", END, days=14, per_day=20))
+    store.ingest_search("India", START.date(), END.date(), 50)
+    with store._connect() as conn:
+        ranges = store._uncovered_ranges(conn, store.search_feed_key("India"), str(START.date()), str(END.date()))
+    covered = 14 - sum(
+        (datetime.strptime(last, "%Y-%m-%d") - datetime.strptime(first, "%Y-%m-%d")).days + 1 for first, last in ranges
+    )
+    # 20 articles a day and a budget of 50: the two newest days fit whole, the third is cut short
+    assert covered == 2
+    assert ranges[0][0] == str(START.date())
+
+
+def test_day_cut_short_is_fetched_from_its_start_next_time(store, fake_newsapi):
+    fake_newsapi(make_articles("india", END, days=1, per_day=60))
+    store.ingest_search("India", END.date(), END.date(), 20)
+    with store._connect() as conn:
+        covered_from, last_published_at, _ = store._feed_state(conn, store.search_feed_key("India"))
+    assert covered_from is None
+    assert last_published_at[:10] == str(END.date())
+
+    store.ingest_search("India", END.date(), END.date(), 1000)
+    assert len(store.read_search("India", END.date(), END.date(), 1000)) == 60
+    with store._connect() as conn:
+        covered_from, _, _ = store._feed_state(conn, store.search_feed_key("India"))
+    assert covered_from == str(END.date())
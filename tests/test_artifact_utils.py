@@ -0,0 +1,82 @@
+import time
+
+import artifact_utils
+import sentiment_utils
+from artifact_utils import AnalysisArtifact, save_artifact, load_artifact, source_stats
+from conftest import analysis_frame, news_article
+
+
+def artifact(built_at=None):
+    df = analysis_frame(4)
+    return AnalysisArtifact(df=df, wordcloud=b"png", digest_wordcloud=b"", topics=[["a", "b"]],
+                            source_stats=source_stats(df), params={"label": "test"},
+                            built_at=time.time() if built_at is None else built_at)
+
+
+def test_artifact_round_trips_through_its_file(tmp_path, monkeypatch):
+    monkeypatch.setattr(artifact_utils, "ARTIFACT_DIR", str(tmp_path))
+    save_artifact("headlines", artifact())
+    loaded = load_artifact("headlines")
+    assert loaded.df["Title"].tolist() == analysis_frame(4)["Title"].tolist()
+    assert loaded.source_stats["Articles"].to_dict() == {"Source 0": 2, "Source 1": 1, "Source 2": 1}
+    assert (loaded.wordcloud, loaded.topics, loaded.params) == (b"png", [["a", "b"]], {"label": "test"})
+
+
+def test_another_instance_loads_the_artifact_from_the_shared_cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(artifact_utils, "ARTIFACT_DIR", str(tmp_path / "builder"))
+    save_artifact("headlines", artifact())
+    # A second container: empty ARTIFACT_DIR, same shared tier
+    monkeypatch.setattr(artifact_utils, "ARTIFACT_DIR", str(tmp_path / "reader"))
+    loaded = load_artifact("headlines")
+    assert loaded is not None and loaded.df["URL"].tolist() == analysis_frame(4)["URL"].tolist()
+
+
+def test_stale_shared_copy_is_not_served(tmp_path, monkeypatch):
+    monkeypatch.setattr(artifact_utils, "ARTIFACT_DIR", str(tmp_path / "builder"))
+    save_artifact("headlines", artifact(built_at=time.time() - 600))
+    monkeypatch.setattr(artifact_utils, "ARTIFACT_DIR", str(tmp_path / "reader"))
+    assert load_artifact("headlines", max_age=300) is None
+    assert load_artifact("headlines", max_age=900) is not None
+
+
+def test_only_digest_artifacts_render_the_email_word_cloud(monkeypatch):
+    rendered = []
+    monkeypatch.setattr(artifact_utils, "analyze_articles",
+                        lambda *args, digest_image=False: rendered.append(digest_image) or artifact())
+    monkeypatch.setattr(artifact_utils, "save_artifact", lambda name, built: None)
+    fetch = lambda limit: [{"title": "story"}]
+    artifact_utils.get_headlines_artifact(fetch, refresh=True)
+    artifact_utils.get_headlines_artifact(fetch, 20, refresh=True)
+    artifact_utils.get_headlines_artifact(fetch, method="textblob", refresh=True)
+    artifact_utils.get_keywords_artifact(("climate",), lambda keywords, limit: fetch(limit), refresh=True)
+    assert rendered == [True, False, False, True]
+
+
+def test_comparison_scores_the_union_of_topics_once(monkeypatch):
+    calls = []
+
+    def score_texts(texts, method):
+        calls.append(list(texts))
+        return [0.5] * len(texts)
+
+    monkeypatch.setattr(sentiment_utils, "score_texts", score_texts)
+    rates = news_article("Central bank raises interest rates again", "2024-06-03T09:00:00Z",
+                         description="Policymakers lifted borrowing costs for the third time this year.")
+    # The same wire story under another outlet's URL
+    copy = {**rates, "source": {"name": "Copy"}, "url": "https://copy.example/rates"}
+    climate = news_article("Heatwave sets records across Europe", "2024-06-04T09:00:00Z",
+                           description="Temperatures passed 40C in several countries on Tuesday.")
+    markets = news_article("Stocks slide as bond yields climb", "2024-06-05T09:00:00Z",
+                           description="Equities fell after the rate decision surprised traders.")
+    comparison = artifact_utils.compare_articles({
+        "rates": [rates, markets],
+        "economy": [copy, markets],
+        "climate": [climate],
+    })
+    # Three distinct stories across the topics, scored in one pass
+    assert len(calls) == 1 and len(calls[0]) == 3
+    assert comparison.summary["Articles"].tolist() == [2, 2, 1]
+    assert comparison.summary["Shared"].tolist() == [2, 2, 0]
+    assert comparison.overlap.loc["rates", "economy"] == 2
+    assert comparison.overlap.loc["climate", "rates"] == 0
+    assert set(comparison.source_stats) == {"rates", "economy", "climate"}
@@ -0,0 +1,114 @@
+import time
+import threading
+
+import cache_utils
+from cache_utils import MemoryCache, SQLiteCache, Fallback, get_or_compute, make_key
+
+
+def test_memory_tier_evicts_least_recently_used_past_its_byte_limit():
+    cache = MemoryCache(max_bytes=10)
+    later = time.time() + 60
+    cache.set("a", b"1234", later)
+    cache.set("b", b"1234", later)
+    assert cache.get("a") is not None  # "b" is now the least recently used
+    cache.set("c", b"1234", later)
+    assert cache.get("b") is None
+    assert cache.get("a") is not None and cache.get("c") is not None
+    assert cache.size == 8
+
+
+def test_memory_tier_drops_expired_and_oversized_values():
+    cache = MemoryCache(max_bytes=10)
+    cache.set("old", b"x", time.time() - 1)
+    cache.set("huge", b"x" * 11, time.time() + 60)
+    assert cache.get("old") is None and cache.get("huge") is None
+    assert cache.size == 0
+
+
+def test_sqlite_tier_evicts_least_recently_read(tmp_path):
+    cache = SQLiteCache(str(tmp_path / "lru.db"), max_bytes=25)
+    later = time.time() + 60
+    for key in ("a", "b"):
+        cache.set(key, b"x" * 10, later)
+        time.sleep(0.01)
+    cache.get("a")
+    cache.set("c", b"x" * 10, later)
+    assert cache.get("b") is None
+    assert cache.get("a") is not None and cache.get("c") is not None
+
+
+def test_sqlite_lease_is_exclusive_until_released_or_expired(tmp_path):
+    cache = SQLiteCache(str(tmp_path / "locks.db"))
+    assert cache.acquire("k", "one", 60)
+    assert not cache.acquire("k", "two", 60)
+    cache.release("k", "two")  # not the holder: no effect
+    assert not cache.acquire("k", "two", 60)
+    cache.release("k", "one")
+    assert cache.acquire("k", "two", 0.01)
+    time.sleep(0.02)
+    assert cache.acquire("k", "three", 60)
+
+
+def test_concurrent_misses_in_one_process_compute_once():
+    calls = []
+
+    def compute():
+        calls.append(1)
+        time.sleep(0.1)
+        return {"answer": 42}
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(get_or_compute("test", ("same",), compute, 60)))
+               for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(calls) == 1
+    assert results == [{"answer": 42}] * 5
+
+
+def test_miss_waits_for_the_instance_holding_the_lease(shared_cache, monkeypatch):
+    monkeypatch.setattr(cache_utils, "CACHE_LOCK_SECONDS", 5)
+    key = make_key("test", "leased")
+    assert shared_cache.acquire(key, "other-instance", 5)
+
+    def other_instance_finishes():
+        time.sleep(0.2)
+        shared_cache.set(key, cache_utils.pickle.dumps("theirs"), time.time() + 60)
+        shared_cache.release(key, "other-instance")
+
+    threading.Thread(target=other_instance_finishes).start()
+    assert get_or_compute("test", ("leased",), lambda: "ours", 60) == "theirs"
+
+
+def test_shared_tier_serves_another_process(shared_cache):
+    assert get_or_compute("test", (1,), lambda: [1, 2], 60) == [1, 2]
+    cache_utils._memory.clear()  # a fresh process: only the shared tier has it
+    assert get_or_compute("test", (1,), lambda: "recomputed", 60) == [1, 2]
+
+
+def test_fallback_values_are_cached_briefly(shared_cache):
+    assert get_or_compute("test", ("down",), lambda: Fallback([1], ttl=0.05), 3600) == [1]
+    assert get_or_compute("test", ("down",), lambda: "recomputed", 3600) == [1]
+    time.sleep(0.1)
+    assert get_or_compute("test", ("down",), lambda: "recomputed", 3600) == "recomputed"
+
+
+def test_news_served_while_newsapi_fails_expires_early(shared_cache, monkeypatch):
+    import news_utils_headless
+    from newsapi_client import NewsAPIError
+
+    def failing(*args, **kwargs):
+        raise NewsAPIError("API Error: rate limited", "rateLimited")
+
+    monkeypatch.setattr(news_utils_headless, "read_search", lambda *args: ["stored"])
+    monkeypatch.setattr(news_utils_headless, "ingest_search", failing)
+    assert news_utils_headless.fetch_keyword_news(("ai",), 10) == ["stored"]
+    _, expires_at = shared_cache.get(make_key("keyword_news", (("ai",), 10), ()))
+    assert expires_at <= time.time() + cache_utils.CACHE_FALLBACK_TTL_SECONDS
+
+    monkeypatch.setattr(news_utils_headless, "ingest_search", lambda *args: 0)
+    assert news_utils_headless.fetch_keyword_news(("ml",), 10) == ["stored"]
+    _, expires_at = shared_cache.get(make_key("keyword_news", (("ml",), 10), ()))
+    assert expires_at > time.time() + news_utils_headless.SEARCH_TTL_SECONDS - 60
@@ -0,0 +1,46 @@
+from dedup_utils import cluster_articles, dedupe_articles, minhash_signatures
+from conftest import news_article
+
+STORY = ("Central bank raises interest rates by half a point",
+         "The central bank raised its benchmark interest rate by 50 basis points on Tuesday, "
+         "citing persistent inflation and a strong labour market.")
+
+
+def article(source, title, description, published):
+    return news_article(title, published, source, description)
+
+
+def syndicated():
+    title, description = STORY
+    return [
+        article("Reuters", title, description, "2024-06-03T08:00:00Z"),
+        article("Daily", title + " - Daily", description, "2024-06-03T09:00:00Z"),
+        article("Herald", title, description.replace("Tuesday", "Tuesday morning"), "2024-06-03T07:30:00Z"),
+        article("Sports", "Local club wins the championship final",
+                "Fans celebrated late into the night after a dramatic penalty shootout.", "2024-06-03T10:00:00Z"),
+    ]
+
+
+def test_syndicated_copies_form_one_cluster():
+    clusters = cluster_articles(syndicated())
+    assert sorted(len(cluster.members) for cluster in clusters) == [1, 3]
+
+
+def test_earliest_copy_represents_the_cluster():
+    merged = dedupe_articles(syndicated())
+    assert [a["source"]["name"] for a in merged] == ["Herald", "Sports"]
+    assert merged[0]["duplicateCount"] == 3
+    assert merged[0]["duplicateSources"] == ["Daily", "Reuters"]
+    assert merged[1]["duplicateCount"] == 1 and merged[1]["duplicateSources"] == []
+
+
+def test_empty_articles_match_nothing():
+    empty = [article("A", "", "", "2024-06-03T08:00:00Z"), article("B", None, None, "2024-06-03T09:00:00Z")]
+    assert len(cluster_articles(empty)) == 2
+    assert cluster_articles([]) == []
+
+
+def test_signatures_are_deterministic():
+    articles = syndicated()
+    assert (minhash_signatures(articles) == minhash_signatures(articles)).all()
+    assert (minhash_signatures(articles[:1]) == minhash_signatures(articles)[:1]).all()
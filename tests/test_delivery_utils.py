@@ -0,0 +1,52 @@
+from sib_api_v3_sdk.rest import ApiException
+
+from delivery_utils import deliver
+from conftest import subscriber_rows
+
+
+class FakeBrevo:
+    def __init__(self, bad=(), busy=0):
+        self.bad = set(bad)
+        self.busy = busy
+        self.calls = []
+
+    def send_transac_email(self, batch):
+        self.calls.append([email for _, _, email in batch])
+        if self.busy:
+            self.busy -= 1
+            raise ApiException(status=429, reason="Too Many Requests")
+        if self.bad & {email for _, _, email in batch}:
+            raise ApiException(status=400, reason="Bad Request")
+
+
+def send(api, n, **kwargs):
+    options = {"workers": 2, "rate_per_second": 0, "batch_size": 4, "backoff_base": 0}
+    return deliver(api, subscriber_rows(n), lambda batch: batch, **{**options, **kwargs})
+
+
+def test_report_counts_sent_and_keeps_failed_addresses():
+    report = send(FakeBrevo(bad={"user5@example.com"}), 10)
+    assert report.sent == 9
+    assert list(report.failed) == ["user5@example.com"]
+    assert report.as_dict()["sent"] == 9 and report.as_dict()["failed"] == 1
+
+
+def test_rejected_batch_is_bisected_down_to_the_bad_address():
+    api = FakeBrevo(bad={"user1@example.com"})
+    report = send(api, 4, workers=1)
+    assert report.sent == 3
+    # [0-3] -> [0,1] + [2,3] -> [0] + [1]
+    assert sorted(map(len, api.calls)) == [1, 1, 2, 2, 4]
+    assert report.failed["user1@example.com"] == "HTTP 400: Bad Request"
+
+
+def test_rate_limited_batches_are_retried():
+    api = FakeBrevo(busy=2)
+    report = send(api, 4, workers=1)
+    assert (report.sent, report.retries, report.api_calls) == (4, 2, 3)
+
+
+def test_batch_completion_callback_sees_every_recipient():
+    seen = []
+    send(FakeBrevo(), 10, on_batch_complete=seen.extend)
+    assert sorted(recipient[0] for recipient, _ in seen) == list(range(1, 11))
@@ -0,0 +1,124 @@
+import contextlib
+
+import pytest
+
+import digest_jobs
+from digest_jobs import QUEUED, RUNNING, SUCCEEDED, FAILED
+from conftest import FakeCursor
+
+OPTIONS = {"digest_date": "2024-06-03", "max_recipients": 0, "time_budget_seconds": 30}
+
+
+@pytest.fixture
+def saved(monkeypatch):
+    calls = []
+
+    def save_progress(job_id, worker, status, sent, failed, elapsed, result=None, error=None):
+        calls.append((status, sent, failed, error))
+        return True
+
+    monkeypatch.setattr(digest_jobs, "_save_progress", save_progress)
+    return calls
+
+
+def slices(monkeypatch, *results):
+    budgets = []
+    remaining = list(results)
+
+    def run_digest(digest_date, shard, time_budget, max_recipients):
+        budgets.append((time_budget, max_recipients))
+        status, sent, failed = remaining.pop(0) if remaining else ("in_progress", 0, 0)
+        return {"status": status, "report": {"sent": sent, "failed": failed}}
+
+    monkeypatch.setattr(digest_jobs, "run_digest", run_digest)
+    return budgets
+
+
+def test_job_runs_slices_until_complete(monkeypatch, saved):
+    slices(monkeypatch, ("in_progress", 10, 1), ("in_progress", 10, 0), ("complete", 5, 0))
+    digest_jobs.run_job("w1", 1, OPTIONS)
+    assert [call[0] for call in saved] == [RUNNING, RUNNING, SUCCEEDED]
+    assert saved[-1][1:3] == (25, 1)
+
+
+def test_job_stops_at_max_recipients(monkeypatch, saved):
+    budgets = slices(monkeypatch, ("in_progress", 6, 0), ("in_progress", 4, 0))
+    digest_jobs.run_job("w1", 1, {**OPTIONS, "max_recipients": 10})
+    assert [max_recipients for _, max_recipients in budgets] == [10, 4]
+    assert saved[-1][:2] == (SUCCEEDED, 10)
+
+
+def test_idle_job_goes_back_to_the_queue(monkeypatch, saved):
+    slices(monkeypatch, ("in_progress", 3, 0))
+    digest_jobs.run_job("w1", 1, OPTIONS, attempts=1)
+    assert [call[0] for call in saved] == [RUNNING] * digest_jobs.JOB_MAX_IDLE_SLICES + [QUEUED]
+    assert saved[-1][1] == 3 and "consecutive slices" in saved[-1][3]
+
+
+def test_idle_job_fails_on_its_last_attempt(monkeypatch, saved):
+    slices(monkeypatch)
+    digest_jobs.run_job("w1", 1, OPTIONS, attempts=digest_jobs.JOB_MAX_ATTEMPTS)
+    assert saved[-1][0] == FAILED
+    assert len(saved) == digest_jobs.JOB_MAX_IDLE_SLICES
+
+
+def test_stored_budget_is_raised_to_the_minimum_slice(monkeypatch, saved):
+    budgets = slices(monkeypatch, ("complete", 0, 0))
+    digest_jobs.run_job("w1", 1, {**OPTIONS, "time_budget_seconds": 0.001})
+    assert budgets[0][0] == digest_jobs.JOB_MIN_SLICE_SECONDS
+
+
+def test_stored_budget_is_capped_below_the_stale_heartbeat(monkeypatch, saved):
+    budgets = slices(monkeypatch, ("complete", 0, 0))
+    digest_jobs.run_job("w1", 1, {**OPTIONS, "time_budget_seconds": 10 * digest_jobs.JOB_STALE_SECONDS})
+    assert budgets[0][0] == digest_jobs.JOB_MAX_SLICE_SECONDS < digest_jobs.JOB_STALE_SECONDS
+
+
+def test_worker_stops_once_the_job_is_taken_over(monkeypatch):
+    calls = []
+
+    def taken_over(*args, **kwargs):
+        calls.append(args)
+        return False
+
+    monkeypatch.setattr(digest_jobs, "_save_progress", taken_over)
+    slices(monkeypatch, ("in_progress", 5, 0), ("complete", 5, 0))
+    digest_jobs.run_job("w1", 1, OPTIONS)
+    assert len(calls) == 1
+
+
+def test_progress_is_only_saved_by_the_claiming_worker(monkeypatch):
+    cursor = FakeCursor()
+    monkeypatch.setattr(digest_jobs, "get_connection", cursor.connection)
+    assert digest_jobs._save_progress(7, "w1", RUNNING, 1, 0, 1.0) is False
+    query, params = cursor.executed[0]
+    assert "WHERE id = %s AND worker = %s" in query
+    assert params[-2:] == (7, "w1")
+
+    cursor.rows = [(7,)]
+    assert digest_jobs._save_progress(7, "w1", RUNNING, 1, 0, 1.0) is True
+
+
+def test_workers_are_woken_after_the_job_is_committed(monkeypatch):
+    cursor = FakeCursor([(42,)])
+    woken_before_commit = []
+
+    @contextlib.contextmanager
+    def connection():
+        with cursor.connection() as conn:
+            yield conn
+            woken_before_commit.append(not digest_jobs._wake.empty())
+
+    monkeypatch.setattr(digest_jobs, "get_connection", connection)
+    monkeypatch.setattr(digest_jobs, "ensure_schema", lambda: None)
+    assert digest_jobs.enqueue_digest_job("2024-06-03") == (42, True)
+    assert woken_before_commit == [False]
+    assert digest_jobs._wake.get_nowait() == 42
+
+
+@pytest.mark.parametrize("budget", [0, -5, 0.5, "nan", 10 ** 6])
+def test_send_digest_rejects_budgets_out_of_range(monkeypatch, budget):
+    import digest_sender
+    monkeypatch.setattr(digest_sender, "enqueue_digest_job", pytest.fail)
+    response = digest_sender.app.test_client().post("/send-digest", json={"time_budget_seconds": budget})
+    assert response.status_code == 400
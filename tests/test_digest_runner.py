@@ -0,0 +1,121 @@
+from datetime import datetime
+
+import pytest
+
+import digest_runner
+from digest_runner import Shard, shard_totals, group_key
+from conftest import FakeCursor, subscriber_rows
+
+
+def checkpoint(shard_key, sent=0, failed=0, elapsed=0.0, completed=False, minute=0):
+    return {
+        "shard_key": shard_key, "last_subscriber_id": 0, "sent_count": sent, "failed_count": failed,
+        "completed": completed, "elapsed_seconds": elapsed, "updated_at": datetime(2024, 6, 3, 6, minute),
+    }
+
+
+def test_group_rows_are_totalled_per_shard():
+    rows = [
+        checkpoint("mod:0/2", completed=True, minute=9),
+        checkpoint(group_key("mod:0/2", ()), sent=300, failed=2, elapsed=10.0, completed=True, minute=5),
+        checkpoint(group_key("mod:0/2", ("climate",)), sent=100, elapsed=10.0, completed=True, minute=8),
+        checkpoint(group_key("mod:1/2", ()), sent=50, failed=1, elapsed=5.0, minute=7),
+    ]
+    shards = shard_totals(rows)
+    assert [s["shard_key"] for s in shards] == ["mod:0/2", "mod:1/2"]
+    first, second = shards
+    assert (first["sent_count"], first["failed_count"], first["groups"]) == (400, 2, 2)
+    assert first["completed"] is True
+    assert first["throughput_per_second"] == 20.0
+    assert first["updated_at"] == "2024-06-03T06:09:00"
+    assert (second["sent_count"], second["completed"], second["throughput_per_second"]) == (50, False, 10.0)
+
+
+def test_shard_status_sums_shards_not_groups(monkeypatch):
+    rows = [
+        checkpoint(group_key("range:1-100", ()), sent=40, elapsed=4.0),
+        checkpoint(group_key("range:101-end", ()), sent=60, elapsed=3.0, completed=True),
+        checkpoint("range:101-end", completed=True),
+    ]
+    monkeypatch.setattr(digest_runner, "ensure_schema", lambda: None)
+    monkeypatch.setattr(digest_runner, "list_checkpoints", lambda digest_date: rows)
+    status = digest_runner.shard_status(datetime(2024, 6, 3).date())
+    assert len(status["shards"]) == 2
+    assert (status["sent"], status["completed"]) == (100, False)
+
+
+def test_shard_keys():
+    assert Shard().key == "all"
+    assert Shard(1, 4).key == "mod:1/4"
+    assert Shard(id_from=101).key == "range:101-end"
+    assert group_key("all", ()) == "all|headlines"
+    assert group_key("all", ("a", "b")).startswith("all|kw:")
+
+
+def test_shard_bounds_and_validation():
+    assert Shard(id_from=101, id_to=200)._bounds(0) == (100, None)
+    assert Shard(id_from=101)._bounds(150) == (150, None)
+    assert Shard(2, 4)._bounds(0) == (0, (2, 4))
+    with pytest.raises(ValueError):
+        Shard(4, 4)
+
+
+def test_plan_leaves_the_last_range_open(monkeypatch):
+    import db_utils_headless
+    cursor = FakeCursor([(1, 400, 300), (401, 900, 300), (901, 1200, 299)])
+    monkeypatch.setattr(db_utils_headless, "get_connection", cursor.connection)
+    monkeypatch.setattr(digest_runner, "ensure_schema", lambda: None)
+    ranges = digest_runner.plan_shards(3)
+    assert cursor.executed[0][1] == (3,)
+    assert [(r["id_from"], r["id_to"]) for r in ranges] == [(1, 400), (401, 900), (901, None)]
+    assert sum(r["subscribers"] for r in ranges) == 899
+    assert [Shard(id_from=r["id_from"], id_to=r["id_to"]).key for r in ranges] == [
+        "range:1-400", "range:401-900", "range:901-end"
+    ]
+
+
+DAY = datetime(2024, 6, 3).date()
+
+
+def test_resumed_run_continues_from_the_checkpoint(digest):
+    db, sender = digest(subscriber_rows(5, ()))
+    first = digest_runner.run_digest(DAY, max_recipients=2)
+    assert first["status"] == "in_progress" and first["report"]["sent"] == 2
+    assert db.get_checkpoint(DAY, "all|headlines")["last_subscriber_id"] == 2
+
+    second = digest_runner.run_digest(DAY)
+    assert second["status"] == "complete" and second["report"]["sent"] == 3
+    assert [sid for sid, _ in sender.deliveries] == [1, 2, 3, 4, 5]
+    group = db.get_checkpoint(DAY, "all|headlines")
+    assert (group["sent_count"], group["failed_count"], group["completed"]) == (5, 0, True)
+    assert digest_runner.run_digest(DAY)["checkpoint"]["completed"] is True
+
+
+def test_subscribers_already_sent_are_skipped(digest):
+    db, sender = digest(subscriber_rows(4, ()))
+    db.record_deliveries(DAY, [((3, "user3", "user3@example.com"), None)])
+    digest_runner.run_digest(DAY)
+    assert [sid for sid, _ in sender.deliveries] == [1, 2, 4]
+
+
+def test_failed_recipients_are_retried_before_the_group_completes(digest):
+    db, sender = digest(subscriber_rows(4, ()) + subscriber_rows(6, ("climate",))[4:], failures={2: 1, 5: 1})
+    result = digest_runner.run_digest(DAY)
+    assert result["status"] == "complete"
+    assert [sid for sid, error in sender.deliveries if error] == [2, 5]
+    assert sorted(sid for sid, error in sender.deliveries if error is None) == [1, 2, 3, 4, 5, 6]
+    status = digest_runner.shard_status(DAY)
+    assert (status["sent"], status["failed"], status["completed"]) == (6, 0, True)
+
+
+def test_permanent_failures_stop_at_the_attempt_limit(digest):
+    from db_utils_headless import DIGEST_MAX_ATTEMPTS
+    db, sender = digest(subscriber_rows(3, ()), failures={2: -1})
+    result = digest_runner.run_digest(DAY)
+    assert result["status"] == "complete"
+    assert [sid for sid, _ in sender.deliveries].count(2) == DIGEST_MAX_ATTEMPTS
+    assert db.log[DAY, 2] == ("failed", DIGEST_MAX_ATTEMPTS)
+    group = db.get_checkpoint(DAY, "all|headlines")
+    assert (group["sent_count"], group["failed_count"]) == (2, 1)
+    # Nobody is left waiting, so a job's `remaining` drops to zero
+    assert digest_runner.Shard().groups(DAY) == []
@@ -0,0 +1,39 @@
+import io
+import gzip
+
+import pandas as pd
+import pyarrow.parquet as pq
+import pytest
+
+from export_utils import CSV_GZ, PARQUET, EXPORT_COLUMNS, export_bytes, export_filename
+from conftest import analysis_frame
+
+
+def test_gzip_csv_round_trips_across_chunks():
+    df = analysis_frame(7).assign(Extra="not exported")
+    data = export_bytes(df, CSV_GZ, chunk_rows=3)
+    back = pd.read_csv(io.BytesIO(gzip.decompress(data)))
+    assert list(back.columns) == EXPORT_COLUMNS
+    assert back["Title"].tolist() == df["Title"].tolist()
+    assert back["Sentiment"].tolist() == df["Sentiment"].tolist()
+    assert back["Topic"].isna().sum() == 3
+
+
+def test_parquet_round_trips_with_a_fixed_schema():
+    df = analysis_frame(7)
+    # A chunk whose Topic column is all missing must still match the other row groups
+    data = export_bytes(df, PARQUET, chunk_rows=1)
+    table = pq.read_table(io.BytesIO(data))
+    assert table.num_rows == 7 and pq.ParquetFile(io.BytesIO(data)).num_row_groups == 7
+    assert str(table.schema.field("Topic").type) == "int64"
+    assert str(table.schema.field("Date").type) == "date32[day]"
+    back = table.to_pandas()
+    assert back["URL"].tolist() == df["URL"].tolist()
+    assert back["Topic"].isna().sum() == 3
+
+
+def test_unknown_format_and_filenames():
+    with pytest.raises(ValueError):
+        export_bytes(analysis_frame(1), "xlsx")
+    assert export_filename("Climate / Energy!", CSV_GZ) == "news_analysis_Climate_Energy.csv.gz"
+    assert export_filename("???", PARQUET) == "news_analysis_analysis.parquet"
@@ -0,0 +1,96 @@
+import pytest
+
+import metrics_utils
+from metrics_utils import (
+    observe, count, cache_lookup, timed, trace, render_prometheus, stage_summary, cache_summary, LATENCY_BUCKETS
+)
+
+
+@pytest.fixture(autouse=True)
+def fresh_metrics():
+    metrics_utils.reset_metrics()
+    yield
+    metrics_utils.reset_metrics()
+
+
+def samples(text):
+    return dict(line.rsplit(" ", 1) for line in text.splitlines() if line and not line.startswith("#"))
+
+
+def test_histogram_buckets_are_cumulative():
+    for seconds in (0.003, 0.2, 0.2, 45.0, 120.0):
+        observe("fetch", seconds)
+    text = render_prometheus()
+    assert "# TYPE trendytracker_stage_seconds histogram" in text
+    values = samples(text)
+    bucket = 'trendytracker_stage_seconds_bucket{stage="fetch",le="%s"}'
+    assert values[bucket % "0.005"] == "1"
+    assert values[bucket % "0.1"] == "1"
+    assert values[bucket % "0.25"] == "3"
+    assert values[bucket % "60.0"] == "4"
+    assert values[bucket % "+Inf"] == "5"
+    assert values['trendytracker_stage_seconds_count{stage="fetch"}'] == "5"
+    assert float(values['trendytracker_stage_seconds_sum{stage="fetch"}']) == pytest.approx(165.403)
+    assert sum(1 for line in text.splitlines() if line.startswith("trendytracker_stage_seconds_bucket")) == \
+        len(LATENCY_BUCKETS) + 1
+
+
+def test_counters_gauges_and_label_escaping():
+    count("emails_total", 3, status="sent")
+    count("emails_total", status="failed")
+    count("newsapi_requests_total", code='4"2\\9\n')
+    text = render_prometheus({"db_pool_in_use": 2, "db_pool_wait_seconds": 0.5})
+    assert "# HELP trendytracker_emails_total Emails handed to Brevo by outcome (sent or failed)." in text
+    assert "# TYPE trendytracker_emails_total counter" in text
+    values = samples(text)
+    assert values['trendytracker_emails_total{status="sent"}'] == "3"
+    assert values['trendytracker_emails_total{status="failed"}'] == "1"
+    assert values['trendytracker_newsapi_requests_total{code="4\\"2\\\\9\\n"}'] == "1"
+    assert "# TYPE trendytracker_db_pool_in_use gauge" in text
+    assert values["trendytracker_db_pool_in_use"] == "2"
+    assert values["trendytracker_db_pool_wait_seconds"] == "0.5"
+    assert text.endswith("\n")
+
+
+def test_timed_records_calls_and_errors():
+    @timed("sentiment")
+    def score(fail=False):
+        if fail:
+            raise RuntimeError("boom")
+        return "ok"
+
+    assert score() == "ok"
+    with pytest.raises(RuntimeError):
+        score(fail=True)
+    with timed("sentiment"):
+        pass
+    (row,) = stage_summary()
+    assert row["stage"] == "sentiment" and row["calls"] == 3
+    assert samples(render_prometheus())['trendytracker_stage_errors_total{stage="sentiment"}'] == "1"
+
+
+def test_trace_collects_only_the_enclosed_stages():
+    observe("fetch", 1.0)
+    with trace() as spans:
+        observe("fetch", 0.25)
+        observe("fetch", 0.25)
+        with timed("lda"):
+            pass
+    observe("lda", 1.0)
+    assert spans["fetch"] == [2, 0.5]
+    assert spans["lda"][0] == 1
+
+
+def test_cache_hit_rates_and_quantiles():
+    cache_lookup("news", hits=3, misses=1)
+    cache_lookup("images", misses=2)
+    assert cache_summary() == {
+        "images": {"hits": 0, "misses": 2, "hit_rate": 0.0},
+        "news": {"hits": 3, "misses": 1, "hit_rate": 0.75},
+    }
+    for _ in range(10):
+        observe("db", 0.03)
+    (row,) = stage_summary()
+    # Interpolated inside the (0.025, 0.05] bucket, capped at the largest value seen
+    assert 0.025 < row["p50_seconds"] <= 0.03
+    assert row["max_seconds"] == 0.03
@@ -0,0 +1,56 @@
+import time
+from datetime import datetime
+
+import pytest
+
+from newsapi_client import _date_slices, iter_everything
+from rate_limit import RateLimiter
+from conftest import make_articles
+
+
+def test_date_slices_are_day_windows_newest_first():
+    assert _date_slices("2024-06-01", "2024-06-03T12:00:00") == [
+        ("2024-06-03T00:00:00", "2024-06-03T12:00:00"),
+        ("2024-06-02T00:00:00", "2024-06-03T00:00:00"),
+        ("2024-06-01T00:00:00", "2024-06-02T00:00:00"),
+    ]
+
+
+def test_date_slices_edge_cases():
+    assert _date_slices("2024-06-03", "2024-06-03") == [("2024-06-03T00:00:00", "2024-06-03T00:00:00")]
+    assert _date_slices("2024-06-03", "2024-06-01") == []
+    assert _date_slices("2024-06-01T18:00:00Z", "2024-06-02T06:00:00Z") == [
+        ("2024-06-02T00:00:00", "2024-06-02T06:00:00"),
+        ("2024-06-01T18:00:00", "2024-06-02T00:00:00"),
+    ]
+
+
+@pytest.mark.parametrize("budget", [30, 250])
+def test_iter_everything_stays_within_budget_without_duplicates(store, fake_newsapi, budget):
+    end = datetime(2024, 6, 10, 12)
+    fake_newsapi(make_articles("india", end, days=5, per_day=40))
+    completed = set()
+    urls = [a["url"] for page in iter_everything("india", "2024-06-06", end, budget, completed=completed)
+            for a in page]
+    assert len(urls) == len(set(urls)) == min(budget, 200)
+    # Only windows whose every page was taken count as complete
+    assert len(completed) == (0 if budget < 200 else len(_date_slices("2024-06-06", end)))
+
+
+def test_rate_limiter_allows_a_burst_then_paces_calls():
+    limiter = RateLimiter(20)
+    started = time.monotonic()
+    for _ in range(20):
+        limiter.acquire()
+    assert time.monotonic() - started < 0.2
+    for _ in range(10):
+        limiter.acquire()
+    assert 0.4 <= time.monotonic() - started < 2
+
+
+def test_rate_limiter_with_no_rate_never_waits():
+    limiter = RateLimiter(0)
+    started = time.monotonic()
+    for _ in range(1000):
+        limiter.acquire()
+    assert time.monotonic() - started < 0.2
@@ -0,0 +1,30 @@
+import email_utils
+import outbox_utils
+from subscriber_io import CONFIRMATION_EMAIL
+
+
+def fake_outbox(monkeypatch, rows):
+    calls = {"released": [], "completed": []}
+    batches = [rows]
+    monkeypatch.setattr(outbox_utils, "ensure_schema", lambda: None)
+    monkeypatch.setattr(outbox_utils, "claim_outbox", lambda limit: batches.pop(0) if batches else [])
+    monkeypatch.setattr(outbox_utils, "complete_outbox", calls["completed"].extend)
+    monkeypatch.setattr(outbox_utils, "release_outbox", lambda ids, error: calls["released"].append((ids, error)))
+    return calls
+
+
+def test_missing_api_key_releases_claims_without_using_attempts(monkeypatch):
+    monkeypatch.setattr(email_utils, "BREVO_API_KEY", None)
+    calls = fake_outbox(monkeypatch, [(7, CONFIRMATION_EMAIL, "Ann", "ann@example.com", 1),
+                                      (8, CONFIRMATION_EMAIL, "Bo", "bo@example.com", 1)])
+    totals = outbox_utils.drain_outbox()
+    assert totals["error"] == "BREVO_API_KEY is not set."
+    assert calls["released"] == [([7, 8], "BREVO_API_KEY is not set.")]
+    assert calls["completed"] == []
+
+
+def test_unknown_kinds_fail_through_the_normal_path(monkeypatch):
+    monkeypatch.setattr(email_utils, "BREVO_API_KEY", None)
+    calls = fake_outbox(monkeypatch, [(9, "newsletter", "Cy", "cy@example.com", 1)])
+    outbox_utils.drain_outbox()
+    assert calls["completed"] == [((9, "Cy", "cy@example.com"), "Unknown outbox kind: newsletter")]
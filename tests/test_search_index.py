@@ -0,0 +1,72 @@
+from conftest import news_article
+
+ARTICLES = [
+    news_article("Bank of England holds interest rates", "2024-06-03T09:00:00Z",
+                 description="The Bank of England kept rates unchanged."),
+    news_article("Rates of interest climb at the bank", "2024-06-04T09:00:00Z",
+                 description="Lenders raise what they charge."),
+    news_article("Inflation cools in the euro area", "2024-06-05T09:00:00Z",
+                 description="Prices rose less than expected, Eurostat said."),
+    news_article("Heatwave grips India", "2024-06-06T09:00:00Z", source="Other",
+                 description="Temperatures in Delhi pass 45C."),
+]
+
+
+def titles(articles):
+    return [a["title"] for a in articles]
+
+
+def indexed(store):
+    store.store_articles("top-headlines", ARTICLES)
+    return store
+
+
+def test_every_word_must_appear(store):
+    indexed(store)
+    assert titles(store.search_index("interest rates")) == [
+        "Rates of interest climb at the bank", "Bank of England holds interest rates",
+    ]
+
+
+def test_exact_match_and_quotes_require_the_phrase(store):
+    indexed(store)
+    assert titles(store.search_index("interest rates", exact_match=True)) == ["Bank of England holds interest rates"]
+    assert titles(store.search_index('"interest rates"')) == ["Bank of England holds interest rates"]
+    # The title and description are indexed apart, so a phrase never spans the two
+    assert store.search_index("rates the", exact_match=True) == []
+
+
+def test_or_queries_match_either_side(store):
+    indexed(store)
+    # fetch_keyword_news builds its query this way; "OR" itself is never a search word
+    query = '"interest rates" OR inflation'
+    assert titles(store.search_index(query)) == [
+        "Inflation cools in the euro area", "Bank of England holds interest rates",
+    ]
+    assert titles(store.read_search(query, "2024-06-01", "2024-06-30", 10)) == [
+        "Inflation cools in the euro area", "Bank of England holds interest rates",
+    ]
+    assert titles(store.search_index("(inflation OR heatwave) AND india")) == ["Heatwave grips India"]
+
+
+def test_excluded_words_and_phrases(store):
+    indexed(store)
+    assert titles(store.search_index("rates -england")) == ["Rates of interest climb at the bank"]
+    assert titles(store.search_index('bank NOT "bank of england"')) == ["Rates of interest climb at the bank"]
+
+
+def test_date_range_is_inclusive(store):
+    indexed(store)
+    assert titles(store.search_index("interest", "2024-06-04", "2024-06-04")) == [
+        "Rates of interest climb at the bank",
+    ]
+    assert store.search_index("india", to_date="2024-06-05") == []
+
+
+def test_entities_are_counted_and_filter_a_search(store):
+    indexed(store)
+    # Mentions count articles, so the title and description naming the bank count once
+    assert ("Bank of England", 1) in store.top_entities()
+    assert titles(store.search_index("rates", entity="Bank of England")) == ["Bank of England holds interest rates"]
+    assert titles(store.search_index("", entity="Eurostat")) == ["Inflation cools in the euro area"]
+    assert store.top_entities(from_date="2024-06-06") == [("Delhi", 1), ("Heatwave", 1), ("India", 1), ("Temperatures", 1)]
@@ -0,0 +1,29 @@
+import sentiment_utils
+from sentiment_utils import score_texts, label_sentiment, VADER, TEXTBLOB
+
+
+def test_scores_follow_input_order_and_repeat_from_cache():
+    texts = ["I love this wonderful day", "This is a terrible, awful mess", None, "I love this wonderful day"]
+    first = score_texts(texts)
+    assert first[0] > 0.1 > -0.1 > first[1]
+    assert first[2] == 0.0 and first[3] == first[0]
+    assert score_texts(texts) == first
+    assert [label_sentiment(score) for score in first] == ["Positive", "Negative", "Neutral", "Positive"]
+
+
+def test_methods_are_cached_separately():
+    assert score_texts(["great"], method=TEXTBLOB) != score_texts(["great"], method=VADER)
+
+
+def test_parallel_scoring_matches_a_single_process(monkeypatch, caplog):
+    monkeypatch.setattr(sentiment_utils, "SENTIMENT_PARALLEL_THRESHOLD", 4)
+    monkeypatch.setattr(sentiment_utils, "SENTIMENT_WORKERS", 2)
+    monkeypatch.setattr(sentiment_utils, "_pool", None)
+    texts = [f"headline {i} is {'good' if i % 2 else 'bad'}" for i in range(16)]
+    try:
+        parallel = sentiment_utils._score_uncached(VADER, texts, workers=2)
+        assert sentiment_utils._pool._mp_context.get_start_method() == "spawn"
+    finally:
+        sentiment_utils._pool.shutdown()
+    assert "falling back" not in caplog.text
+    assert parallel == sentiment_utils._score_chunk(VADER, texts)
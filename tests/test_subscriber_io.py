@@ -0,0 +1,67 @@
+import io
+
+import subscriber_io
+from conftest import FakeCursor
+
+
+def test_keywords_are_normalized_into_one_group_key():
+    assert subscriber_io.normalize_keywords("  Climate Change, AI,ai ,, ") == ["ai", "climate change"]
+    assert subscriber_io.normalize_keywords(["b", "a", "c", "d", "e", "f"]) == ["a", "b", "c", "d", "e"]
+    assert subscriber_io.normalize_keywords(["x" * 80]) == ["x" * subscriber_io.MAX_KEYWORD_LENGTH]
+    assert subscriber_io.normalize_keywords(None) == []
+
+
+def test_csv_header_aliases_are_recognised():
+    stats = {}
+    rows = list(subscriber_io.read_subscriber_csv(io.StringIO(
+        "Full Name,E-mail Address,Signed Up\n"
+        "Ada Lovelace, ada@example.com ,2024-01-01\n"
+        ",grace@example.com,2024-01-02\n"
+        "Nobody,not-an-email,2024-01-03\n"
+    ), stats))
+    assert rows == [("Ada Lovelace", "ada@example.com"), ("grace", "grace@example.com")]
+    assert stats == {"invalid": 1}
+
+
+def test_exact_header_wins_over_a_partial_match():
+    rows = list(subscriber_io.read_subscriber_csv(io.StringIO("email_verified,Email,Name\nyes,a@example.com,A\n")))
+    assert rows == [("A", "a@example.com")]
+
+
+def test_csv_without_an_email_column_is_rejected():
+    try:
+        list(subscriber_io.read_subscriber_csv(io.StringIO("name\nAda\n")))
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("expected a ValueError")
+
+
+def test_bulk_upsert_counts_existing_emails_as_skipped(monkeypatch):
+    existing = {"b@example.com"}
+    statements = []
+
+    def execute_values(cur, query, batch, page_size=None, fetch=False):
+        statements.append(batch)
+        return [(i,) for i, (_, email) in enumerate(batch) if email not in existing]
+
+    monkeypatch.setattr(subscriber_io, "get_connection", FakeCursor().connection)
+    monkeypatch.setattr(subscriber_io, "execute_values", execute_values)
+    rows = [(name, f"{name}@example.com") for name in "abcde"]
+    assert subscriber_io.bulk_upsert_subscribers(iter(rows), batch_size=2) == {"inserted": 4, "skipped": 1}
+    # One statement per batch, the last one short
+    assert [len(batch) for batch in statements] == [2, 2, 1]
+
+
+def test_signup_reactivates_an_unsubscribed_email(monkeypatch):
+    # The upsert returns the row when it inserted or reactivated the subscriber
+    returned = FakeCursor([(7,)])
+    monkeypatch.setattr(subscriber_io, "get_connection", returned.connection)
+    assert subscriber_io.upsert_subscriber("Ada", "ada@example.com", "Space, AI") is True
+    query, params = returned.executed[0]
+    assert "active = TRUE" in query and "WHERE NOT subscribers.active" in query
+    assert params == ("Ada", "ada@example.com", ["ai", "space"], subscriber_io.CONFIRMATION_EMAIL)
+
+    # An active subscriber is left alone and nothing is returned
+    monkeypatch.setattr(subscriber_io, "get_connection", FakeCursor().connection)
+    assert subscriber_io.upsert_subscriber("Ada", "ada@example.com") is False
@@ -0,0 +1,30 @@
+import template_utils
+from template_utils import CompiledTemplate, SafeHtml, get_template
+
+
+def test_render_escapes_values_unless_marked_safe():
+    template = CompiledTemplate.compile("<p>{{ name }}</p>{{body}}")
+    assert template.fields == {"name", "body"}
+    assert template.render(name="<Ann & Bo>", body=SafeHtml("<b>hi</b>")) == "<p>&lt;Ann &amp; Bo&gt;</p><b>hi</b>"
+
+
+def test_missing_fields_are_left_for_brevo():
+    template = CompiledTemplate.compile("Hi {{ params.name }}, {{ title }}")
+    assert template.render(title="news") == "Hi {{ params.name }}, news"
+
+
+def test_partial_bakes_in_shared_fields():
+    template = CompiledTemplate.compile("<h1>{{ title }}</h1><p>{{ name }}</p><footer>{{ title }}</footer>")
+    shared = template.partial(title="Daily <Digest>")
+    assert shared.fields == {"name"}
+    assert shared.render(name="Ann") == "<h1>Daily &lt;Digest&gt;</h1><p>Ann</p><footer>Daily &lt;Digest&gt;</footer>"
+    assert shared.render(name="Ann") == template.render(title="Daily <Digest>", name="Ann")
+
+
+def test_templates_are_compiled_once(tmp_path, monkeypatch):
+    monkeypatch.setattr(template_utils, "TEMPLATE_DIR", str(tmp_path))
+    monkeypatch.setattr(template_utils, "_cache", {})
+    (tmp_path / "t.html").write_text("{{ x }}", encoding="utf-8")
+    first = get_template("t.html")
+    (tmp_path / "t.html").write_text("changed", encoding="utf-8")
+    assert get_template("t.html") is first
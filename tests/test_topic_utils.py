@@ -0,0 +1,41 @@
+import threading
+
+import topic_utils
+from topic_utils import extract_topics
+
+TEXTS = [
+    "stocks rally as markets cheer interest rate cut",
+    "markets slide while stocks react to interest rate fears",
+    "football club wins league title after dramatic match",
+    "league match ends with football fans celebrating title",
+    "new vaccine trial shows promising health results",
+    "health officials praise vaccine trial results",
+]
+
+
+def test_repeated_view_is_served_from_the_result_cache():
+    first = extract_topics(TEXTS, "cache-test", n_topics=2)
+    assert len(first.topics) == 2 and len(first.assignments) == len(TEXTS)
+    assert extract_topics(TEXTS, "cache-test", n_topics=2) is first
+
+
+def test_fitting_one_corpus_does_not_block_another(monkeypatch):
+    started, release = threading.Event(), threading.Event()
+    update = topic_utils._TopicModel.update
+
+    def slow_update(self, texts, keys):
+        if texts[0].startswith("slow"):
+            started.set()
+            assert release.wait(10)
+        update(self, texts, keys)
+
+    monkeypatch.setattr(topic_utils._TopicModel, "update", slow_update)
+    slow = threading.Thread(target=extract_topics, args=(["slow " + text for text in TEXTS], "slow-corpus", 2))
+    slow.start()
+    try:
+        assert started.wait(10)
+        assert len(extract_topics(TEXTS, "fast-corpus", n_topics=2).topics) == 2
+        assert slow.is_alive()
+    finally:
+        release.set()
+        slow.join()
@@ -0,0 +1,51 @@
+from conftest import news_article
+
+FEED = "search:test"
+
+
+def stored(store, *published, source="Wire"):
+    store.store_articles(FEED, [
+        news_article(f"Story {i}", when, source, "A wonderful, happy result." if i % 2 else "A terrible loss.")
+        for i, when in enumerate(published)
+    ])
+
+
+def test_buckets_split_at_hour_day_and_week_boundaries(store):
+    # Sunday 23:59 and Monday 00:01 fall in different hours, days and ISO weeks
+    stored(store, "2024-06-02T23:59:00Z", "2024-06-03T00:01:00Z", "2024-06-03T00:30:00Z")
+    hours = store.read_trend(FEED, "2024-06-02", "2024-06-03", store.HOUR)
+    assert [(bucket, count) for bucket, count, _ in hours] == [("2024-06-02T23:00", 1), ("2024-06-03T00:00", 2)]
+    days = store.read_trend(FEED, "2024-06-02", "2024-06-03", store.DAY)
+    assert [(bucket, count) for bucket, count, _ in days] == [("2024-06-02", 1), ("2024-06-03", 2)]
+    # A range starting mid-week still includes that week's bucket
+    weeks = store.read_trend(FEED, "2024-05-29", "2024-06-09", store.WEEK)
+    assert [(bucket, count) for bucket, count, _ in weeks] == [("2024-05-27", 1), ("2024-06-03", 2)]
+
+
+def test_mean_sentiment_and_sources(store):
+    stored(store, "2024-06-03T08:00:00Z", "2024-06-03T09:00:00Z")
+    stored(store, "2024-06-03T10:00:00Z", source="Other")
+    ((_, count, mean),) = store.read_trend(FEED, "2024-06-03", "2024-06-03", store.DAY)
+    assert count == 3 and mean < 0
+    by_source = store.read_trend(FEED, "2024-06-03", "2024-06-03", store.DAY, by_source=True)
+    assert [(source, count) for _, source, count, _ in by_source] == [("Other", 1), ("Wire", 2)]
+
+
+def test_articles_seen_again_are_not_counted_twice(store):
+    stored(store, "2024-06-03T08:00:00Z")
+    stored(store, "2024-06-03T08:00:00Z")
+    assert store.read_trend(FEED, "2024-06-03", "2024-06-03", store.DAY)[0][1] == 1
+
+
+def test_rebuild_matches_the_incremental_rollups(store):
+    stored(store, "2024-06-01T08:00:00Z", "2024-06-02T09:00:00Z", "2024-06-03T10:00:00Z")
+    before = store.read_trend(FEED, "2024-06-01", "2024-06-03", store.HOUR)
+    store.rebuild_trends(FEED)
+    assert store.read_trend(FEED, "2024-06-01", "2024-06-03", store.HOUR) == before
+
+
+def test_granularity_follows_the_range(store):
+    assert store.pick_granularity("2024-06-01", "2024-06-04") == store.HOUR
+    assert store.pick_granularity("2024-06-01", "2024-06-05") == store.DAY
+    assert store.pick_granularity("2024-01-01", "2024-04-30") == store.DAY
+    assert store.pick_granularity("2024-01-01", "2024-05-01") == store.WEEK
@@ -0,0 +1,118 @@
+import os
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import List, NamedTuple, Optional
+from metrics_utils import timed, cache_lookup
+
+# LDA topic modeling that survives Streamlit reruns.
+# One vectorizer + online LDA model is kept per (corpus, number of topics). New
+# articles update it with partial_fit instead of refitting from scratch, and a
+# result cache answers a repeated view of the same article set without touching the model.
+TOPIC_MODEL_CACHE_SIZE = int(os.getenv("TOPIC_MODEL_CACHE_SIZE", "16"))
+TOPIC_RESULT_CACHE_SIZE = int(os.getenv("TOPIC_RESULT_CACHE_SIZE", "64"))
+# Refit when more than this share of the new articles' tokens is outside the vocabulary
+TOPIC_REFIT_OOV_RATIO = float(os.getenv("TOPIC_REFIT_OOV_RATIO", "0.5"))
+
+class TopicResult(NamedTuple):
+    topics: List[List[str]]
+    # Dominant topic index per input text, or None when a text has no known words
+    assignments: List[Optional[int]]
+
+class _TopicModel:
+    def __init__(self, n_topics: int):
+        self.n_topics = n_topics
+        self.vectorizer = None
+        self.lda = None
+        self.seen = set()
+        # Held while this model is fitted or read, so one corpus does not block the others
+        self.lock = threading.Lock()
+
+    def fit(self, texts: List[str], keys: List[bytes]):
+        from sklearn.feature_extraction.text import CountVectorizer
+        from sklearn.decomposition import LatentDirichletAllocation
+        vectorizer = CountVectorizer(max_df=0.9, min_df=2, stop_words='english')
+        dtm = vectorizer.fit_transform(texts)
+        if dtm.shape[0] == 0 or dtm.shape[1] == 0:
+            raise ValueError("Not enough content to perform topic modeling.")
+        lda = LatentDirichletAllocation(n_components=self.n_topics, learning_method="online", random_state=42)
+        lda.fit(dtm)
+        self.vectorizer, self.lda, self.seen = vectorizer, lda, set(keys)
+
+    def _oov_ratio(self, texts: List[str]) -> float:
+        analyzer = self.vectorizer.build_analyzer()
+        vocabulary = self.vectorizer.vocabulary_
+        total = unknown = 0
+        for text in texts:
+            for token in analyzer(text):
+                total += 1
+                unknown += token not in vocabulary
+        return unknown / total if total else 0.0
+
+    def update(self, texts: List[str], keys: List[bytes]):
+        if self.lda is None:
+            self.fit(texts, keys)
+            return
+        new = [(text, key) for text, key in zip(texts, keys) if key not in self.seen]
+        if not new:
+            return
+        new_texts = [text for text, _ in new]
+        if self._oov_ratio(new_texts) > TOPIC_REFIT_OOV_RATIO:
+            self.fit(texts, keys)
+            return
+        self.lda.partial_fit(self.vectorizer.transform(new_texts))
+        self.seen.update(key for _, key in new)
+
+    def describe(self, texts: List[str], top_words: int) -> TopicResult:
+        vocab = self.vectorizer.get_feature_names_out()
+        topics = [[vocab[i] for i in topic.argsort()[-top_words:]] for topic in self.lda.components_]
+        dtm = self.vectorizer.transform(texts)
+        weights = self.lda.transform(dtm)
+        has_words = dtm.getnnz(axis=1) > 0
+        assignments = [int(row.argmax()) if known else None for row, known in zip(weights, has_words)]
+        return TopicResult(topics, assignments)
+
+_models = OrderedDict()
+_results = OrderedDict()
+_lock = threading.Lock()
+
+def _text_key(text: str) -> bytes:
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+
+def _remember(cache: OrderedDict, key, value, limit: int):
+    cache[key] = value
+    cache.move_to_end(key)
+    while len(cache) > limit:
+        cache.popitem(last=False)
+
+# Topics for `texts`, using the model cached under `corpus_key` (e.g. the search query).
+# Raises ValueError when there is not enough content, like the sklearn estimators do.
+def extract_topics(texts, corpus_key: str, n_topics: int = 3, top_words: int = 5) -> TopicResult:
+    texts = ["" if text is None else str(text) for text in texts]
+    keys = [_text_key(text) for text in texts]
+    digest = hashlib.blake2b(b"".join(keys), digest_size=16).digest()
+    result_key = (corpus_key, n_topics, top_words, digest)
+    # The shared lock only guards the two caches; fitting happens under the model's own lock
+    with _lock:
+        result = _results.get(result_key)
+        if result is not None:
+            _results.move_to_end(result_key)
+            cache_lookup("topic_results", hits=1)
+            return result
+        cache_lookup("topic_results", misses=1)
+        model = _models.get((corpus_key, n_topics))
+        cache_lookup("topic_models", hits=int(model is not None), misses=int(model is None))
+        if model is None:
+            model = _TopicModel(n_topics)
+        _remember(_models, (corpus_key, n_topics), model, TOPIC_MODEL_CACHE_SIZE)
+    with model.lock:
+        # Another caller may have answered the same view while this one waited
+        with _lock:
+            result = _results.get(result_key)
+        if result is None:
+            with timed("lda"):
+                model.update(texts, keys)
+                result = model.describe(texts, top_words)
+    with _lock:
+        _remember(_results, result_key, result, TOPIC_RESULT_CACHE_SIZE)
+    return result